@@ -0,0 +1,83 @@
+"""
+Memory benchmark: resident size of tokens and AST nodes for a large script
+
+Generates a story-like script, then measures with tracemalloc how much
+memory the token list and the parsed AST hold while they are alive.
+
+Usage: python benchmarks/ast_memory.py [scenes]
+"""
+
+import os
+import sys
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'core'))
+
+from lexer import Lexer
+from parser import Parser, ASTNode
+
+SCENE = '''label: scene{n}
+say "Scene {n}: the corridor splits in two."
+set visits to visits + 1
+set gold to gold + {n} % 7 * 2
+if gold > 100 and not has_key then
+  say "You could buy the key for " + (gold - 100) + " gold."
+else
+  say "You have " + gold + " gold."
+end
+function bonus{n}(amount)
+  return amount * 2 + len(inventory)
+end
+for item in ["torch", "rope", "map"] do
+  inventory[0] = item
+end
+choice "Go left" or "Go right"
+'''
+
+
+def generate(scenes):
+    header = 'set visits to 0\nset gold to 0\nset has_key to false\nset inventory to ["nothing"]\n'
+    return header + ''.join(SCENE.format(n=n) for n in range(scenes))
+
+
+def count_nodes(value):
+    """Count AST nodes reachable from value (a node or a list of nodes)"""
+    if isinstance(value, list):
+        return sum(count_nodes(item) for item in value)
+    if not isinstance(value, ASTNode):
+        return 0
+    fields = getattr(value, '__dict__', None)
+    if fields is None:
+        fields = {name: getattr(value, name, None)
+                  for cls in type(value).__mro__ for name in getattr(cls, '__slots__', ())}
+    return 1 + sum(count_nodes(child) for child in fields.values())
+
+
+def measure(build):
+    """Return (result, bytes still allocated by build once it returns)"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, after - before
+
+
+def main():
+    scenes = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    source = generate(scenes)
+    print(f"Script: {scenes} scenes, {source.count(chr(10)):,} lines")
+
+    tokens, token_bytes = measure(lambda: Lexer(source).tokenize())
+    print(f"  tokens: {len(tokens):>9,}  {token_bytes / 2**20:8.1f} MiB"
+          f"  ({token_bytes / len(tokens):.0f} bytes each)")
+
+    ast, ast_bytes = measure(lambda: Parser(tokens, source).parse())
+    nodes = count_nodes(ast)
+    print(f"  nodes:  {nodes:>9,}  {ast_bytes / 2**20:8.1f} MiB"
+          f"  ({ast_bytes / nodes:.0f} bytes each)")
+
+
+if __name__ == '__main__':
+    main()
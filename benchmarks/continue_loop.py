@@ -0,0 +1,85 @@
+"""
+Micro-benchmark: cost of 'continue' in a 1M-iteration loop
+
+Compares the old exception-based signalling with the signal values that
+Interpreter.execute now returns, then times continue_loop.quill on every
+engine.
+
+Usage: python benchmarks/continue_loop.py
+"""
+
+import contextlib
+import io
+import os
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'core'))
+
+from lexer import Lexer
+from parser import Parser
+from interpreter import Interpreter, ENGINES, CONTINUE_SIGNAL
+
+ITERATIONS = 1000000
+
+
+class ContinueException(Exception):
+    """The exception the tree walker used to raise for every 'continue'"""
+
+
+def raise_continue():
+    raise ContinueException()
+
+
+def return_continue():
+    return CONTINUE_SIGNAL
+
+
+def loop_with_exceptions():
+    for _ in range(ITERATIONS):
+        try:
+            raise_continue()
+        except ContinueException:
+            continue
+
+
+def loop_with_signals():
+    for _ in range(ITERATIONS):
+        signal = return_continue()
+        if signal is CONTINUE_SIGNAL:
+            continue
+
+
+def timed(function):
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+def run_engine(ast, source, engine):
+    interpreter = Interpreter(source, engine=engine)
+    with contextlib.redirect_stdout(io.StringIO()):
+        return timed(lambda: interpreter.run(ast))
+
+
+def main():
+    before = timed(loop_with_exceptions)
+    after = timed(loop_with_signals)
+    print(f"Signalling {ITERATIONS:,} continues")
+    print(f"  exceptions (before): {before:.3f}s")
+    print(f"  signals (after):     {after:.3f}s  ({before / after:.1f}x faster)")
+    print()
+
+    path = os.path.join(HERE, 'continue_loop.quill')
+    with open(path, 'r', encoding='utf-8') as f:
+        source = f.read()
+
+    print("continue_loop.quill")
+    for engine in ENGINES:
+        ast = Parser(Lexer(source).tokenize(), source).parse()
+        print(f"  {engine:<8} {run_engine(ast, source, engine):.3f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""
+Import-time budget check: `import interpreter` must stay cheap for headless scripts
+
+Imports the interpreter in fresh Python processes and fails (exit status 1)
+if the import loads a GUI toolkit (tkinter or PIL) or takes longer than the
+budget. The GUI engine is only imported by the first GUI statement.
+
+Usage: python benchmarks/import_budget.py [--budget-ms=250] [--runs=3]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+CORE = os.path.join(HERE, '..', 'core')
+
+FORBIDDEN = ('tkinter', '_tkinter', 'PIL')
+
+PROBE = '''
+import json, sys, time
+sys.path.insert(0, sys.argv[1])
+start = time.perf_counter()
+import interpreter
+seconds = time.perf_counter() - start
+loaded = sorted(name for name in sys.modules if name.split('.')[0] in sys.argv[2:])
+print(json.dumps({"seconds": seconds, "loaded": loaded}))
+'''
+
+
+def probe():
+    """Import interpreter in a new process; return (seconds, forbidden modules loaded)"""
+    result = subprocess.run([sys.executable, '-c', PROBE, CORE] + list(FORBIDDEN),
+                            stdout=subprocess.PIPE, check=True, universal_newlines=True)
+    # Only the last line is ours; anything else was printed during the import
+    data = json.loads(result.stdout.strip().splitlines()[-1])
+    return data['seconds'], data['loaded']
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the cost of importing the interpreter")
+    parser.add_argument('--budget-ms', type=float, default=250.0,
+                        help="maximum import time in milliseconds (default 250)")
+    parser.add_argument('--runs', type=int, default=3, help="imports to try, best kept (default 3)")
+    args = parser.parse_args()
+
+    results = [probe() for _ in range(args.runs)]
+    best = min(seconds for seconds, _ in results) * 1000
+    loaded = sorted({name for _, names in results for name in names})
+
+    print(f"import interpreter: {best:.1f} ms (budget {args.budget_ms:.0f} ms)")
+    failed = False
+    if loaded:
+        print(f"FAIL: importing the interpreter loaded GUI modules: {', '.join(loaded)}")
+        failed = True
+    if best > args.budget_ms:
+        print(f"FAIL: import took {best:.1f} ms, over the {args.budget_ms:.0f} ms budget")
+        failed = True
+    if failed:
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == '__main__':
+    main()
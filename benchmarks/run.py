@@ -0,0 +1,162 @@
+"""
+Benchmark runner: times every workload in benchmarks/workloads/
+
+Each workload is lexed, parsed (including the optimizer pass, as `quill`
+does by default) and executed separately, after warmup runs, and the best
+of the repeated runs is reported per phase. Scripts run in a scratch
+directory with their output discarded, so file and save-game workloads
+leave nothing behind.
+
+With a baseline file (benchmarks/baseline.json by default) present, each
+phase is compared against it and the runner exits with status 1 if any
+phase got slower than the threshold allows.
+
+Usage: python benchmarks/run.py [workload ...] [--engine=vm] [--warmup=1] [--repeat=5]
+                                [--baseline=FILE] [--save-baseline] [--threshold=0.15]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'core'))
+
+from lexer import Lexer
+from parser import Parser
+from optimizer import Optimizer
+from interpreter import Interpreter, ENGINES
+
+WORKLOADS = os.path.join(HERE, 'workloads')
+DEFAULT_BASELINE = os.path.join(HERE, 'baseline.json')
+PHASES = ('lex', 'parse', 'execute')
+MIN_COMPARED = 0.001  # Phases faster than this (seconds) are too noisy to compare
+
+
+def workload_names():
+    return sorted(os.path.splitext(name)[0] for name in os.listdir(WORKLOADS)
+                  if name.endswith('.quill'))
+
+
+def run_once(source, engine):
+    """Lex, parse and execute source once; return the time of each phase"""
+    start = time.perf_counter()
+    tokens = Lexer(source).tokenize()
+    lexed = time.perf_counter()
+    ast = Optimizer().optimize(Parser(tokens, source).parse())
+    parsed = time.perf_counter()
+    interpreter = Interpreter(source, engine=engine)
+    with contextlib.redirect_stdout(io.StringIO()):
+        interpreter.run(ast)
+    executed = time.perf_counter()
+    return {'lex': lexed - start, 'parse': parsed - lexed, 'execute': executed - parsed}
+
+
+def bench(name, engine, warmup, repeat):
+    """Best time per phase over repeat runs of one workload"""
+    with open(os.path.join(WORKLOADS, name + '.quill'), 'r', encoding='utf-8') as f:
+        source = f.read()
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as scratch:
+        os.chdir(scratch)
+        try:
+            for _ in range(warmup):
+                run_once(source, engine)
+            runs = [run_once(source, engine) for _ in range(repeat)]
+        finally:
+            os.chdir(cwd)
+    return {phase: min(run[phase] for run in runs) for phase in PHASES}
+
+
+def load_baseline(path, engine):
+    """Results stored for engine in the baseline file, or None"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f).get('engines', {}).get(engine)
+    except (OSError, ValueError):
+        return None
+
+
+def save_baseline(path, engine, results):
+    """Store results for engine, keeping other engines' entries in the file"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        data = {}
+    data['python'] = platform.python_version()
+    data.setdefault('engines', {})[engine] = results
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def compare(times, baseline, threshold):
+    """Return (text, regressed) describing times against their baseline entry"""
+    if baseline is None:
+        return '', False
+    changes = []
+    regressed = False
+    for phase in PHASES:
+        before = baseline.get(phase)
+        if not before or before < MIN_COMPARED:
+            continue
+        ratio = times[phase] / before
+        if ratio > 1 + threshold:
+            regressed = True
+            changes.append(f"{phase} {ratio - 1:+.0%} SLOWER")
+        elif ratio < 1 - threshold:
+            changes.append(f"{phase} {ratio - 1:+.0%}")
+    return ', '.join(changes) or 'unchanged', regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the Quill benchmark workloads")
+    parser.add_argument('workloads', nargs='*', help="workload names (default: all)")
+    parser.add_argument('--engine', default='vm', choices=ENGINES)
+    parser.add_argument('--warmup', type=int, default=1, help="untimed runs first (default 1)")
+    parser.add_argument('--repeat', type=int, default=5, help="timed runs, best kept (default 5)")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="baseline JSON file")
+    parser.add_argument('--save-baseline', action='store_true',
+                        help="store these results as the baseline for the engine")
+    parser.add_argument('--threshold', type=float, default=0.15,
+                        help="allowed slowdown per phase before failing (default 0.15)")
+    args = parser.parse_args()
+
+    names = args.workloads or workload_names()
+    unknown = sorted(set(names) - set(workload_names()))
+    if unknown:
+        parser.error(f"unknown workload(s): {', '.join(unknown)}")
+
+    baseline = None if args.save_baseline else load_baseline(args.baseline, args.engine)
+    print(f"Engine {args.engine}, best of {args.repeat} after {args.warmup} warmup run(s)"
+          + ("" if baseline else " (no baseline)"))
+    print(f"  {'workload':<16} {'lex ms':>9} {'parse ms':>9} {'exec ms':>10}  vs baseline")
+
+    results = {}
+    regressions = []
+    for name in names:
+        times = results[name] = bench(name, args.engine, args.warmup, args.repeat)
+        change, regressed = compare(times, (baseline or {}).get(name), args.threshold)
+        if regressed:
+            regressions.append(name)
+        print(f"  {name:<16} {times['lex'] * 1000:>9.2f} {times['parse'] * 1000:>9.2f} "
+              f"{times['execute'] * 1000:>10.2f}  {change}")
+
+    if args.save_baseline:
+        save_baseline(args.baseline, args.engine, results)
+        print(f"Baseline for {args.engine} written to {args.baseline}")
+    elif regressions:
+        print(f"Regressions beyond {args.threshold:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
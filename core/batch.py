@@ -0,0 +1,148 @@
+"""
+Batch Runner for Quill
+Runs many scripts, or one script against many answer files, on every CPU core
+
+Usage: quill batch <script.quill>... [--workers=N] [--engine=NAME] [--json=FILE]
+       quill batch <script.quill> --inputs <answers.txt>... [options]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+
+from cache import parse_file
+from optimizer import Optimizer
+from interpreter import Interpreter, ENGINES
+from io_adapters import ScriptedIO, AdapterWriter
+from session import error_message
+from errors import QuillError, QuillInputEnded
+from colors import colorize, Colors, error
+from warm import warm_up
+
+_programs = {}  # In each worker: script path -> (source, optimized AST)
+
+
+def load_program(path, use_cache=True):
+    """Source and optimized AST of a script, parsed at most once per worker
+
+    The parent has already parsed every script, so the first load in a
+    worker reads the current .quillc instead of parsing again.
+    """
+    program = _programs.get(path)
+    if program is None:
+        with open(path, 'r', encoding='utf-8') as f:
+            source = f.read()
+        program = (source, Optimizer().optimize(parse_file(path, source, use_cache=use_cache)))
+        _programs[path] = program
+    return program
+
+
+def run_job(job):
+    """Run one script with one answers file (or none) in a worker; return its result"""
+    script, inputs, engine, use_cache = job
+    start = time.perf_counter()
+    result = {'script': script, 'inputs': inputs, 'status': 0, 'error': None}
+    player_io = ScriptedIO(())
+    try:
+        if inputs:
+            player_io = ScriptedIO.from_file(inputs)
+        source, ast = load_program(script, use_cache)
+        interpreter = Interpreter(source, engine=engine, io=player_io)
+        with redirect_stdout(AdapterWriter(player_io)):
+            interpreter.run(ast)
+    except QuillInputEnded as e:
+        result['status'] = 1
+        result['error'] = f"ran out of answers at line {e.line}"
+    except Exception as e:
+        result['status'] = 1
+        result['error'] = describe_error(e)
+    output = player_io.getvalue()
+    result['digest'] = hashlib.sha256(output.encode('utf-8')).hexdigest()[:16]
+    result['lines'] = output.count('\n')
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+
+def describe_error(e):
+    """One line about a failed run, for the report"""
+    if isinstance(e, QuillError):
+        kind = type(e).__name__.replace('Quill', '')
+        return f"{kind} at line {e.line}: {e.message}" if e.line else f"{kind}: {e.message}"
+    return error_message(e)
+
+
+def run_batch(jobs, workers=None):
+    """Run (script, inputs, engine, use_cache) jobs across a process pool; return (results, seconds)
+
+    Results come back in job order. Runs share the working directory, so
+    scripts that save files can overwrite each other's.
+    """
+    for script in sorted({job[0] for job in jobs if job[3]}):
+        # Fill the .quillc cache once here rather than in every worker
+        try:
+            with open(script, 'r', encoding='utf-8') as f:
+                parse_file(script, f.read())
+        except Exception:
+            pass  # The run reports it
+
+    workers = max(1, min(workers or os.cpu_count() or 1, len(jobs)))
+    chunksize = max(1, len(jobs) // (workers * 4))
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=warm_up) as executor:
+        results = list(executor.map(run_job, jobs, chunksize=chunksize))
+    return results, time.perf_counter() - start
+
+
+def format_report(results, seconds, workers):
+    heading = Colors.BOLD + Colors.BRIGHT_YELLOW
+    rows = [colorize(f"{'status':>6} {'ms':>9} {'lines':>7}  {'digest':<16}  run", heading)]
+    for result in results:
+        name = result['inputs'] or result['script']
+        status = result['status']
+        shown = colorize(f"{status:>6}", Colors.ERROR if status else Colors.SUCCESS)
+        rows.append(f"{shown} {result['seconds'] * 1000:>9.1f} {result['lines']:>7}  {result['digest']:<16}  {name}")
+        if result['error']:
+            rows.append(f"{'':>26}{error(result['error'])}")
+
+    failed = sum(1 for result in results if result['status'])
+    busy = sum(result['seconds'] for result in results)
+    digests = len({result['digest'] for result in results})
+    rows.append("")
+    rows.append(f"{len(results)} runs, {failed} failed, {digests} distinct outputs")
+    rows.append(f"{seconds:.2f} s on {workers} worker{'s' if workers != 1 else ''} ({busy:.2f} s of run time)")
+    return "\n".join(rows)
+
+
+def main(argv=None):
+    """`quill batch`; returns the exit status: 1 if any run failed"""
+    parser = argparse.ArgumentParser(prog='quill batch',
+                                     description="Run many Quill scripts or playthroughs in parallel")
+    parser.add_argument('scripts', nargs='+', metavar='script.quill')
+    parser.add_argument('--inputs', nargs='+', metavar='answers.txt',
+                        help="answer files for a single script, one run each")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="worker processes (default: one per CPU)")
+    parser.add_argument('--engine', choices=ENGINES, default='vm')
+    parser.add_argument('--no-cache', action='store_true', help="parse scripts without __quillcache__")
+    parser.add_argument('--json', metavar='FILE', help="also write the results as JSON")
+    args = parser.parse_args(argv)
+    if args.inputs and len(args.scripts) != 1:
+        parser.error("--inputs takes answer files for exactly one script")
+
+    use_cache = not args.no_cache
+    if args.inputs:
+        jobs = [(args.scripts[0], inputs, args.engine, use_cache) for inputs in args.inputs]
+    else:
+        jobs = [(script, None, args.engine, use_cache) for script in args.scripts]
+
+    workers = max(1, min(args.workers or os.cpu_count() or 1, len(jobs)))
+    results, seconds = run_batch(jobs, workers)
+    print(format_report(results, seconds, workers))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'workers': workers, 'seconds': seconds, 'runs': results}, f, indent=2)
+    return 1 if any(result['status'] for result in results) else 0
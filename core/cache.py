@@ -0,0 +1,138 @@
+"""
+Compiled-Script Cache for Quill
+Stores parsed programs in .quillc files so unchanged scripts skip lexing and parsing
+"""
+
+import hashlib
+import os
+import pickle
+import tempfile
+from contextlib import nullcontext
+
+from lexer import Lexer
+from parser import ASTNode, Parser
+import parser
+
+QUILL_VERSION = "1.0.2"
+CACHE_DIR = "__quillcache__"
+CACHE_SUFFIX = ".quillc"
+MAGIC = b"QUILLC1"
+
+_implementation_hash = None
+
+
+def implementation_hash():
+    """Fingerprint of the interpreter version and the lexer/parser sources
+
+    Any change to how scripts are tokenized or how AST nodes are built
+    invalidates every cached file, even without a version bump.
+    """
+    global _implementation_hash
+    if _implementation_hash is None:
+        digest = hashlib.sha256(QUILL_VERSION.encode('utf-8'))
+        here = os.path.dirname(os.path.abspath(__file__))
+        for name in ('lexer.py', 'parser.py'):
+            with open(os.path.join(here, name), 'rb') as f:
+                digest.update(f.read())
+        _implementation_hash = digest.hexdigest()
+    return _implementation_hash
+
+
+def source_hash(source):
+    return hashlib.sha256(source.encode('utf-8')).hexdigest()
+
+
+def cache_path(filename):
+    """Where the cached parse of filename lives: __quillcache__/<name>.quillc next to it"""
+    directory, name = os.path.split(os.path.abspath(filename))
+    stem = os.path.splitext(name)[0]
+    return os.path.join(directory, CACHE_DIR, stem + CACHE_SUFFIX)
+
+
+def timed(stats, phase):
+    """Time a block under phase in stats (a RunStats), if there is one"""
+    return nullcontext() if stats is None else stats.phase(phase)
+
+
+def parse(source, streaming=False, stats=None):
+    """Lex and parse source without touching the cache
+
+    In streaming mode the parser pulls tokens from the lexer as it goes
+    instead of tokenizing the whole file first. No token list is built,
+    but a syntax error is reported before a lexical error further down.
+    """
+    lexer = Lexer(source)
+    if streaming:
+        with timed(stats, 'lex+parse'):
+            return Parser(lexer.iter_tokens(), source).parse()
+
+    with timed(stats, 'lex'):
+        tokens = lexer.tokenize()
+    if stats is not None:
+        stats.tokens = len(tokens)
+    with timed(stats, 'parse'):
+        return Parser(tokens, source).parse()
+
+
+class NodeUnpickler(pickle.Unpickler):
+    """Unpickler that can only build parser AST nodes
+
+    Anyone who can write next to a script can write its .quillc, and a
+    plain pickle.load would call whatever function such a file names.
+    """
+
+    def find_class(self, module, name):
+        cls = getattr(parser, name, None) if module == ASTNode.__module__ else None
+        if isinstance(cls, type) and issubclass(cls, ASTNode):
+            return cls
+        raise pickle.UnpicklingError(f"{module}.{name} is not an AST node")
+
+
+def load(filename, source):
+    """Return the cached AST for filename, or None if missing or stale"""
+    try:
+        with open(cache_path(filename), 'rb') as f:
+            # Header and AST are separate pickles, each with its own memo
+            header = NodeUnpickler(f).load()
+            if header != (MAGIC, implementation_hash(), source_hash(source)):
+                return None
+            return NodeUnpickler(f).load()
+    except Exception:
+        # Missing, unreadable or corrupt cache files are simply rebuilt
+        return None
+
+
+def store(filename, source, ast):
+    """Write the AST for filename to its cache file; failures are ignored"""
+    path = cache_path(filename)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary file first so readers never see a partial cache
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump((MAGIC, implementation_hash(), source_hash(source)), f,
+                            protocol=pickle.HIGHEST_PROTOCOL)
+                pickle.dump(ast, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+    except Exception:
+        pass  # Read-only directories and deep ASTs just run uncached
+
+
+def parse_file(filename, source, use_cache=True, streaming=False, stats=None):
+    """Return the AST for a script, reusing its .quillc cache when it is current"""
+    if not use_cache:
+        return parse(source, streaming, stats)
+
+    with timed(stats, 'cache'):
+        ast = load(filename, source)
+    if ast is None:
+        ast = parse(source, streaming, stats)
+        with timed(stats, 'cache'):
+            store(filename, source, ast)
+    elif stats is not None:
+        stats.cached = True
+    return ast
@@ -0,0 +1,564 @@
+"""
+Closure Compiler for Quill
+Compiles each AST node once into a specialised Python callable
+"""
+
+from parser import *
+from interpreter import (Function, BREAK_SIGNAL, CONTINUE_SIGNAL, RETURN_SIGNAL,
+                         BINARY_OPERATORS, check_stray_signal, is_truthy)
+from resolver import Resolver, UNSET
+from lazy_range import QuillRange, is_counted_range, type_name
+
+
+class ClosureCompiler:
+    """Turns statements into callables bound to one Interpreter
+
+    Every expression becomes a zero-argument function returning its value and
+    every statement a zero-argument function executing it. Operators, operand
+    shapes and variable names are resolved once at compile time, so running
+    the program never re-inspects node types or operator strings.
+
+    Variables inside function bodies live in the slot array of the running
+    call (see resolver.py), reachable through the shared ``frame`` cell.
+    Statements return the same control-flow signals as Interpreter.execute.
+    """
+
+    def __init__(self, interpreter):
+        self.interpreter = interpreter
+        self.frame = [None]    # Slot array of the running function call
+        self.slot_maps = []    # Name -> slot for each function being compiled
+        self.statement_compilers = {
+            SayNode: self.compile_say,
+            AskNode: self.compile_ask,
+            SetNode: self.compile_set,
+            IfNode: self.compile_if,
+            WhileNode: self.compile_while,
+            ForNode: self.compile_for,
+            FunctionNode: self.compile_function,
+            ReturnNode: self.compile_return,
+            FunctionCallNode: self.compile_call_statement,
+            BreakNode: self.compile_break,
+            ContinueNode: self.compile_continue,
+            ImportNode: self.compile_import,
+            ChoiceNode: self.compile_choice,
+            GotoNode: self.compile_goto,
+        }
+        self.expression_compilers = {
+            LiteralNode: self.compile_literal,
+            VariableNode: self.compile_variable,
+            BinaryOpNode: self.compile_binary,
+            UnaryOpNode: self.compile_unary,
+            ListNode: self.compile_list,
+            IndexNode: self.compile_index,
+            FunctionCallNode: self.compile_call,
+        }
+
+    def run(self, statements):
+        """Compile and execute a program, mirroring Interpreter.run_tree"""
+        interp = self.interpreter
+        interp.statements = statements
+        compiled = self.compile_block(Resolver().resolve(statements))
+
+        interp.current_pos = 0
+        while interp.current_pos < len(compiled):
+            signal = compiled[interp.current_pos]()
+            if signal is not None:
+                check_stray_signal(signal)
+            interp.current_pos += 1
+
+    # Statements
+    def compile_block(self, statements):
+        return [self.compile_statement(stmt) for stmt in statements]
+
+    def compile_statement(self, node):
+        statement = self.compile_uncounted_statement(node)
+        stats = self.interpreter.stats
+        if stats is None:
+            return statement
+
+        def counted_statement():
+            stats.statements += 1
+            return statement()
+        return counted_statement
+
+    def compile_uncounted_statement(self, node):
+        compiler = self.statement_compilers.get(type(node))
+        if compiler is not None:
+            return compiler(node)
+        if isinstance(node, LabelNode):
+            history = self.interpreter.history
+            if node.unfolded_from is not None:
+                return self.compile_unfolded_end(node)
+            if history is not None:
+                name = node.name
+                return lambda: history.save_point(name)
+            return lambda: None  # Labels are just markers
+        # GUI statements are rare; hand them to the tree walker
+        execute = self.interpreter.execute
+        return lambda: execute(node)
+
+    def compile_unfolded_end(self, node):
+        """End label of an unfolded if: take a goto that ran inside the if"""
+        interp = self.interpreter
+        history = interp.history
+        name = node.name
+
+        def end():
+            if history is not None:
+                history.save_point(name)
+            if interp.goto_target is not None:
+                interp.current_pos = interp.goto_target - 1
+                interp.goto_target = None
+        return end
+
+    def compile_say(self, node):
+        expression = self.compile_expression(node.expression)
+        write = self.interpreter.io.say
+
+        def say():
+            write(str(expression()))
+        return say
+
+    def compile_store(self, name, node):
+        """Return a function storing its argument into name (or its slot)"""
+        slot = getattr(node, 'slot', None)
+        if slot is None:
+            variables = self.interpreter.variables
+
+            def store_global(value):
+                variables[name] = value
+            return store_global
+
+        frame = self.frame
+
+        def store_slot(value):
+            frame[0][slot] = value
+        return store_slot
+
+    def compile_ask(self, node):
+        interp = self.interpreter
+        prompt = self.compile_expression(node.prompt)
+        store = self.compile_store(node.variable, node)
+
+        def ask():
+            store(interp._ask(prompt(), node))
+        return ask
+
+    def compile_set(self, node):
+        interp = self.interpreter
+        value = self.compile_expression(node.expression)
+
+        if isinstance(node.variable, str):
+            slot = getattr(node, 'slot', None)
+            if slot is None:
+                variables = interp.variables
+                name = node.variable
+
+                def set_variable():
+                    variables[name] = value()
+                return set_variable
+
+            frame = self.frame
+
+            def set_slot():
+                frame[0][slot] = value()
+            return set_slot
+
+        if isinstance(node.variable, IndexNode):
+            target = self.compile_expression(node.variable.object)
+            index = self.compile_expression(node.variable.index)
+            history = self.interpreter.history
+
+            if history is not None:
+                def set_index():
+                    new_value = value()
+                    obj = target()
+                    position = index()
+                    if type(obj) is QuillRange:
+                        obj = obj.materialize()
+                    if isinstance(obj, list):
+                        history.store_index(obj, int(position), new_value)
+                    else:
+                        raise RuntimeError(f"Cannot index assign to {type(obj).__name__}")
+                return set_index
+
+            def set_index():
+                new_value = value()
+                obj = target()
+                position = index()
+                if type(obj) is QuillRange:
+                    obj = obj.materialize()
+                if isinstance(obj, list):
+                    obj[int(position)] = new_value
+                else:
+                    raise RuntimeError(f"Cannot index assign to {type(obj).__name__}")
+            return set_index
+
+        def invalid_target():
+            raise RuntimeError("Invalid assignment target")
+        return invalid_target
+
+    def compile_if(self, node):
+        condition = self.compile_expression(node.condition)
+        then_block = self.compile_block(node.then_block)
+        else_block = self.compile_block(node.else_block) if node.else_block else None
+
+        def if_statement():
+            if is_truthy(condition()):
+                for stmt in then_block:
+                    signal = stmt()
+                    if signal is not None:
+                        return signal
+            elif else_block:
+                for stmt in else_block:
+                    signal = stmt()
+                    if signal is not None:
+                        return signal
+        return if_statement
+
+    def compile_while(self, node):
+        condition = self.compile_expression(node.condition)
+        body = self.compile_block(node.body)
+
+        def while_loop():
+            while is_truthy(condition()):
+                for stmt in body:
+                    signal = stmt()
+                    if signal is not None:
+                        break
+                else:
+                    continue
+                if signal is BREAK_SIGNAL:
+                    break
+                if signal is RETURN_SIGNAL:
+                    return signal
+        return while_loop
+
+    def compile_for(self, node):
+        iterable_expression = self.compile_expression(node.iterable)
+        body = self.compile_block(node.body)
+        if is_counted_range(node.iterable):
+            return self.compile_counted_for(node, iterable_expression, body)
+        store = self.compile_store(node.variable, node)
+
+        def for_loop():
+            iterable = iterable_expression()
+            if not hasattr(iterable, '__iter__'):
+                raise RuntimeError(f"Cannot iterate over {type(iterable).__name__}")
+            for item in iterable:
+                store(item)
+                for stmt in body:
+                    signal = stmt()
+                    if signal is not None:
+                        break
+                else:
+                    continue
+                if signal is BREAK_SIGNAL:
+                    break
+                if signal is RETURN_SIGNAL:
+                    return signal
+        return for_loop
+
+    def compile_counted_for(self, node, iterable_expression, body):
+        """compile_for for `for i in range(...)`: assign each number without a store call"""
+        slot = getattr(node, 'slot', None)
+        variables = self.interpreter.variables
+        name = node.variable
+        frame = self.frame
+
+        def counted_for_loop():
+            iterable = iterable_expression()
+            if type(iterable) is QuillRange:
+                numbers = iterable.sequence()
+            elif hasattr(iterable, '__iter__'):
+                numbers = iterable  # range() was replaced by an imported module
+            else:
+                raise RuntimeError(f"Cannot iterate over {type(iterable).__name__}")
+            # Calls in the body restore this slot array before returning
+            target, key = (variables, name) if slot is None else (frame[0], slot)
+            for number in numbers:
+                target[key] = number
+                for stmt in body:
+                    signal = stmt()
+                    if signal is not None:
+                        break
+                else:
+                    continue
+                if signal is BREAK_SIGNAL:
+                    break
+                if signal is RETURN_SIGNAL:
+                    return signal
+        return counted_for_loop
+
+    def compile_function(self, node):
+        interp = self.interpreter
+        frame = self.frame
+        outer_slots = self.slot_maps[-1] if self.slot_maps else None
+
+        self.slot_maps.append({name: i for i, name in enumerate(node.slot_names)})
+        body = self.compile_block(node.body)
+        self.slot_maps.pop()
+
+        captures = node.captures
+
+        def define_function():
+            # Capture only the names the function body uses, by value
+            if outer_slots is None:
+                variables = interp.variables
+                closure = {name: variables[name] for name in captures if name in variables}
+            else:
+                current = frame[0]
+                closure = {name: current[outer_slots[name]] for name in captures
+                           if current[outer_slots[name]] is not UNSET}
+
+            def invoke(arg_values):
+                # Arguments fill the first slots, captured values the rest
+                arg_values.extend([closure.get(name, UNSET) for name in captures])
+                saved_frame = frame[0]
+                frame[0] = arg_values
+
+                signal = None
+                for stmt in body:
+                    signal = stmt()
+                    if signal is not None:
+                        break
+
+                frame[0] = saved_frame
+                if signal is RETURN_SIGNAL:
+                    return interp.return_value
+                if signal is not None:
+                    check_stray_signal(signal)
+                return None
+
+            interp.functions[node.name] = Function(node.name, node.parameters, node.body,
+                                                   closure, invoke)
+        return define_function
+
+    def compile_return(self, node):
+        interp = self.interpreter
+        if node.expression is None:
+            def return_none():
+                interp.return_value = None
+                return RETURN_SIGNAL
+            return return_none
+
+        expression = self.compile_expression(node.expression)
+
+        def return_value():
+            interp.return_value = expression()
+            return RETURN_SIGNAL
+        return return_value
+
+    def compile_call_statement(self, node):
+        call = self.compile_call(node)
+
+        def call_statement():
+            call()  # Discard the result so it is not mistaken for a signal
+        return call_statement
+
+    def compile_break(self, node):
+        return lambda: BREAK_SIGNAL
+
+    def compile_continue(self, node):
+        return lambda: CONTINUE_SIGNAL
+
+    def compile_import(self, node):
+        interp = self.interpreter
+
+        def import_module():
+            interp._import(node)
+        return import_module
+
+    def compile_choice(self, node):
+        interp = self.interpreter
+        options = [self.compile_expression(option) for option in node.options]
+        store = self.compile_store('answer', node)
+        history = interp.history
+
+        if history is not None:
+            def choice():
+                history.save_point()
+                store(interp._choose([option() for option in options], node))
+            return choice
+
+        def choice():
+            store(interp._choose([option() for option in options], node))
+        return choice
+
+    def compile_goto(self, node):
+        interp = self.interpreter
+        if node.target is None:
+            label = node.label
+
+            def goto():
+                raise RuntimeError(f"Label '{label}' not found")
+            return goto
+        position = node.target - 1  # -1 because it will be incremented
+        if '#' in node.label:
+            def goto():
+                interp.current_pos = position
+            return goto
+        target = node.target
+        unfolded = interp.unfolded
+
+        def goto():
+            if interp.current_pos in unfolded:
+                interp.goto_target = target  # Taken by compile_unfolded_end
+            else:
+                interp.current_pos = position
+        return goto
+
+    # Expressions
+    def compile_expression(self, node):
+        compiler = self.expression_compilers.get(type(node))
+        if compiler is not None:
+            return compiler(node)
+        return lambda: None
+
+    def compile_literal(self, node):
+        value = node.value
+        return lambda: value
+
+    def compile_variable(self, node):
+        interp = self.interpreter
+        name = node.name
+        slot = getattr(node, 'slot', None)
+
+        if slot is None:
+            variables = interp.variables
+
+            def load():
+                try:
+                    return variables[name]
+                except KeyError:
+                    interp.runtime_error(f"Variable '{name}' is not defined", node,
+                                         "Make sure the variable is declared with 'set' before using it")
+            return load
+
+        frame = self.frame
+
+        def load_slot():
+            value = frame[0][slot]
+            if value is UNSET:
+                interp.runtime_error(f"Variable '{name}' is not defined", node,
+                                     "Make sure the variable is declared with 'set' before using it")
+            return value
+        return load_slot
+
+    def compile_binary(self, node):
+        interp = self.interpreter
+        left = self.compile_expression(node.left)
+        right = self.compile_expression(node.right)
+        op = node.operator
+
+        if op == '/':
+            def divide():
+                dividend = left()
+                divisor = right()
+                if divisor == 0:
+                    interp.runtime_error("Division by zero", node, "Check that the divisor is not zero before dividing")
+                return dividend / divisor
+            return divide
+
+        function = BINARY_OPERATORS.get(op)
+        if function is None:
+            def unknown():
+                left()
+                right()
+                return None
+            return unknown
+
+        # Specialise on operand shapes so constants and variables are not
+        # wrapped in an extra call
+        if isinstance(node.right, LiteralNode):
+            constant = node.right.value
+            if isinstance(node.left, VariableNode) and getattr(node.left, 'slot', None) is None:
+                variables = interp.variables
+                name = node.left.name
+                load = left
+
+                def variable_constant():
+                    try:
+                        value = variables[name]
+                    except KeyError:
+                        value = load()
+                    return function(value, constant)
+                return variable_constant
+            return lambda: function(left(), constant)
+
+        if isinstance(node.left, LiteralNode):
+            constant = node.left.value
+            return lambda: function(constant, right())
+
+        return lambda: function(left(), right())
+
+    def compile_unary(self, node):
+        operand = self.compile_expression(node.operand)
+        if node.operator == 'not':
+            return lambda: not is_truthy(operand())
+        if node.operator == '-':
+            return lambda: -operand()
+
+        def unknown():
+            operand()
+            return None
+        return unknown
+
+    def compile_list(self, node):
+        elements = [self.compile_expression(element) for element in node.elements]
+        return lambda: [element() for element in elements]
+
+    def compile_index(self, node):
+        interp = self.interpreter
+        target = self.compile_expression(node.object)
+        index_expression = self.compile_expression(node.index)
+
+        def index():
+            obj = target()
+            position = index_expression()
+            if type(obj) is QuillRange:
+                obj = obj.sequence()
+            if isinstance(obj, (list, str, range)):
+                try:
+                    return obj[int(position)]
+                except IndexError:
+                    interp.runtime_error(f"Index {position} out of range for {type_name(obj)} of length {len(obj)}",
+                                         node, "Array/string indices must be within bounds (0 to length-1)")
+            interp.runtime_error(f"Cannot index {type(obj).__name__}", node)
+        return index
+
+    def compile_call(self, node):
+        interp = self.interpreter
+        builtins = interp.builtins
+        functions = interp.functions
+        name = node.name
+        arguments = [self.compile_expression(argument) for argument in node.arguments]
+        argc = len(arguments)
+
+        def call():
+            # Check built-in functions first
+            builtin = builtins.get(name)
+            if builtin is not None:
+                args = [argument() for argument in arguments]
+                try:
+                    return builtin(*args)
+                except Exception as e:
+                    raise RuntimeError(f"Error calling built-in function '{name}': {e}")
+
+            func = functions.get(name)
+            if func is None:
+                raise RuntimeError(f"Function '{name}' is not defined")
+            if argc != len(func.parameters):
+                raise RuntimeError(f"Function '{name}' expects {len(func.parameters)} arguments, got {argc}")
+
+            # Evaluate arguments in current scope
+            return func.code([argument() for argument in arguments])
+
+        stats = interp.stats
+        if stats is None:
+            return call
+
+        def counted_call():
+            stats.calls += 1
+            return call()
+        return counted_call
@@ -4,6 +4,7 @@ Provides ANSI color codes and styled output
 """
 
 import os
+import re
 import sys
 
 # Enable ANSI colors on Windows
@@ -80,6 +81,12 @@ def colorize(text, color):
     """Wrap text in ANSI color code"""
     return f"{color}{text}{Colors.RESET}"
 
+ANSI_CODE = re.compile(r'\033\[[0-9;]*m')
+
+def strip_colors(text):
+    """Remove the ANSI color codes colorize() adds"""
+    return ANSI_CODE.sub('', text)
+
 def bold(text):
     """Make text bold"""
     return f"{Colors.BOLD}{text}{Colors.RESET}"
@@ -0,0 +1,515 @@
+"""
+Bytecode Compiler for Quill
+Lowers the AST produced by the parser into flat instruction lists for the VM
+"""
+
+from parser import *
+from interpreter import BINARY_OPERATORS
+from lazy_range import is_counted_range
+from story_graph import walk, unfolded_positions
+
+# Opcodes
+# Ordered by how often they run: first the instructions of hot loops
+# (measured on benchmarks/workloads), then calls and I/O, then the rare
+# ones. The VM finds an opcode by testing its group of eight (op < 8,
+# op < 16, ...) and then the opcodes of that group in this order, so keep
+# the two in sync.
+LOAD = 0                     # arg: name                     push variable value
+CONST = 1                    # arg: value                    push constant
+COMPARE_CONST_JUMP = 2       # arg: [function, value, target]  pop, jump unless function(popped, value)
+UPDATE_CONST = 3             # arg: (name, function, value)  set name to function(name, value)
+LOAD_BINARY_CONST = 4        # arg: (name, function, value)  push function(name, value)
+JUMP = 5                     # arg: target
+STORE = 6                    # arg: name                     pop into variable
+BINARY_CONST = 7             # arg: (function, value)        replace top with function(top, value)
+ADD = 8
+LOAD_FAST = 9                # arg: slot                     push function-local value
+STORE_FAST = 10              # arg: slot                     pop into function-local slot
+LOAD_FAST_BINARY_CONST = 11  # arg: (slot, function, value)  LOAD_BINARY_CONST for a function-local slot
+UPDATE_FAST_CONST = 12       # arg: (slot, function, value)  UPDATE_CONST for a function-local slot
+FOR_RANGE = 13               # arg: target                   FOR_ITER fused with the STORE after it
+LOAD_INDEX = 14              # arg: name                     pop index, push name[index]
+STORE_NAME_INDEX = 15        # arg: (name, journal)          pop index and value, set name[index] like STORE_INDEX
+JUMP_IF_FALSE = 16           # arg: target                   pop, jump if not truthy
+COMPARE_JUMP = 17            # arg: [function, target]       pop two, jump unless function(left, right)
+FOR_RANGE_FAST = 18          # arg: target                   FOR_ITER fused with the STORE_FAST after it
+FOR_ITER = 19                # arg: target                   push next item or pop iterator and jump
+CALL = 20                    # arg: (name, argc)
+RETURN = 21
+POP = 22
+SAY = 23
+LOAD_FAST_INDEX = 24         # arg: slot                     LOAD_INDEX for a function-local slot
+STORE_FAST_INDEX = 25        # arg: (slot, journal)          STORE_NAME_INDEX for a function-local slot
+INDEX = 26
+STORE_INDEX = 27             # arg: True to journal the store in interp.history (undo/rewind)
+SUB = 28
+MUL = 29
+DIV = 30
+MOD = 31
+GOTO = 32                    # arg: target                   jump (a top-level goto)
+TAKE_GOTO = 33               # end of a top-level statement: jump to the last DEFER_GOTO target, if any
+DEFER_GOTO = 34              # arg: target                   goto in a block or function: jump at TAKE_GOTO
+BUILD_LIST = 35              # arg: count
+GET_ITER = 36
+NOT = 37
+NEG = 38
+AND = 39
+OR = 40
+POW = 41
+EQ = 42
+NE = 43
+GT = 44
+LT = 45
+GE = 46
+LE = 47
+MAKE_FUNCTION = 48           # arg: (FunctionNode, CodeObject, captures)
+ASK = 49                     # push the player's answer to the prompt on the stack
+CHOICE = 50                  # arg: option count             push the selected option
+SAVE_POINT = 51              # arg: label name or None       interp.history.save_point(arg) (undo/rewind)
+IMPORT = 52                  # arg: ImportNode
+EXEC_NODE = 53               # arg: AST node, run through the tree walker (GUI statements)
+RAISE = 54                   # arg: message, raised as RuntimeError
+HALT = 55                    # end of the main program
+COUNT = 56                   # arg: counter name             add one to interp.stats.<name> (--stats)
+
+OPCODE_NAMES = {
+    value: name for name, value in list(globals().items())
+    if name.isupper() and isinstance(value, int) and name != 'OPCODE_NAMES'
+}
+
+OPERATOR_NAMES = {function: operator for operator, function in BINARY_OPERATORS.items()}
+
+BINARY_OPCODES = {
+    '+': ADD, '-': SUB, '*': MUL, '/': DIV, '%': MOD, '**': POW,
+    '==': EQ, '!=': NE, '>': GT, '<': LT, '>=': GE, '<=': LE,
+    'and': AND, 'or': OR,
+}
+
+# Operators fused with a constant operand; '/' keeps its own instruction for
+# its division-by-zero message, and 'and'/'or' are rare in hot loops
+CONST_OPERATORS = {'+', '-', '*', '%', '==', '!=', '>', '<', '>=', '<='}
+COMPARISONS = {'==', '!=', '>', '<', '>=', '<='}
+
+GUI_NODES = (WindowNode, ButtonNode, TextboxNode, ImageNode, GUILabelNode,
+             InputNode, ShowNode, HideNode, UpdateNode)
+
+
+class CodeObject:
+    """Compiled instructions for the main program or a single function body"""
+    def __init__(self, name, parameters=None, slot_names=None):
+        self.name = name
+        self.parameters = parameters or []
+        self.slot_names = slot_names or []  # Frame layout from the resolver
+        # Non-parameter slots, filled from the closure on each call
+        self.captures = self.slot_names[len(self.parameters):]
+        self.ops = []
+        self.args = []
+        self.nodes = []    # Source node per instruction, used for error locations
+        self.labels = {}   # Label name -> instruction index (main program only)
+
+    def __len__(self):
+        return len(self.ops)
+
+    def disassemble(self):
+        """Return a readable listing of the instructions"""
+        lines = [f"code <{self.name}>"]
+        label_at = {index: name for name, index in self.labels.items()}
+        for i, (op, arg) in enumerate(zip(self.ops, self.args)):
+            if i in label_at:
+                lines.append(f"  {label_at[i]}:")
+            if op == MAKE_FUNCTION:
+                shown = arg[0].name
+            elif op in (LOAD_FAST, STORE_FAST, LOAD_FAST_INDEX):
+                shown = f"{arg} ({self.slot_names[arg]})"
+            elif op in (BINARY_CONST, LOAD_BINARY_CONST, LOAD_FAST_BINARY_CONST, UPDATE_CONST,
+                        UPDATE_FAST_CONST, COMPARE_JUMP, COMPARE_CONST_JUMP):
+                shown = ' '.join(OPERATOR_NAMES.get(part, repr(part)) for part in arg)
+            elif op in (IMPORT, EXEC_NODE):
+                shown = type(arg).__name__
+            else:
+                shown = '' if arg is None else repr(arg)
+            lines.append(f"  {i:5d} {OPCODE_NAMES[op]:<22} {shown}")
+        for op, arg in zip(self.ops, self.args):
+            if op == MAKE_FUNCTION:
+                lines.append("")
+                lines.append(arg[1].disassemble())
+        return "\n".join(lines)
+
+
+class Compiler:
+    """Compiles a list of statements into a CodeObject"""
+
+    def __init__(self, count=False, save_points=False):
+        self.count = count  # Emit COUNT instructions for quill --stats
+        self.save_points = save_points  # Emit SAVE_POINT at labels and choices for a History
+        self.code = None
+        self.loops = []  # Stack of [kind, continue_target, break_jumps]
+        self.depth = 0   # Block nesting depth within the current code object
+        self.gotos = []  # (code, index, label) of every GOTO, patched once all labels are known
+        self.last_gotos = set()  # ids of gotos that end their top-level statement, which jump at once
+        self.unfolded = False  # Compiling part of an unfolded if, whose end label takes its gotos
+        self.statement_compilers = {
+            SayNode: self.compile_say,
+            AskNode: self.compile_ask,
+            SetNode: self.compile_set,
+            IfNode: self.compile_if,
+            WhileNode: self.compile_while,
+            ForNode: self.compile_for,
+            FunctionNode: self.compile_function,
+            ReturnNode: self.compile_return,
+            FunctionCallNode: self.compile_call_statement,
+            BreakNode: self.compile_break,
+            ContinueNode: self.compile_continue,
+            ImportNode: self.compile_import,
+            ChoiceNode: self.compile_choice,
+            GotoNode: self.compile_goto,
+            LabelNode: self.compile_label,
+        }
+        self.expression_compilers = {
+            LiteralNode: self.compile_literal,
+            VariableNode: self.compile_variable,
+            BinaryOpNode: self.compile_binary,
+            UnaryOpNode: self.compile_unary,
+            ListNode: self.compile_list,
+            IndexNode: self.compile_index,
+            FunctionCallNode: self.compile_call,
+        }
+
+    def compile(self, statements, name='<main>'):
+        """Compile the top-level program"""
+        self.code = CodeObject(name)
+        # As in the tree walker, a goto inside an if, loop or function only
+        # records where to go; the jump happens when the top-level statement
+        # around it has finished, or at the end label of an if story_graph unfolded
+        calls_goto = any(isinstance(node, FunctionNode) and has_goto(node.body) for node in walk(statements))
+        unfolded = unfolded_positions(statements)
+        for index, stmt in enumerate(statements):
+            self.unfolded = index in unfolded
+            self.last_gotos = last_gotos(stmt)
+            self.compile_statement(stmt)
+            if not self.unfolded and not isinstance(stmt, (GotoNode, FunctionNode)) and any(
+                    (isinstance(node, GotoNode) and id(node) not in self.last_gotos)
+                    or (calls_goto and isinstance(node, FunctionCallNode)) for node in walk(stmt)):
+                self.emit(TAKE_GOTO, None, stmt)
+        self.last_gotos = set()
+        self.unfolded = False
+        self.emit(HALT)
+        self.patch_gotos(self.code)
+        return self.code
+
+    def patch_gotos(self, main):
+        """Point every GOTO, in main or in a function, at its label's instruction"""
+        for code, index, label in self.gotos:
+            if label not in main.labels:
+                raise RuntimeError(f"Label '{label}' not found")
+            code.args[index] = main.labels[label]
+        self.gotos = []
+
+    # Emission helpers
+    def emit(self, op, arg=None, node=None):
+        code = self.code
+        code.ops.append(op)
+        code.args.append(arg)
+        code.nodes.append(node)
+        return len(code.ops) - 1
+
+    def here(self):
+        return len(self.code.ops)
+
+    def patch(self, index, target=None):
+        """Point the jump at index to target (default: the next instruction)"""
+        target = self.here() if target is None else target
+        if isinstance(self.code.args[index], list):
+            self.code.args[index][-1] = target  # COMPARE_JUMP and COMPARE_CONST_JUMP
+        else:
+            self.code.args[index] = target
+
+    def emit_jump_unless(self, condition, node):
+        """Compile condition and a jump taken when it is false; return the jump's index for patch()"""
+        if isinstance(condition, BinaryOpNode) and condition.operator in COMPARISONS:
+            function = BINARY_OPERATORS[condition.operator]
+            self.compile_expression(condition.left)
+            if isinstance(condition.right, LiteralNode):
+                return self.emit(COMPARE_CONST_JUMP, [function, condition.right.value, None], node)
+            self.compile_expression(condition.right)
+            return self.emit(COMPARE_JUMP, [function, None], node)
+        self.compile_expression(condition)
+        return self.emit(JUMP_IF_FALSE, None, node)
+
+    # Statements
+    def compile_block(self, statements):
+        self.depth += 1
+        for stmt in statements:
+            self.compile_statement(stmt)
+        self.depth -= 1
+
+    def compile_statement(self, node):
+        if self.count:
+            self.emit(COUNT, 'statements', node)
+        compiler = self.statement_compilers.get(type(node))
+        if compiler is not None:
+            compiler(node)
+        elif isinstance(node, GUI_NODES):
+            self.emit(EXEC_NODE, node, node)
+
+    def compile_say(self, node):
+        self.compile_expression(node.expression)
+        self.emit(SAY, None, node)
+
+    def compile_ask(self, node):
+        self.compile_expression(node.prompt)
+        self.emit(ASK, None, node)
+        self.emit_store(node.variable, node)
+
+    def compile_set(self, node):
+        expression = node.expression
+        if (isinstance(node.variable, str) and isinstance(expression, BinaryOpNode)
+                and expression.operator in CONST_OPERATORS and isinstance(expression.right, LiteralNode)
+                and isinstance(expression.left, VariableNode) and expression.left.name == node.variable
+                and getattr(expression.left, 'slot', None) == getattr(node, 'slot', None)):
+            # set x to x + 1
+            function, value = BINARY_OPERATORS[expression.operator], expression.right.value
+            slot = getattr(node, 'slot', None)
+            if slot is None:
+                self.emit(UPDATE_CONST, (node.variable, function, value), expression.left)
+            else:
+                self.emit(UPDATE_FAST_CONST, (slot, function, value), expression.left)
+            return
+        self.compile_expression(expression)
+        if isinstance(node.variable, str):
+            self.emit_store(node.variable, node)
+        elif isinstance(node.variable, IndexNode):
+            target = node.variable.object
+            if isinstance(target, VariableNode):
+                self.compile_expression(node.variable.index)
+                slot = getattr(target, 'slot', None)
+                if slot is None:
+                    self.emit(STORE_NAME_INDEX, (target.name, self.save_points), node)
+                else:
+                    self.emit(STORE_FAST_INDEX, (slot, self.save_points), node)
+                return
+            self.compile_expression(target)
+            self.compile_expression(node.variable.index)
+            self.emit(STORE_INDEX, self.save_points, node)
+        else:
+            self.emit(RAISE, "Invalid assignment target", node)
+
+    def compile_if(self, node):
+        jump_else = self.emit_jump_unless(node.condition, node)
+        self.compile_block(node.then_block)
+        if node.else_block:
+            jump_end = self.emit(JUMP, None, node)
+            self.patch(jump_else)
+            self.compile_block(node.else_block)
+            self.patch(jump_end)
+        else:
+            self.patch(jump_else)
+
+    def compile_while(self, node):
+        start = self.here()
+        jump_exit = self.emit_jump_unless(node.condition, node)
+        self.loops.append(['while', start, []])
+        self.compile_block(node.body)
+        _, _, break_jumps = self.loops.pop()
+        self.emit(JUMP, start, node)
+        self.patch(jump_exit)
+        for index in break_jumps:
+            self.patch(index)
+
+    def compile_for(self, node):
+        self.compile_expression(node.iterable)
+        self.emit(GET_ITER, None, node)
+        if is_counted_range(node.iterable):
+            # The loop op stores each number itself and skips the store below,
+            # which is still emitted so the disassembly shows the target
+            start = self.emit(FOR_RANGE if getattr(node, 'slot', None) is None else FOR_RANGE_FAST,
+                              None, node)
+        else:
+            start = self.emit(FOR_ITER, None, node)
+        self.emit_store(node.variable, node)
+        self.loops.append(['for', start, []])
+        self.compile_block(node.body)
+        _, _, break_jumps = self.loops.pop()
+        self.emit(JUMP, start, node)
+        self.patch(start)
+        for index in break_jumps:
+            self.patch(index)
+
+    def compile_break(self, node):
+        if not self.loops:
+            self.emit(RAISE, "'break' used outside of a loop", node)
+            return
+        kind, _, break_jumps = self.loops[-1]
+        if kind == 'for':
+            self.emit(POP, None, node)  # Drop the loop iterator
+        break_jumps.append(self.emit(JUMP, None, node))
+
+    def compile_continue(self, node):
+        if not self.loops:
+            self.emit(RAISE, "'continue' used outside of a loop", node)
+            return
+        self.emit(JUMP, self.loops[-1][1], node)
+
+    def compile_function(self, node):
+        outer_code, outer_loops = self.code, self.loops
+        self.code = CodeObject(node.name, node.parameters, node.slot_names)
+        self.loops = []
+        self.compile_block(node.body)
+        self.emit(CONST, None, node)
+        self.emit(RETURN, None, node)
+        function_code = self.code
+        self.code, self.loops = outer_code, outer_loops
+
+        # Where each captured value comes from: a slot of the enclosing
+        # function, or (at top level) the globals dictionary
+        if self.code.name == '<main>':
+            captures = [(name, None) for name in node.captures]
+        else:
+            slots = {name: i for i, name in enumerate(self.code.slot_names)}
+            captures = [(name, slots[name]) for name in node.captures]
+        self.emit(MAKE_FUNCTION, (node, function_code, captures), node)
+
+    def compile_return(self, node):
+        if node.expression:
+            self.compile_expression(node.expression)
+        else:
+            self.emit(CONST, None, node)
+        self.emit(RETURN, None, node)
+
+    def compile_call_statement(self, node):
+        self.compile_call(node)
+        self.emit(POP, None, node)
+
+    def compile_import(self, node):
+        self.emit(IMPORT, node, node)
+
+    def compile_choice(self, node):
+        if self.save_points:
+            self.emit(SAVE_POINT, None, node)
+        for option in node.options:
+            self.compile_expression(option)
+        self.emit(CHOICE, len(node.options), node)
+        self.emit_store('answer', node)
+
+    def compile_goto(self, node):
+        at_end = (self.depth == 0 or id(node) in self.last_gotos) and self.code.name == '<main>'
+        if self.unfolded and '#' not in node.label:
+            at_end = False  # story_graph's own gotos still jump at once
+        op = GOTO if at_end else DEFER_GOTO
+        self.gotos.append((self.code, self.emit(op, node.label, node), node.label))
+
+    def compile_label(self, node):
+        # Only top-level labels are jump targets, matching the tree walker;
+        # story_graph has already moved labels out of ifs
+        if self.depth == 0 and self.code.name == '<main>':
+            self.code.labels[node.name] = self.here()
+            if self.save_points:
+                self.emit(SAVE_POINT, node.name, node)
+            if node.unfolded_from is not None:
+                self.emit(TAKE_GOTO, None, node)
+
+    # Expressions
+    def compile_expression(self, node):
+        compiler = self.expression_compilers.get(type(node))
+        if compiler is not None:
+            compiler(node)
+        else:
+            self.emit(CONST, None, node)
+
+    def compile_literal(self, node):
+        self.emit(CONST, node.value, node)
+
+    def compile_variable(self, node):
+        slot = getattr(node, 'slot', None)
+        if slot is None:
+            self.emit(LOAD, node.name, node)
+        else:
+            self.emit(LOAD_FAST, slot, node)
+
+    def emit_store(self, name, node):
+        """Store the top of the stack into name, using the slot the resolver assigned"""
+        slot = getattr(node, 'slot', None)
+        if slot is None:
+            self.emit(STORE, name, node)
+        else:
+            self.emit(STORE_FAST, slot, node)
+
+    def compile_binary(self, node):
+        if node.operator in CONST_OPERATORS and isinstance(node.right, LiteralNode):
+            function, value = BINARY_OPERATORS[node.operator], node.right.value
+            left = node.left
+            if isinstance(left, VariableNode):
+                slot = getattr(left, 'slot', None)
+                if slot is None:
+                    self.emit(LOAD_BINARY_CONST, (left.name, function, value), left)
+                else:
+                    self.emit(LOAD_FAST_BINARY_CONST, (slot, function, value), left)
+            else:
+                self.compile_expression(left)
+                self.emit(BINARY_CONST, (function, value), node)
+            return
+        self.compile_expression(node.left)
+        self.compile_expression(node.right)
+        opcode = BINARY_OPCODES.get(node.operator)
+        if opcode is None:
+            self.emit(POP, None, node)
+            self.emit(POP, None, node)
+            self.emit(CONST, None, node)
+        else:
+            self.emit(opcode, None, node)
+
+    def compile_unary(self, node):
+        self.compile_expression(node.operand)
+        if node.operator == 'not':
+            self.emit(NOT, None, node)
+        elif node.operator == '-':
+            self.emit(NEG, None, node)
+        else:
+            self.emit(POP, None, node)
+            self.emit(CONST, None, node)
+
+    def compile_list(self, node):
+        for element in node.elements:
+            self.compile_expression(element)
+        self.emit(BUILD_LIST, len(node.elements), node)
+
+    def compile_index(self, node):
+        if isinstance(node.object, VariableNode):
+            self.compile_expression(node.index)
+            slot = getattr(node.object, 'slot', None)
+            if slot is None:
+                self.emit(LOAD_INDEX, node.object.name, node)
+            else:
+                self.emit(LOAD_FAST_INDEX, slot, node)
+            return
+        self.compile_expression(node.object)
+        self.compile_expression(node.index)
+        self.emit(INDEX, None, node)
+
+    def compile_call(self, node):
+        for argument in node.arguments:
+            self.compile_expression(argument)
+        if self.count:
+            self.emit(COUNT, 'calls', node)
+        self.emit(CALL, (node.name, len(node.arguments)), node)
+
+
+def has_goto(statements):
+    return any(isinstance(node, GotoNode) for node in walk(statements))
+
+
+def last_gotos(stmt):
+    """ids of the gotos after which nothing else in top-level statement stmt runs
+
+    Those are the gotos that end a branch of an if, or of an if at the end
+    of a branch, and so on: `if ... then goto x end` can jump straight away.
+    """
+    found = set()
+    pending = [stmt]
+    while pending:
+        node = pending.pop()
+        if isinstance(node, GotoNode):
+            found.add(id(node))
+        elif isinstance(node, IfNode):
+            pending.extend(block[-1] for block in (node.then_block, node.else_block) if block)
+    return found
@@ -59,6 +59,10 @@ class QuillTypeError(QuillError):
     """Type-related errors"""
     pass
 
+class QuillInputEnded(QuillError):
+    """The player's input, or a file of scripted answers, ran out at an ask or choice"""
+    pass
+
 
 def format_error_with_context(
     error_type: str,
@@ -337,8 +337,7 @@ class GUIEngine:
                 # DON'T apply closure for callbacks - we want them to access current global state
                 # (applying closure would reset variables to their values when function was defined)
                 try:
-                    for stmt in func.body:
-                        self.interpreter.execute(stmt)
+                    self.interpreter.execute_block(func.body)
                 except Exception as e:
                     print(f"Error in callback '{callback_name}': {e}")
             # Try to jump to a label
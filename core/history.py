@@ -0,0 +1,192 @@
+"""
+Story History for Quill
+Save points at every label and choice, for undo() and rewind()
+"""
+
+from parser import FunctionCallNode
+from story_graph import walk
+
+MISSING = object()  # Journal value of a variable that did not exist yet
+DEFAULT_LIMIT = 200  # Save points kept per run; older ones are forgotten
+
+
+class StoryVariables(dict):
+    """The global variables of a run that keeps a History
+
+    The first time a name is set after a save point, its old value is
+    appended to the journal. A save point is then just a journal position,
+    and going back to it undoes the entries after that position, so
+    neither costs more as the story's state grows. Lists are the one value
+    a script changes in place (`set items[0] to ...`); the engines send
+    those stores through History.store_index, which journals the old item
+    the first time each index of a list is set after a save point, so
+    lists shared by several variables stay shared.
+
+    Storing through the journal is slower than a plain dict, so only runs
+    that use undo() or rewind() get one (see needs_history).
+    """
+    __slots__ = ('journal', 'changed')
+
+    def __init__(self, values=()):
+        super().__init__(values)
+        self.journal = []     # (container, name or index, value before the change, or MISSING)
+        self.changed = set()  # Names and (id(list), index) pairs journaled since the latest save point
+
+    def __setitem__(self, name, value):
+        if name not in self.changed:
+            self.changed.add(name)
+            self.journal.append((self, name, self.get(name, MISSING)))
+        dict.__setitem__(self, name, value)
+
+    def __delitem__(self, name):
+        self[name] = self[name]  # Journal it
+        dict.__delitem__(self, name)
+
+    def pop(self, name, *default):
+        if name in self:
+            self[name] = self[name]
+        return dict.pop(self, name, *default)
+
+    def setdefault(self, name, value=None):
+        if name not in self:
+            self[name] = value
+        return self[name]
+
+    def update(self, *args, **kwargs):
+        for name, value in dict(*args, **kwargs).items():
+            self[name] = value
+
+    def clear(self):
+        for name in list(self):
+            del self[name]
+
+
+class SavePoint:
+    __slots__ = ('scene', 'entered', 'position', 'inventory')
+
+    def __init__(self, scene, entered, position, inventory):
+        self.scene = scene        # Latest label the story passed
+        self.entered = entered    # Taken at the label itself rather than at a choice
+        self.position = position  # Journal length at the save point, counting forgotten entries
+        self.inventory = inventory  # The inventory list itself, shared until it changes
+
+
+class History:
+    """Save points taken as a run passes each label and before each choice
+
+    Creating a History swaps the interpreter's variables for a
+    StoryVariables holding the same values, so it has to happen before an
+    engine starts running (Interpreter.enable_history). The inventory is
+    copied on write: a save point keeps the current list, and the next
+    change copies it first (Interpreter.writable_inventory).
+
+    Going back restores variables and inventory only. The script decides
+    where to continue, usually with a goto to the scene it rewound to.
+    """
+
+    def __init__(self, interpreter, limit=DEFAULT_LIMIT):
+        if not isinstance(interpreter.variables, StoryVariables):
+            interpreter.variables = StoryVariables(interpreter.variables)
+        self.interpreter = interpreter
+        self.variables = interpreter.variables
+        self.limit = limit
+        self.points = []
+        self.forgotten = 0  # Journal entries dropped along with the oldest save points
+        self.scene = None
+        self.inventory_shared = False
+
+    def __len__(self):
+        return len(self.points)
+
+    def position(self):
+        return self.forgotten + len(self.variables.journal)
+
+    def store_index(self, items, index, value):
+        """`set items[index] to value`, journaled so that going back puts the old item back"""
+        changed = self.variables.changed
+        key = (id(items), index)  # The journal keeps items alive, so its id is not reused
+        if key not in changed:
+            self.variables.journal.append((items, index, items[index]))
+            changed.add(key)
+        items[index] = value
+
+    def save_point(self, label=None):
+        """Record the current state; label is the scene being entered, or None for a choice"""
+        if label is not None:
+            if '#' in label:
+                return  # if/else joins added by story_graph are not scenes
+            self.scene = label
+        points = self.points
+        points.append(SavePoint(self.scene, label is not None, self.position(), self.interpreter.inventory))
+        self.variables.changed = set()
+        self.inventory_shared = True
+
+        if len(points) > self.limit:
+            del points[0]
+            cut = points[0].position - self.forgotten
+            del self.variables.journal[:cut]
+            self.forgotten += cut
+
+    def undo(self):
+        """Go back to just before the previous choice; return whether there was one
+
+        The latest choice is normally the one the player just answered (the
+        one that asked to undo), so undo() returns to the choice before it,
+        putting back everything that answer led to. That save point is used
+        up, so each undo() goes one choice further back.
+        """
+        choices = [index for index, point in enumerate(self.points) if not point.entered]
+        if len(choices) < 2:
+            return False
+        self.restore(choices[-2])
+        self.points.pop()
+        self.reopen()
+        return True
+
+    def rewind(self, label):
+        """Go back to the last time the story entered scene label; return whether it has"""
+        for index in range(len(self.points) - 1, -1, -1):
+            point = self.points[index]
+            if point.entered and point.scene == label:
+                self.restore(index)
+                return True
+        return False
+
+    def restore(self, index):
+        """Put variables and inventory back as they were at points[index] and forget later save points"""
+        point = self.points[index]
+        variables = self.variables
+        journal = variables.journal
+        start = point.position - self.forgotten
+        for container, key, value in reversed(journal[start:]):
+            if container is not variables:
+                container[key] = value  # A list item
+            elif value is MISSING:
+                dict.pop(variables, key, None)
+            else:
+                dict.__setitem__(variables, key, value)
+        del journal[start:]
+        del self.points[index + 1:]
+        variables.changed = set()
+        self.interpreter.inventory = point.inventory
+        self.inventory_shared = True
+        self.scene = point.scene
+
+    def reopen(self):
+        """After dropping the latest save point, journal changes against the one before it"""
+        variables = self.variables
+        if self.points:
+            start = self.points[-1].position - self.forgotten
+            variables.changed = {key if container is variables else (id(container), key)
+                                 for container, key, _ in variables.journal[start:]}
+            self.scene = self.points[-1].scene
+        else:
+            self.forgotten += len(variables.journal)
+            del variables.journal[:]
+            variables.changed = set()
+
+
+def needs_history(statements):
+    """Whether a program calls undo() or rewind(), so its runs should keep a History"""
+    return any(isinstance(node, FunctionCallNode) and node.name in ('undo', 'rewind')
+               for node in walk(statements))
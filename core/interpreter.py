@@ -4,43 +4,101 @@ Executes the AST
 """
 
 from parser import *
-from gui_engine import GUIEngine
 from colors import *
+from lazy_range import QuillRange, type_name
 import math
+import operator
 import random
-import json
 import os
 import time
 import sys
 
-class BreakException(Exception):
-    pass
+# Control-flow signals returned by Interpreter.execute; None means "carry on".
+# Returning them is much cheaper than raising an exception per iteration.
+BREAK_SIGNAL = 'break'
+CONTINUE_SIGNAL = 'continue'
+RETURN_SIGNAL = 'return'  # The value is left in Interpreter.return_value
 
-class ContinueException(Exception):
-    pass
+def check_stray_signal(signal):
+    """Raise for a signal that escaped the loop or function it belongs to"""
+    if signal is RETURN_SIGNAL:
+        raise RuntimeError("'return' can only be used inside a function")
+    if signal is BREAK_SIGNAL:
+        raise RuntimeError("'break' used outside of a loop")
+    if signal is CONTINUE_SIGNAL:
+        raise RuntimeError("'continue' used outside of a loop")
 
-class ReturnException(Exception):
-    def __init__(self, value):
-        self.value = value
+def is_truthy(value):
+    """Quill truthiness: non-zero numbers, non-empty strings and true"""
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)):
+        return value != 0
+    if isinstance(value, str):
+        return len(value) > 0
+    return False
+
+def smart_add(left, right):
+    """Smart addition: numbers add, strings concatenate"""
+    if isinstance(left, (int, float)) and isinstance(right, (int, float)):
+        return left + right
+    return str(left) + str(right)
+
+# Binary operators by symbol ('/' is checked for a zero divisor first)
+BINARY_OPERATORS = {
+    '+': smart_add,
+    '-': operator.sub,
+    '*': operator.mul,
+    '/': operator.truediv,
+    '%': operator.mod,
+    '**': operator.pow,
+    '==': operator.eq,
+    '!=': operator.ne,
+    '>': operator.gt,
+    '<': operator.lt,
+    '>=': operator.ge,
+    '<=': operator.le,
+    'and': lambda left, right: is_truthy(left) and is_truthy(right),
+    'or': lambda left, right: is_truthy(left) or is_truthy(right),
+}
 
 class Function:
-    def __init__(self, name, parameters, body, closure):
+    def __init__(self, name, parameters, body, closure, code=None):
         self.name = name
         self.parameters = parameters
         self.body = body
         self.closure = closure
+        self.code = code  # Compiled body, in the form used by the engine that defined it
+
+# Execution engines: the bytecode VM is the default, closure compilation is a
+# lighter-weight middle tier, and the tree walker is the fallback
+ENGINES = ('vm', 'closure', 'tree')
 
 class Interpreter:
-    def __init__(self, source="", legacy_mode=False):
+    def __init__(self, source="", legacy_mode=False, engine='vm', io=None):
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown engine '{engine}' (expected one of: {', '.join(ENGINES)})")
         self.variables = {}
         self.functions = {}
         self.labels = {}
         self.statements = []
         self.current_pos = 0
+        self.unfolded = set()  # Positions where a goto waits for an end label (see story_graph)
+        self.goto_target = None
+        self.return_value = None  # Value carried by RETURN_SIGNAL
         self.inventory = []  # Player's inventory
-        self.gui = GUIEngine(interpreter=self)  # GUI engine for desktop apps
+        self._gui = None  # GUIEngine, created by the first GUI statement (see gui)
+        self._saves = None  # SaveFiles, created by the first save or load (see saves)
         self.source = source  # Store source for error context
         self.legacy_mode = legacy_mode  # Auto-import game/io in legacy mode
+        self.engine = engine
+        self.stats = None  # RunStats to count statements and calls in (quill --stats)
+        self.suspendable = False  # Set by a suspendable VM: wait() pauses it instead of sleeping
+        self.history = None  # History of save points, for scripts that use undo() or rewind()
+        if io is None:
+            from io_adapters import ConsoleIO
+            io = ConsoleIO()
+        self.io = io  # Where say, ask and choice talk to the player (see io_adapters)
         
         # Import standard library
         from stdlib import get_stdlib_functions
@@ -52,8 +110,8 @@ class Interpreter:
             'str': lambda x: str(x),
             'int': lambda x: int(x),
             'float': lambda x: float(x),
-            'type': lambda x: type(x).__name__,
-            'range': lambda *args: list(range(*args)),
+            'type': lambda x: type_name(x),
+            'range': lambda *args: QuillRange(*args),
             'abs': lambda x: abs(x),
         }
         
@@ -82,6 +140,63 @@ class Interpreter:
                 self.module_loader.import_from('io', '*')
             except Exception:
                 pass
+        
+        # Handlers keyed on node class, so dispatch costs the same for every node type
+        self.statement_handlers = {
+            SayNode: self.exec_say,
+            AskNode: self.exec_ask,
+            SetNode: self.exec_set,
+            IfNode: self.exec_if,
+            WhileNode: self.exec_while,
+            ForNode: self.exec_for,
+            FunctionNode: self.exec_function,
+            ReturnNode: self.exec_return,
+            FunctionCallNode: self.exec_call,
+            BreakNode: self.exec_break,
+            ContinueNode: self.exec_continue,
+            ImportNode: self._import,
+            ChoiceNode: self.exec_choice,
+            GotoNode: self.exec_goto,
+            LabelNode: self.exec_label,
+            WindowNode: self.exec_window,
+            ButtonNode: self.exec_button,
+            TextboxNode: self.exec_textbox,
+            ImageNode: self.exec_image,
+            GUILabelNode: self.exec_gui_label,
+            InputNode: self.exec_input,
+            ShowNode: self.exec_show,
+            HideNode: self.exec_hide,
+            UpdateNode: self.exec_update,
+        }
+        self.expression_handlers = {
+            LiteralNode: self.eval_literal,
+            VariableNode: self.eval_variable,
+            BinaryOpNode: self.eval_binary,
+            UnaryOpNode: self.eval_unary,
+            ListNode: self.eval_list,
+            IndexNode: self.eval_index,
+            FunctionCallNode: self.eval_call,
+        }
+    
+    @property
+    def gui(self):
+        """GUI engine for desktop apps
+
+        Importing it loads tkinter (and PIL, if installed), so text-only
+        scripts never pay for it: the engine is created on first use.
+        """
+        if self._gui is None:
+            from gui_engine import GUIEngine
+            self._gui = GUIEngine(interpreter=self)
+        return self._gui
+    
+    @property
+    def saves(self):
+        """Save slots this interpreter has written or loaded (see save_files)"""
+        if self._saves is None:
+            from save_files import SaveFiles
+            self._saves = SaveFiles()
+        return self._saves
     
     def runtime_error(self, message, node=None, hint=None):
         """Raise a rich runtime error with context"""
@@ -98,337 +213,476 @@ class Interpreter:
             hint=hint or get_hint(message)
         )
     
+    def link(self, statements):
+        """Resolve every goto to its label before the program runs (see story_graph)
+
+        Returns the statements to run, with ifs that hold labels unfolded.
+        Unreachable scenes and duplicate labels are shown as warnings; a
+        goto to a missing label raises QuillSyntaxError. A program that
+        calls undo() or rewind() gets a History here.
+        """
+        from story_graph import StoryGraph, unfolded_positions
+        from history import needs_history
+        graph = StoryGraph(statements, self.source)
+        self.labels = dict(graph.labels)
+        self.unfolded = unfolded_positions(graph.statements)
+        for message in graph.warnings:
+            self.io.notice('warning', message)
+        if self.history is None and needs_history(graph.statements):
+            self.enable_history()
+        return graph.statements
+    
+    def enable_history(self, limit=None):
+        """Take save points at every label and choice from now on; must be called before run()"""
+        from history import History, DEFAULT_LIMIT
+        self.history = History(self, limit or DEFAULT_LIMIT)
+        return self.history
+    
+    def writable_inventory(self):
+        """The inventory list, ready to change: copied first if a save point still holds it"""
+        history = self.history
+        if history is not None and history.inventory_shared:
+            self.inventory = list(self.inventory)
+            history.inventory_shared = False
+        return self.inventory
+    
     def run(self, statements):
-        self.statements = statements
-        
-        # First pass: collect all labels
-        for i, stmt in enumerate(statements):
-            if isinstance(stmt, LabelNode):
-                self.labels[stmt.name] = i
+        statements = self.link(statements)
+        if self.engine == 'vm':
+            from resolver import Resolver
+            from compiler import Compiler
+            from vm import VM
+            compiler = Compiler(count=self.stats is not None, save_points=self.history is not None)
+            VM(self).run(compiler.compile(Resolver().resolve(statements)))
+        elif self.engine == 'closure':
+            from closure_compiler import ClosureCompiler
+            ClosureCompiler(self).run(statements)
+        else:
+            if self.stats is not None:
+                self.count_execution()
+            self.run_tree(statements)
         
-        # Second pass: execute statements
+        # If GUI was used, keep window open
+        if self._gui is not None and self._gui.window is not None:
+            self._gui.run_mainloop()
+    
+    async def run_async(self, statements, io_adapter):
+        """Run statements on the VM from an asyncio event loop
+
+        ask, choice and wait() are suspension points: the VM pauses and this
+        coroutine awaits io_adapter.ask(prompt), io_adapter.choose(options)
+        or asyncio.sleep(seconds), so one event loop can run many scripts at
+        once. Text printed between those points goes to io_adapter.write()
+        (see io_adapters.AsyncIOAdapter). Always uses the VM engine.
+        """
+        import asyncio
+        from contextlib import redirect_stdout
+        from resolver import Resolver
+        from compiler import Compiler
+        from vm import VM
+        from io_adapters import AdapterWriter
+        
+        statements = self.link(statements)
+        compiler = Compiler(count=self.stats is not None, save_points=self.history is not None)
+        code = compiler.compile(Resolver().resolve(statements))
+        vm = VM(self, suspendable=True)
+        writer = AdapterWriter(io_adapter)
+        
+        # Only the synchronous stretches between suspension points print, so
+        # stdout is redirected for those alone and other scripts on the loop
+        # never write into this adapter
+        with redirect_stdout(writer):
+            vm.run(code)
+        while vm.waiting is not None:
+            kind, value = vm.waiting
+            if kind == 'ask':
+                answer = str(await io_adapter.ask(value))
+                with redirect_stdout(writer):
+                    vm.resume(answer)
+            elif kind == 'choice':
+                answer = str(await io_adapter.choose(value))
+                with redirect_stdout(writer):
+                    index = self._choice_index(value, answer)
+                    if index is not None:
+                        vm.resume(value[index])
+            else:
+                await asyncio.sleep(value)
+                with redirect_stdout(writer):
+                    vm.resume(True)
+    
+    def count_execution(self):
+        """Count statements and calls into self.stats by wrapping the tree walker's handlers"""
+        stats = self.stats
+        
+        def counted(handler):
+            def counted_statement(node):
+                stats.statements += 1
+                return handler(node)
+            return counted_statement
+        
+        for node_type, handler in list(self.statement_handlers.items()):
+            self.statement_handlers[node_type] = counted(handler)
+        call_function = self.call_function
+        
+        def counted_call(name, arg_values):
+            stats.calls += 1
+            return call_function(name, arg_values)
+        self.call_function = counted_call
+    
+    def run_tree(self, statements):
+        """Execute statements with the AST-walking engine"""
+        self.statements = statements
         self.current_pos = 0
         while self.current_pos < len(self.statements):
             stmt = self.statements[self.current_pos]
-            self.execute(stmt)
+            signal = self.execute(stmt)
+            if signal is not None:
+                check_stray_signal(signal)
             self.current_pos += 1
-        
-        # If GUI was used, keep window open
-        if self.gui.window is not None:
-            self.gui.run_mainloop()
+    
+    def execute_block(self, statements):
+        """Execute statements in order, stopping at the first control-flow signal"""
+        for stmt in statements:
+            signal = self.execute(stmt)
+            if signal is not None:
+                return signal
+        return None
     
     def execute(self, node):
-        if isinstance(node, SayNode):
-            value = self.evaluate(node.expression)
-            # Color the output in cyan for story text
-            print(colorize(str(value), Colors.CYAN))
-        
-        elif isinstance(node, AskNode):
-            prompt = self.evaluate(node.prompt)
-            # Color the prompt in yellow with a nice arrow
-            colored_prompt = colorize(f"❓ {prompt}", Colors.BRIGHT_YELLOW)
-            try:
-                user_input = input(colored_prompt + colorize(" ➤ ", Colors.BRIGHT_GREEN))
-                self.variables[node.variable] = user_input
-            except EOFError:
-                print(colorize("\n\n⚠ Input ended unexpectedly. Exiting program.", Colors.YELLOW))
-                exit(0)
-        
-        elif isinstance(node, SetNode):
-            value = self.evaluate(node.expression)
-            if isinstance(node.variable, str):
-                self.variables[node.variable] = value
-            elif isinstance(node.variable, IndexNode):
-                # Handle list/string indexing assignment
-                obj = self.evaluate(node.variable.object)
-                index = self.evaluate(node.variable.index)
-                if isinstance(obj, list):
-                    obj[int(index)] = value
-                else:
-                    raise RuntimeError(f"Cannot index assign to {type(obj).__name__}")
+        handler = self.statement_handlers.get(type(node))
+        if handler is not None:
+            return handler(node)
+        return None
+    
+    def exec_say(self, node):
+        value = self.evaluate(node.expression)
+        self.io.say(str(value))
+    
+    def exec_ask(self, node):
+        prompt = self.evaluate(node.prompt)
+        self.variables[node.variable] = self._ask(prompt, node)
+    
+    def exec_set(self, node):
+        value = self.evaluate(node.expression)
+        if isinstance(node.variable, str):
+            self.variables[node.variable] = value
+        elif isinstance(node.variable, IndexNode):
+            # Handle list/string indexing assignment
+            obj = self.evaluate(node.variable.object)
+            index = self.evaluate(node.variable.index)
+            if type(obj) is QuillRange:
+                obj = obj.materialize()
+            if isinstance(obj, list) and self.history is not None:
+                self.history.store_index(obj, int(index), value)
+            elif isinstance(obj, list):
+                obj[int(index)] = value
             else:
-                raise RuntimeError(f"Invalid assignment target")
-        
-        elif isinstance(node, IfNode):
-            condition = self.evaluate(node.condition)
-            if self.is_truthy(condition):
-                for stmt in node.then_block:
-                    self.execute(stmt)
-            elif node.else_block:
-                for stmt in node.else_block:
-                    self.execute(stmt)
-        
-        elif isinstance(node, WhileNode):
-            while self.is_truthy(self.evaluate(node.condition)):
-                try:
-                    for stmt in node.body:
-                        self.execute(stmt)
-                except BreakException:
-                    break
-                except ContinueException:
-                    continue
-        
-        elif isinstance(node, ForNode):
-            iterable = self.evaluate(node.iterable)
-            if not hasattr(iterable, '__iter__'):
-                raise RuntimeError(f"Cannot iterate over {type(iterable).__name__}")
-            
-            for item in iterable:
-                self.variables[node.variable] = item
-                try:
-                    for stmt in node.body:
-                        self.execute(stmt)
-                except BreakException:
+                raise RuntimeError(f"Cannot index assign to {type(obj).__name__}")
+        else:
+            raise RuntimeError(f"Invalid assignment target")
+    
+    def exec_if(self, node):
+        condition = self.evaluate(node.condition)
+        if is_truthy(condition):
+            return self.execute_block(node.then_block)
+        elif node.else_block:
+            return self.execute_block(node.else_block)
+    
+    def exec_while(self, node):
+        while is_truthy(self.evaluate(node.condition)):
+            signal = self.execute_block(node.body)
+            if signal is BREAK_SIGNAL:
+                break
+            if signal is RETURN_SIGNAL:
+                return signal
+    
+    def exec_for(self, node):
+        iterable = self.evaluate(node.iterable)
+        if not hasattr(iterable, '__iter__'):
+            raise RuntimeError(f"Cannot iterate over {type(iterable).__name__}")
+        if type(iterable) is QuillRange:
+            return self.exec_counted_for(node, iterable.sequence())
+        
+        for item in iterable:
+            self.variables[node.variable] = item
+            signal = self.execute_block(node.body)
+            if signal is BREAK_SIGNAL:
+                break
+            if signal is RETURN_SIGNAL:
+                return signal
+    
+    def exec_counted_for(self, node, numbers):
+        """exec_for over a range: count natively and run the body inline"""
+        name = node.variable
+        body = node.body
+        execute = self.execute
+        for number in numbers:
+            # Function calls swap self.variables, so look it up every time
+            self.variables[name] = number
+            for stmt in body:
+                signal = execute(stmt)
+                if signal is not None:
                     break
-                except ContinueException:
-                    continue
-        
-        elif isinstance(node, FunctionNode):
-            # Store function definition
-            func = Function(node.name, node.parameters, node.body, dict(self.variables))
-            self.functions[node.name] = func
-        
-        elif isinstance(node, ReturnNode):
-            value = self.evaluate(node.expression) if node.expression else None
-            raise ReturnException(value)
-        
-        elif isinstance(node, FunctionCallNode):
-            # Execute as statement (ignore return value)
-            self.evaluate(node)
+            else:
+                continue
+            if signal is BREAK_SIGNAL:
+                break
+            if signal is RETURN_SIGNAL:
+                return signal
+    
+    def exec_function(self, node):
+        # Store function definition
+        func = Function(node.name, node.parameters, node.body, dict(self.variables))
+        self.functions[node.name] = func
+    
+    def exec_return(self, node):
+        self.return_value = self.evaluate(node.expression) if node.expression else None
+        return RETURN_SIGNAL
+    
+    def exec_call(self, node):
+        # Execute as statement (ignore return value)
+        self.evaluate(node)
+    
+    def exec_break(self, node):
+        return BREAK_SIGNAL
+    
+    def exec_continue(self, node):
+        return CONTINUE_SIGNAL
+    
+    def exec_choice(self, node):
+        if self.history is not None:
+            self.history.save_point()
+        options_list = [self.evaluate(option) for option in node.options]
+        self.variables['answer'] = self._choose(options_list, node)
+    
+    def exec_goto(self, node):
+        if node.target is None:
+            raise RuntimeError(f"Label '{node.label}' not found")
+        if self.current_pos in self.unfolded and '#' not in node.label:
+            self.goto_target = node.target  # Taken at the unfolded if's end label
+            return
+        self.current_pos = node.target - 1  # -1 because it will be incremented
+    
+    def exec_label(self, node):
+        if self.history is not None:
+            self.history.save_point(node.name)
+        if node.unfolded_from is not None and self.goto_target is not None:
+            self.current_pos = self.goto_target - 1
+            self.goto_target = None
+    
+    # GUI Nodes
+    def exec_window(self, node):
+        title = self.evaluate(node.title)
+        props = self._evaluate_properties(node.properties)
+        self.gui.create_window(title, props)
+    
+    def exec_button(self, node):
+        text = self.evaluate(node.text)
+        props = self._evaluate_properties(node.properties)
+        self.gui.create_button(text, props)
+    
+    def exec_textbox(self, node):
+        text = self.evaluate(node.text)
+        props = self._evaluate_properties(node.properties)
+        self.gui.create_textbox(text, props)
+    
+    def exec_image(self, node):
+        filepath = self.evaluate(node.filepath)
+        props = self._evaluate_properties(node.properties)
+        self.gui.create_image(filepath, props)
+    
+    def exec_gui_label(self, node):
+        text = self.evaluate(node.text)
+        props = self._evaluate_properties(node.properties)
+        self.gui.create_label(text, props)
+    
+    def exec_input(self, node):
+        props = self._evaluate_properties(node.properties)
+        self.gui.create_input(node.variable, props)
+    
+    def exec_show(self, node):
+        self.gui.show_window()
+    
+    def exec_hide(self, node):
+        self.gui.hide_window()
+    
+    def exec_update(self, node):
+        widget_id = node.widget_id
+        new_text = self.evaluate(node.new_text)
+        self.gui.update_textbox(widget_id, new_text)
+    
+    def evaluate(self, node):
+        handler = self.expression_handlers.get(type(node))
+        if handler is not None:
+            return handler(node)
+        return None
+    
+    def eval_literal(self, node):
+        return node.value
+    
+    def eval_variable(self, node):
+        if node.name in self.variables:
+            return self.variables[node.name]
+        else:
+            self.runtime_error(f"Variable '{node.name}' is not defined", node, "Make sure the variable is declared with 'set' before using it")
+    
+    def eval_binary(self, node):
+        left = self.evaluate(node.left)
+        right = self.evaluate(node.right)
         
-        elif isinstance(node, BreakNode):
-            raise BreakException()
+        if node.operator == '/' and right == 0:
+            self.runtime_error("Division by zero", node, "Check that the divisor is not zero before dividing")
         
-        elif isinstance(node, ContinueNode):
-            raise ContinueException()
+        function = BINARY_OPERATORS.get(node.operator)
+        if function is not None:
+            return function(left, right)
+        return None
+    
+    def eval_unary(self, node):
+        operand = self.evaluate(node.operand)
+        if node.operator == 'not':
+            return not is_truthy(operand)
+        elif node.operator == '-':
+            return -operand
+    
+    def eval_list(self, node):
+        return [self.evaluate(elem) for elem in node.elements]
+    
+    def eval_index(self, node):
+        obj = self.evaluate(node.object)
+        index = self.evaluate(node.index)
         
-        elif isinstance(node, ImportNode):
-            # Handle import statements
-            if self.module_loader is None:
-                raise RuntimeError("Module system not available")
-            
+        if type(obj) is QuillRange:
+            obj = obj.sequence()
+        if isinstance(obj, (list, str, range)):
             try:
-                if node.from_import:
-                    # from module import ...
-                    self.module_loader.import_from(node.module_name, node.import_names)
-                    if '*' in node.import_names:
-                        print(f"✓ Imported all from '{node.module_name}'")
-                    else:
-                        print(f"✓ Imported {', '.join(node.import_names)} from '{node.module_name}'")
-                else:
-                    # import module
-                    self.module_loader.import_module(node.module_name, into_globals=False)
-                    print(f"✓ Loaded module '{node.module_name}'")
+                return obj[int(index)]
+            except IndexError:
+                self.runtime_error(f"Index {index} out of range for {type_name(obj)} of length {len(obj)}", node, "Array/string indices must be within bounds (0 to length-1)")
+        else:
+            self.runtime_error(f"Cannot index {type(obj).__name__}", node)
+    
+    def eval_call(self, node):
+        # A missing function or a wrong argument count is reported before any
+        # argument runs; the arguments are then evaluated in the caller's
+        # scope, before the call itself
+        self.check_call(node.name, len(node.arguments))
+        return self.call_function(node.name, [self.evaluate(arg) for arg in node.arguments])
+    
+    def check_call(self, name, argc):
+        """Raise RuntimeError unless name is a builtin or a user function taking argc arguments"""
+        if name in self.builtins:
+            return
+        func = self.functions.get(name)
+        if func is None:
+            raise RuntimeError(f"Function '{name}' is not defined")
+        if argc != len(func.parameters):
+            raise RuntimeError(f"Function '{name}' expects {len(func.parameters)} arguments, got {argc}")
+    
+    def call_function(self, name, arg_values):
+        """Call name with arg_values, already evaluated; eval_call has checked the argument count"""
+        # Check built-in functions first
+        if name in self.builtins:
+            try:
+                return self.builtins[name](*arg_values)
             except Exception as e:
-                self.runtime_error(f"Failed to import module '{node.module_name}': {e}", node)
+                raise RuntimeError(f"Error calling built-in function '{name}': {e}")
         
-        elif isinstance(node, ChoiceNode):
-            # Styled choice menu
-            print(f"\n{colorize('╔═══════════════════════════════╗', Colors.BRIGHT_BLUE)}")
-            print(f"{colorize('║', Colors.BRIGHT_BLUE)} {colorize('Choose an option:', Colors.BOLD + Colors.BRIGHT_CYAN)}          {colorize('║', Colors.BRIGHT_BLUE)}")
-            print(f"{colorize('╚═══════════════════════════════╝', Colors.BRIGHT_BLUE)}")
+        # Check user-defined functions
+        elif name in self.functions:
+            func = self.functions[name]
             
-            options_list = []
-            for i, option in enumerate(node.options, 1):
-                option_text = self.evaluate(option)
-                options_list.append(option_text)
-                # Colorful option list
-                number = colorize(f"{i}.", Colors.BRIGHT_YELLOW)
-                text = colorize(option_text, Colors.CYAN)
-                print(f"  {number} {text}")
+            # Save current variables (the dict itself: a History journals into it)
+            saved_vars = self.variables
             
-            while True:
-                try:
-                    prompt = colorize("\n➤ Enter your choice (number): ", Colors.BRIGHT_GREEN)
-                    choice = input(prompt)
-                    choice_num = int(choice)
-                    if 1 <= choice_num <= len(options_list):
-                        selected = options_list[choice_num - 1]
-                        self.variables['answer'] = selected
-                        print(success(f"You chose: {selected}"))
-                        break
-                    else:
-                        print(warning(f"Please enter a number between 1 and {len(options_list)}"))
-                except ValueError:
-                    print(error("Please enter a valid number"))
-                except EOFError:
-                    print(colorize("\n\n⚠ Input ended unexpectedly. Exiting program.", Colors.YELLOW))
-                    exit(0)
-        
-        elif isinstance(node, GotoNode):
-            if node.label in self.labels:
-                self.current_pos = self.labels[node.label] - 1  # -1 because it will be incremented
-            else:
-                raise RuntimeError(f"Label '{node.label}' not found")
-        
-        elif isinstance(node, LabelNode):
-            pass  # Labels are just markers, nothing to execute
-        
-        # GUI Nodes
-        elif isinstance(node, WindowNode):
-            title = self.evaluate(node.title)
-            props = self._evaluate_properties(node.properties)
-            self.gui.create_window(title, props)
-        
-        elif isinstance(node, ButtonNode):
-            text = self.evaluate(node.text)
-            props = self._evaluate_properties(node.properties)
-            self.gui.create_button(text, props)
-        
-        elif isinstance(node, TextboxNode):
-            text = self.evaluate(node.text)
-            props = self._evaluate_properties(node.properties)
-            self.gui.create_textbox(text, props)
-        
-        elif isinstance(node, ImageNode):
-            filepath = self.evaluate(node.filepath)
-            props = self._evaluate_properties(node.properties)
-            self.gui.create_image(filepath, props)
-        
-        elif isinstance(node, GUILabelNode):
-            text = self.evaluate(node.text)
-            props = self._evaluate_properties(node.properties)
-            self.gui.create_label(text, props)
-        
-        elif isinstance(node, InputNode):
-            props = self._evaluate_properties(node.properties)
-            self.gui.create_input(node.variable, props)
-        
-        elif isinstance(node, ShowNode):
-            self.gui.show_window()
-        
-        elif isinstance(node, HideNode):
-            self.gui.hide_window()
-        
-        elif isinstance(node, UpdateNode):
-            widget_id = node.widget_id
-            new_text = self.evaluate(node.new_text)
-            self.gui.update_textbox(widget_id, new_text)
-    
-    def evaluate(self, node):
-        if isinstance(node, LiteralNode):
-            return node.value
-        
-        elif isinstance(node, VariableNode):
-            if node.name in self.variables:
-                return self.variables[node.name]
-            else:
-                self.runtime_error(f"Variable '{node.name}' is not defined", node, "Make sure the variable is declared with 'set' before using it")
-        
-        elif isinstance(node, BinaryOpNode):
-            left = self.evaluate(node.left)
-            right = self.evaluate(node.right)
+            # Set up function scope with closure
+            self.variables = dict(func.closure)
             
-            if node.operator == '+':
-                # Smart addition: numbers add, strings concatenate
-                if isinstance(left, (int, float)) and isinstance(right, (int, float)):
-                    return left + right
-                else:
-                    return str(left) + str(right)
-            elif node.operator == '-':
-                return left - right
-            elif node.operator == '*':
-                return left * right
-            elif node.operator == '/':
-                if right == 0:
-                    self.runtime_error("Division by zero", node, "Check that the divisor is not zero before dividing")
-                return left / right
-            elif node.operator == '%':
-                return left % right
-            elif node.operator == '**':
-                return left ** right
-            elif node.operator == '==':
-                return left == right
-            elif node.operator == '!=':
-                return left != right
-            elif node.operator == '>':
-                return left > right
-            elif node.operator == '<':
-                return left < right
-            elif node.operator == '>=':
-                return left >= right
-            elif node.operator == '<=':
-                return left <= right
-            elif node.operator == 'and':
-                return self.is_truthy(left) and self.is_truthy(right)
-            elif node.operator == 'or':
-                return self.is_truthy(left) or self.is_truthy(right)
-        
-        elif isinstance(node, UnaryOpNode):
-            operand = self.evaluate(node.operand)
-            if node.operator == 'not':
-                return not self.is_truthy(operand)
-            elif node.operator == '-':
-                return -operand
-        
-        elif isinstance(node, ListNode):
-            return [self.evaluate(elem) for elem in node.elements]
-        
-        elif isinstance(node, IndexNode):
-            obj = self.evaluate(node.object)
-            index = self.evaluate(node.index)
+            # Bind arguments to parameters
+            for param, value in zip(func.parameters, arg_values):
+                self.variables[param] = value
             
-            if isinstance(obj, (list, str)):
-                try:
-                    return obj[int(index)]
-                except IndexError:
-                    self.runtime_error(f"Index {index} out of range for {type(obj).__name__} of length {len(obj)}", node, "Array/string indices must be within bounds (0 to length-1)")
-            else:
-                self.runtime_error(f"Cannot index {type(obj).__name__}", node)
-        
-        elif isinstance(node, FunctionCallNode):
-            # Check built-in functions first
-            if node.name in self.builtins:
-                args = [self.evaluate(arg) for arg in node.arguments]
-                try:
-                    return self.builtins[node.name](*args)
-                except Exception as e:
-                    raise RuntimeError(f"Error calling built-in function '{node.name}': {e}")
+            # Execute function body
+            signal = self.execute_block(func.body)
             
-            # Check user-defined functions
-            elif node.name in self.functions:
-                func = self.functions[node.name]
-                
-                if len(node.arguments) != len(func.parameters):
-                    raise RuntimeError(f"Function '{node.name}' expects {len(func.parameters)} arguments, got {len(node.arguments)}")
-                
-                # Evaluate arguments in current scope
-                arg_values = [self.evaluate(arg) for arg in node.arguments]
-                
-                # Save current variables
-                saved_vars = dict(self.variables)
-                
-                # Set up function scope with closure
-                self.variables = dict(func.closure)
-                
-                # Bind arguments to parameters
-                for param, value in zip(func.parameters, arg_values):
-                    self.variables[param] = value
-                
-                # Execute function body
-                return_value = None
-                try:
-                    for stmt in func.body:
-                        self.execute(stmt)
-                except ReturnException as e:
-                    return_value = e.value
-                
-                # Restore variables
-                self.variables = saved_vars
-                return return_value
-            else:
-                raise RuntimeError(f"Function '{node.name}' is not defined")
-        
-        return None
+            # Restore variables
+            self.variables = saved_vars
+            if signal is RETURN_SIGNAL:
+                return self.return_value
+            if signal is not None:
+                check_stray_signal(signal)
+            return None
+        else:
+            raise RuntimeError(f"Function '{name}' is not defined")
     
     def is_truthy(self, value):
-        if isinstance(value, bool):
-            return value
-        if isinstance(value, (int, float)):
-            return value != 0
-        if isinstance(value, str):
-            return len(value) > 0
-        return False
+        return is_truthy(value)
+    
+    # Statement helpers shared by the tree walker and the VM
+    def _ask(self, prompt, node=None):
+        """Prompt the player and return their answer"""
+        try:
+            return self.io.ask(prompt)
+        except EOFError:
+            raise self._input_ended(node) from None
+    
+    def _choose(self, options_list, node=None):
+        """Show a choice menu and return the selected option"""
+        self.io.show_choices(options_list)
+        while True:
+            try:
+                index = self._choice_index(options_list, self.io.choose(options_list))
+                if index is not None:
+                    return options_list[index]
+            except EOFError:
+                raise self._input_ended(node) from None
+    
+    def _input_ended(self, node):
+        """QuillInputEnded for the ask or choice at node, which got no answer"""
+        from errors import QuillInputEnded
+        self.io.input_ended()
+        line = getattr(node, 'line', 0)
+        source_lines = self.source.split('\n')
+        return QuillInputEnded(
+            "Ran out of answers",
+            line=line,
+            column=getattr(node, 'column', 0),
+            source_line=source_lines[line - 1] if 0 < line <= len(source_lines) else None,
+            hint="Input ended before the story did; give one answer per ask or choice"
+        )
+    
+    def _choice_index(self, options_list, choice):
+        """Index of the option the player's answer picks, or None (after saying why) if it picks none"""
+        try:
+            choice_num = int(choice)
+        except ValueError:
+            self.io.notice('error', "Please enter a valid number")
+            return None
+        if 1 <= choice_num <= len(options_list):
+            self.io.notice('success', f"You chose: {options_list[choice_num - 1]}")
+            return choice_num - 1
+        self.io.notice('warning', f"Please enter a number between 1 and {len(options_list)}")
+        return None
+    
+    def _import(self, node):
+        """Handle import statements"""
+        if self.module_loader is None:
+            raise RuntimeError("Module system not available")
+        
+        try:
+            if node.from_import:
+                # from module import ...
+                self.module_loader.import_from(node.module_name, node.import_names)
+                if '*' in node.import_names:
+                    print(f"✓ Imported all from '{node.module_name}'")
+                else:
+                    print(f"✓ Imported {', '.join(node.import_names)} from '{node.module_name}'")
+            else:
+                # import module
+                self.module_loader.import_module(node.module_name, into_globals=False)
+                print(f"✓ Loaded module '{node.module_name}'")
+        except Exception as e:
+            self.runtime_error(f"Failed to import module '{node.module_name}': {e}", node)
     
     # Timing Functions
     def _wait(self, seconds):
@@ -447,7 +701,7 @@ class Interpreter:
     def _add_item(self, item):
         """Add an item to the inventory"""
         item_name = str(item)
-        self.inventory.append(item_name)
+        self.writable_inventory().append(item_name)
         print(f"✓ Added '{item_name}' to inventory")
         return True
     
@@ -455,7 +709,7 @@ class Interpreter:
         """Remove an item from the inventory"""
         item_name = str(item)
         if item_name in self.inventory:
-            self.inventory.remove(item_name)
+            self.writable_inventory().remove(item_name)
             print(f"✓ Removed '{item_name}' from inventory")
             return True
         else:
@@ -495,7 +749,7 @@ class Interpreter:
     
     def _clear_inventory(self):
         """Clear all items from inventory"""
-        self.inventory.clear()
+        self.writable_inventory().clear()
         print("✓ Inventory cleared")
         return True
     
@@ -503,32 +757,7 @@ class Interpreter:
     def _save_game(self, filename):
         """Save the current game state to a file"""
         try:
-            # Ensure .save extension
-            if not str(filename).endswith('.save'):
-                filename = str(filename) + '.save'
-            
-            # Create saves directory if it doesn't exist
-            saves_dir = 'saves'
-            if not os.path.exists(saves_dir):
-                os.makedirs(saves_dir)
-            
-            filepath = os.path.join(saves_dir, filename)
-            
-            # Prepare save data
-            save_data = {
-                'variables': {},
-                'inventory': self.inventory.copy()
-            }
-            
-            # Save only serializable variables
-            for key, value in self.variables.items():
-                if isinstance(value, (int, float, str, bool, list, dict, type(None))):
-                    save_data['variables'][key] = value
-            
-            # Write to file
-            with open(filepath, 'w', encoding='utf-8') as f:
-                json.dump(save_data, f, indent=2)
-            
+            filepath = self.saves.save(filename, self.variables, self.inventory)
             print(f"💾 Game saved to: {filepath}")
             return True
             
@@ -538,27 +767,22 @@ class Interpreter:
     
     def _load_game(self, filename):
         """Load a saved game state from a file"""
+        from save_files import save_path
         try:
-            # Ensure .save extension
-            if not str(filename).endswith('.save'):
-                filename = str(filename) + '.save'
-            
-            filepath = os.path.join('saves', filename)
+            filepath = save_path(filename)
             
             # Check if file exists
             if not os.path.exists(filepath):
                 print(f"❌ Save file not found: {filepath}")
                 return False
             
-            # Read save file
-            with open(filepath, 'r', encoding='utf-8') as f:
-                save_data = json.load(f)
+            variables, inventory = self.saves.load(filename)
             
             # Restore variables
-            self.variables.update(save_data.get('variables', {}))
+            self.variables.update(variables)
             
             # Restore inventory
-            self.inventory = save_data.get('inventory', [])
+            self.inventory = inventory
             
             print(f"✓ Game loaded from: {filepath}")
             return True
@@ -569,21 +793,14 @@ class Interpreter:
     
     def _has_save(self, filename):
         """Check if a save file exists"""
-        # Ensure .save extension
-        if not str(filename).endswith('.save'):
-            filename = str(filename) + '.save'
-        
-        filepath = os.path.join('saves', filename)
-        return os.path.exists(filepath)
+        from save_files import save_path
+        return os.path.exists(save_path(filename))
     
     def _delete_save(self, filename):
         """Delete a save file"""
+        from save_files import save_path
         try:
-            # Ensure .save extension
-            if not str(filename).endswith('.save'):
-                filename = str(filename) + '.save'
-            
-            filepath = os.path.join('saves', filename)
+            filepath = save_path(filename)
             
             if os.path.exists(filepath):
                 os.remove(filepath)
@@ -0,0 +1,175 @@
+"""
+I/O Adapters for Quill
+How a running script talks to its player: the terminal, scripted answers or an asyncio application
+"""
+
+import sys
+
+from colors import colorize, Colors, success, warning, error
+
+NOTICES = {'success': success, 'warning': warning, 'error': error}
+NOTICE_SYMBOLS = {'success': '✓', 'warning': '⚠', 'error': '✗'}
+
+
+class ConsoleIO:
+    """The terminal, styled the way `quill` has always shown a story (the default)
+
+    Interpreter.io is one of these unless another adapter is passed in.
+    Adapters provide the same methods: say() for story text, ask() and
+    choose() for answers (raising EOFError when there are no more),
+    show_choices() for the menu, notice() for status lines, input_ended()
+    and write() for raw text.
+    """
+
+    def write(self, text):
+        sys.stdout.write(text)
+
+    def say(self, text):
+        # Color the output in cyan for story text
+        print(colorize(text, Colors.CYAN))
+
+    def notice(self, kind, text):
+        """Status line; kind is 'success', 'warning' or 'error'"""
+        print(NOTICES[kind](text))
+
+    def input_ended(self):
+        print(colorize("\n\n⚠ Input ended unexpectedly. Exiting program.", Colors.YELLOW))
+
+    def ask(self, prompt):
+        # Color the prompt in yellow with a nice arrow
+        colored_prompt = colorize(f"❓ {prompt}", Colors.BRIGHT_YELLOW)
+        return input(colored_prompt + colorize(" ➤ ", Colors.BRIGHT_GREEN))
+
+    def show_choices(self, options):
+        # Styled choice menu
+        print(f"\n{colorize('╔═══════════════════════════════╗', Colors.BRIGHT_BLUE)}")
+        print(f"{colorize('║', Colors.BRIGHT_BLUE)} {colorize('Choose an option:', Colors.BOLD + Colors.BRIGHT_CYAN)}          {colorize('║', Colors.BRIGHT_BLUE)}")
+        print(f"{colorize('╚═══════════════════════════════╝', Colors.BRIGHT_BLUE)}")
+
+        for i, option_text in enumerate(options, 1):
+            # Colorful option list
+            number = colorize(f"{i}.", Colors.BRIGHT_YELLOW)
+            text = colorize(option_text, Colors.CYAN)
+            print(f"  {number} {text}")
+
+    def choose(self, options):
+        """Return the player's answer to a choice: an option number, from 1"""
+        return input(colorize("\n➤ Enter your choice (number): ", Colors.BRIGHT_GREEN))
+
+
+class ScriptedIO:
+    """Answers from a list, a file or a callback, and plain output kept in memory
+
+    For batch runs and tests: there is no ANSI styling, no choice menu and
+    no echoed prompt, only story text and status lines. answers is an
+    iterable of strings (a list, the lines of a file) or a callable that
+    is given the prompt, or the list of options, and returns the answer.
+    Running out of answers, or a None answer, ends input like EOF on a
+    terminal. Output collects in self.output unless a stream is given.
+    """
+
+    def __init__(self, answers=(), stream=None):
+        if callable(answers):
+            self.callback = answers
+            self.answers = None
+        else:
+            self.callback = None
+            self.answers = iter(answers)
+        self.output = []
+        # Bound once: say() is the hot path of a batch run
+        self.write = self.output.append if stream is None else stream.write
+
+    @classmethod
+    def from_file(cls, path, stream=None):
+        """Answers are the lines of a text file, one per ask or choice"""
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls(f.read().splitlines(), stream)
+
+    def getvalue(self):
+        """Everything written so far, as one string"""
+        return ''.join(self.output)
+
+    def say(self, text):
+        self.write(text + '\n')
+
+    def notice(self, kind, text):
+        self.write(f"{NOTICE_SYMBOLS[kind]} {text}\n")
+
+    def input_ended(self):
+        self.write("\n⚠ Input ended unexpectedly. Exiting program.\n")
+
+    def ask(self, prompt):
+        return self.next_answer(prompt)
+
+    def show_choices(self, options):
+        pass  # Answers are option numbers; there is nobody to show a menu to
+
+    def choose(self, options):
+        return self.next_answer(options)
+
+    def next_answer(self, question):
+        if self.callback is not None:
+            answer = self.callback(question)
+        else:
+            answer = next(self.answers, None)
+        if answer is None:
+            raise EOFError("No more scripted answers")
+        return str(answer).rstrip('\r\n')
+
+
+class AsyncIOAdapter:
+    """Player I/O for Interpreter.run_async
+
+    run_async awaits ask() and choose() at every `ask` and `choice` and
+    sends everything the script prints to write(). Subclasses override
+    them to talk to a socket, a chat, a test; the defaults use the
+    terminal, reading stdin in a worker thread so the event loop keeps
+    running.
+    """
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+
+    def write(self, text):
+        self.stream.write(text)
+
+    async def ask(self, prompt):
+        """Return the player's answer to prompt"""
+        return await self.read_line(colorize(f"❓ {prompt}", Colors.BRIGHT_YELLOW)
+                                    + colorize(" ➤ ", Colors.BRIGHT_GREEN))
+
+    async def choose(self, options):
+        """Return the player's answer to a choice between options: an option number, from 1
+
+        An answer that is not a valid number is reported and choose() is
+        awaited again.
+        """
+        for i, option in enumerate(options, 1):
+            self.write(f"  {colorize(f'{i}.', Colors.BRIGHT_YELLOW)} {colorize(option, Colors.CYAN)}\n")
+        return await self.read_line(colorize("➤ Enter your choice (number): ", Colors.BRIGHT_GREEN))
+
+    async def read_line(self, prompt):
+        self.write(prompt)
+        self.stream.flush()
+        import asyncio  # Only async runs pay for importing it
+        loop = asyncio.get_event_loop()
+        line = await loop.run_in_executor(None, sys.stdin.readline)
+        if not line:
+            raise EOFError("Input ended unexpectedly")
+        return line.rstrip('\n')
+
+
+class AdapterWriter:
+    """Stands in for sys.stdout and passes printed text to an adapter's write()"""
+    __slots__ = ('adapter',)
+
+    def __init__(self, adapter):
+        self.adapter = adapter
+
+    def write(self, text):
+        if text:
+            self.adapter.write(text)
+        return len(text)
+
+    def flush(self):
+        pass
@@ -0,0 +1,114 @@
+"""
+Lazy Range for Quill
+The value returned by range(): a list that only stores start/stop/step until it is changed
+"""
+
+from parser import FunctionCallNode
+
+
+class QuillRange:
+    """Read-only view of a Python range that acts like a Quill list
+
+    Iterating, len(), indexing and comparisons work straight off the
+    range, so `for i in range(10000000)` never allocates ten million
+    items. Printing and str() show the same text as the equivalent list.
+    The first index assignment materialises the items into a real list,
+    which is used from then on. The engines' index reads and writes go
+    straight to sequence() and materialize() rather than through the
+    methods below.
+    """
+    __slots__ = ('numbers', 'items')
+
+    def __init__(self, *args):
+        self.numbers = range(*args)
+        self.items = None  # The materialised list once the range is mutated
+
+    def materialize(self):
+        """Return the backing list, building it on first use"""
+        if self.items is None:
+            self.items = list(self.numbers)
+        return self.items
+
+    def sequence(self):
+        return self.numbers if self.items is None else self.items
+
+    def __len__(self):
+        return len(self.sequence())
+
+    def __iter__(self):
+        return iter(self.sequence())
+
+    def __reversed__(self):
+        return reversed(self.sequence())
+
+    def __contains__(self, value):
+        return value in self.sequence()
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(self.sequence()[index])
+        return self.sequence()[index]
+
+    def __setitem__(self, index, value):
+        self.materialize()[index] = value
+
+    # Comparisons and repetition behave exactly as they would on the list
+    def __eq__(self, other):
+        if isinstance(other, QuillRange):
+            if self.items is None and other.items is None:
+                return self.numbers == other.numbers
+            return list(self) == list(other)
+        if isinstance(other, list):
+            return len(self) == len(other) and list(self) == other
+        return False
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __lt__(self, other):
+        return list(self) < as_list(other)
+
+    def __le__(self, other):
+        return list(self) <= as_list(other)
+
+    def __gt__(self, other):
+        return list(self) > as_list(other)
+
+    def __ge__(self, other):
+        return list(self) >= as_list(other)
+
+    def __mul__(self, count):
+        return list(self) * count
+
+    __rmul__ = __mul__
+    __hash__ = None  # Unhashable, like a list
+
+    def __str__(self):
+        return str(list(self))
+
+    __repr__ = __str__
+
+
+def as_list(value):
+    """Turn a QuillRange into a plain list; leave anything else unchanged"""
+    return list(value) if isinstance(value, QuillRange) else value
+
+
+def type_name(value):
+    """Name of a value's type as Quill reports it (ranges are lists)"""
+    return 'list' if isinstance(value, (QuillRange, range)) else type(value).__name__
+
+
+def json_default(value):
+    """json.dump hook so ranges are written as lists"""
+    if isinstance(value, QuillRange):
+        return list(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def is_counted_range(node):
+    """True if node is a call like range(stop) or range(start, stop, step)
+
+    The engines give for loops over such a call their counted-loop fast path.
+    """
+    return isinstance(node, FunctionCallNode) and node.name == 'range' and 1 <= len(node.arguments) <= 3
@@ -93,6 +93,8 @@ class TokenType(Enum):
     DOT = auto()
 
 class Token:
+    __slots__ = ('type', 'value', 'line', 'column')
+    
     def __init__(self, type, value, line, column=0):
         self.type = type
         self.value = value
@@ -102,6 +104,49 @@ class Token:
     def __repr__(self):
         return f"Token({self.type}, {self.value}, line {self.line}, col {self.column})"
 
+# Every token the lexer recognises in one pattern, tried left to right at
+# each position. Anything it cannot match (non-ASCII identifiers, bad
+# strings, stray characters) falls back to Lexer.read_token.
+TOKEN_PATTERN = re.compile(r"""
+    (?P<space>[ \t\r]+)
+  | (?P<comment>\#[^\n]*)
+  | (?P<newline>\n)
+  | (?P<identifier>[A-Za-z_]\w*)
+  | (?P<number>[0-9][0-9.]*)
+  | (?P<string>"(?:[^"\\\n]|\\.)*"|'(?:[^'\\\n]|\\.)*')
+  | (?P<operator>\*\*|==|!=|>=|<=|[-+*/%=<>:,()\[\].])
+""", re.VERBOSE | re.DOTALL)
+
+OPERATORS = {
+    '+': TokenType.PLUS,
+    '-': TokenType.MINUS,
+    '*': TokenType.MULTIPLY,
+    '**': TokenType.POWER,
+    '/': TokenType.DIVIDE,
+    '%': TokenType.MODULO,
+    '=': TokenType.ASSIGN,
+    '==': TokenType.EQUALS,
+    '!=': TokenType.NOT_EQUALS,
+    '>': TokenType.GREATER,
+    '>=': TokenType.GREATER_EQUAL,
+    '<': TokenType.LESS,
+    '<=': TokenType.LESS_EQUAL,
+    ':': TokenType.COLON,
+    ',': TokenType.COMMA,
+    '(': TokenType.LPAREN,
+    ')': TokenType.RPAREN,
+    '[': TokenType.LBRACKET,
+    ']': TokenType.RBRACKET,
+    '.': TokenType.DOT,
+}
+
+ESCAPE_PATTERN = re.compile(r'\\(.)', re.DOTALL)
+
+def unescape(match):
+    """\\n and \\t become newline and tab; any other escaped character stands for itself"""
+    char = match.group(1)
+    return {'n': '\n', 't': '\t'}.get(char, char)
+
 class Lexer:
     def __init__(self, source):
         self.source = source
@@ -270,9 +315,9 @@ class Lexer:
         """Get current column (1-indexed)"""
         return self.pos - self.line_start_pos + 1
     
-    def add_token(self, token_type, value):
-        """Helper to add a token with current line and column"""
-        self.tokens.append(Token(token_type, value, self.line, self.get_column()))
+    def make_token(self, token_type, value):
+        """Helper to build a token with current line and column"""
+        return Token(token_type, value, self.line, self.get_column())
     
     def read_string(self):
         start_line = self.line
@@ -339,156 +384,100 @@ class Lexer:
         return value
     
     def tokenize(self):
-        while self.pos < len(self.source):
-            self.skip_whitespace()
-            
-            if not self.current_char():
-                break
-            
-            # Comments
-            if self.current_char() == '#':
-                self.skip_comment()
-                continue
-            
-            # Newlines
-            if self.current_char() == '\n':
-                self.add_token(TokenType.NEWLINE, '\n')
-                self.advance()
-                continue
-            
-            # Strings
-            if self.current_char() in '"\'':
-                value = self.read_string()
-                self.add_token(TokenType.STRING, value)
-                continue
-            
-            # Numbers
-            if self.current_char().isdigit():
-                value = self.read_number()
-                self.add_token(TokenType.NUMBER, value)
-                continue
-            
-            # Operators and punctuation
-            if self.current_char() == '+':
-                self.add_token(TokenType.PLUS, '+')
-                self.advance()
-                continue
-            
-            if self.current_char() == '-':
-                self.add_token(TokenType.MINUS, '-')
-                self.advance()
-                continue
-            
-            if self.current_char() == '*':
-                if self.peek_char() == '*':
-                    self.add_token(TokenType.POWER, '**')
-                    self.advance()
-                    self.advance()
-                else:
-                    self.add_token(TokenType.MULTIPLY, '*')
-                    self.advance()
-                continue
-            
-            if self.current_char() == '/':
-                self.add_token(TokenType.DIVIDE, '/')
-                self.advance()
-                continue
-            
-            if self.current_char() == '%':
-                self.add_token(TokenType.MODULO, '%')
-                self.advance()
-                continue
-            
-            if self.current_char() == '=':
-                if self.peek_char() == '=':
-                    self.add_token(TokenType.EQUALS, '==')
-                    self.advance()
-                    self.advance()
-                else:
-                    self.add_token(TokenType.ASSIGN, '=')
-                    self.advance()
-                continue
-            
-            if self.current_char() == '!':
-                if self.peek_char() == '=':
-                    self.add_token(TokenType.NOT_EQUALS, '!=')
-                    self.advance()
-                    self.advance()
-                    continue
-            
-            if self.current_char() == '>':
-                if self.peek_char() == '=':
-                    self.add_token(TokenType.GREATER_EQUAL, '>=')
-                    self.advance()
-                    self.advance()
-                else:
-                    self.add_token(TokenType.GREATER, '>')
-                    self.advance()
-                continue
-            
-            if self.current_char() == '<':
-                if self.peek_char() == '=':
-                    self.add_token(TokenType.LESS_EQUAL, '<=')
-                    self.advance()
-                    self.advance()
-                else:
-                    self.add_token(TokenType.LESS, '<')
-                    self.advance()
-                continue
-            
-            if self.current_char() == ':':
-                self.add_token(TokenType.COLON, ':')
-                self.advance()
-                continue
-            
-            if self.current_char() == ',':
-                self.add_token(TokenType.COMMA, ',')
-                self.advance()
-                continue
-            
-            if self.current_char() == '(':
-                self.add_token(TokenType.LPAREN, '(')
-                self.advance()
-                continue
-            
-            if self.current_char() == ')':
-                self.add_token(TokenType.RPAREN, ')')
-                self.advance()
-                continue
-            
-            if self.current_char() == '[':
-                self.add_token(TokenType.LBRACKET, '[')
-                self.advance()
-                continue
-            
-            if self.current_char() == ']':
-                self.add_token(TokenType.RBRACKET, ']')
-                self.advance()
-                continue
-            
-            if self.current_char() == '.':
-                self.add_token(TokenType.DOT, '.')
-                self.advance()
-                continue
-            
-            # Identifiers and keywords
-            if self.current_char().isalpha() or self.current_char() == '_':
-                value = self.read_identifier()
-                token_type = self.keywords.get(value.lower(), TokenType.IDENTIFIER)
-                self.add_token(token_type, value)
-                continue
+        """Tokenize the whole source, returning the list of tokens"""
+        self.tokens.extend(self.iter_tokens())
+        return self.tokens
+    
+    def iter_tokens(self):
+        """Yield tokens one at a time as the source is scanned, ending with EOF
+        
+        Lets the parser start work before the whole file is tokenized,
+        without keeping every token in memory.
+        """
+        source = self.source
+        length = len(source)
+        keywords = self.keywords
+        match = TOKEN_PATTERN.match
+        pos = self.pos
+        line = self.line
+        line_start = self.line_start_pos
+        
+        while pos < length:
+            m = match(source, pos)
+            kind = m.lastgroup if m else None
+            
+            if kind == 'space' or kind == 'comment':
+                pos = m.end()
+            
+            elif kind == 'identifier':
+                value = m.group()
+                pos = m.end()
+                token_type = keywords.get(value.lower(), TokenType.IDENTIFIER)
+                yield Token(token_type, value, line, pos - line_start + 1)
+            
+            elif kind == 'newline':
+                yield Token(TokenType.NEWLINE, '\n', line, pos - line_start + 1)
+                pos += 1
+                line += 1
+                line_start = pos
+            
+            elif kind == 'operator':
+                value = m.group()
+                yield Token(OPERATORS[value], value, line, pos - line_start + 1)
+                pos = m.end()
+            
+            elif kind == 'string':
+                raw = m.group()
+                pos = m.end()
+                value = raw[1:-1]
+                if '\\' in value:
+                    # A backslash may escape a newline, continuing the string on the next line
+                    newlines = value.count('\n')
+                    if newlines:
+                        line += newlines
+                        line_start = m.start() + raw.rindex('\n') + 1
+                    value = ESCAPE_PATTERN.sub(unescape, value)
+                yield Token(TokenType.STRING, value, line, pos - line_start + 1)
+            
+            elif kind == 'number' and not (m.end() < length and source[m.end()] > '\x7f'):
+                value = m.group()
+                pos = m.end()
+                yield Token(TokenType.NUMBER, float(value) if '.' in value else int(value),
+                            line, pos - line_start + 1)
             
-            # Unknown character error
-            from errors import QuillSyntaxError
-            source_lines = self.source.split('\n')
-            source_line = source_lines[self.line - 1] if self.line <= len(source_lines) else ""
-            raise QuillSyntaxError(
-                f"Unknown character '{self.current_char()}'",
-                line=self.line,
-                column=self.get_column(),
-                source_line=source_line,
-                hint="Check for typos or unsupported characters"
-            )
+            else:
+                # Non-ASCII identifiers and digits, unterminated strings and
+                # unknown characters go through the character-by-character reader
+                self.pos, self.line, self.line_start_pos = pos, line, line_start
+                yield self.read_token()
+                pos, line, line_start = self.pos, self.line, self.line_start_pos
         
-        self.add_token(TokenType.EOF, None)
-        return self.tokens
+        self.pos, self.line, self.line_start_pos = pos, line, line_start
+        yield self.make_token(TokenType.EOF, None)
+    
+    def read_token(self):
+        """Read one string, number or identifier token starting at self.pos"""
+        if self.current_char() in '"\'':
+            value = self.read_string()
+            return self.make_token(TokenType.STRING, value)
+        
+        if self.current_char().isdigit():
+            value = self.read_number()
+            return self.make_token(TokenType.NUMBER, value)
+        
+        if self.current_char().isalpha() or self.current_char() == '_':
+            value = self.read_identifier()
+            token_type = self.keywords.get(value.lower(), TokenType.IDENTIFIER)
+            return self.make_token(token_type, value)
+        
+        # Unknown character error
+        from errors import QuillSyntaxError
+        source_lines = self.source.split('\n')
+        source_line = source_lines[self.line - 1] if self.line <= len(source_lines) else ""
+        raise QuillSyntaxError(
+            f"Unknown character '{self.current_char()}'",
+            line=self.line,
+            column=self.get_column(),
+            source_line=source_line,
+            hint="Check for typos or unsupported characters"
+        )
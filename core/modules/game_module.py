@@ -10,8 +10,8 @@ def get_game_functions(interpreter):
     Requires interpreter instance for inventory, save/load, and timing
     """
     import time
-    import json
     import os
+    from save_files import save_path
     
     # Timing Functions
     def wait(seconds):
@@ -19,6 +19,10 @@ def get_game_functions(interpreter):
         try:
             delay = float(seconds)
             if delay > 0:
+                if interpreter.suspendable:
+                    # Sessions and run_async pause the VM instead of blocking
+                    from vm import Suspend
+                    raise Suspend(('wait', delay))
                 time.sleep(delay)
                 return True
             return False
@@ -30,7 +34,7 @@ def get_game_functions(interpreter):
     def add_item(item):
         """Add an item to the inventory"""
         item_name = str(item)
-        interpreter.inventory.append(item_name)
+        interpreter.writable_inventory().append(item_name)
         print(f"✓ Added '{item_name}' to inventory")
         return True
     
@@ -38,7 +42,7 @@ def get_game_functions(interpreter):
         """Remove an item from the inventory"""
         item_name = str(item)
         if item_name in interpreter.inventory:
-            interpreter.inventory.remove(item_name)
+            interpreter.writable_inventory().remove(item_name)
             print(f"✓ Removed '{item_name}' from inventory")
             return True
         else:
@@ -78,7 +82,7 @@ def get_game_functions(interpreter):
     
     def clear_inventory():
         """Clear all items from inventory"""
-        interpreter.inventory.clear()
+        interpreter.writable_inventory().clear()
         print("✓ Inventory cleared")
         return True
     
@@ -90,32 +94,7 @@ def get_game_functions(interpreter):
     def save_game(filename):
         """Save the current game state to a file"""
         try:
-            # Ensure .save extension
-            if not str(filename).endswith('.save'):
-                filename = str(filename) + '.save'
-            
-            # Create saves directory if it doesn't exist
-            saves_dir = 'saves'
-            if not os.path.exists(saves_dir):
-                os.makedirs(saves_dir)
-            
-            filepath = os.path.join(saves_dir, filename)
-            
-            # Prepare save data
-            save_data = {
-                'variables': {},
-                'inventory': interpreter.inventory.copy()
-            }
-            
-            # Save only serializable variables
-            for key, value in interpreter.variables.items():
-                if isinstance(value, (int, float, str, bool, list, dict, type(None))):
-                    save_data['variables'][key] = value
-            
-            # Write to file
-            with open(filepath, 'w', encoding='utf-8') as f:
-                json.dump(save_data, f, indent=2)
-            
+            filepath = interpreter.saves.save(filename, interpreter.variables, interpreter.inventory)
             print(f"💾 Game saved to: {filepath}")
             return True
             
@@ -126,26 +105,20 @@ def get_game_functions(interpreter):
     def load_game(filename):
         """Load a saved game state from a file"""
         try:
-            # Ensure .save extension
-            if not str(filename).endswith('.save'):
-                filename = str(filename) + '.save'
-            
-            filepath = os.path.join('saves', filename)
+            filepath = save_path(filename)
             
             # Check if file exists
             if not os.path.exists(filepath):
                 print(f"❌ Save file not found: {filepath}")
                 return False
             
-            # Read save file
-            with open(filepath, 'r', encoding='utf-8') as f:
-                save_data = json.load(f)
+            variables, inventory = interpreter.saves.load(filename)
             
             # Restore variables
-            interpreter.variables.update(save_data.get('variables', {}))
+            interpreter.variables.update(variables)
             
             # Restore inventory
-            interpreter.inventory = save_data.get('inventory', [])
+            interpreter.inventory = inventory
             
             print(f"✓ Game loaded from: {filepath}")
             return True
@@ -156,21 +129,12 @@ def get_game_functions(interpreter):
     
     def has_save(filename):
         """Check if a save file exists"""
-        # Ensure .save extension
-        if not str(filename).endswith('.save'):
-            filename = str(filename) + '.save'
-        
-        filepath = os.path.join('saves', filename)
-        return os.path.exists(filepath)
+        return os.path.exists(save_path(filename))
     
     def delete_save(filename):
         """Delete a save file"""
         try:
-            # Ensure .save extension
-            if not str(filename).endswith('.save'):
-                filename = str(filename) + '.save'
-            
-            filepath = os.path.join('saves', filename)
+            filepath = save_path(filename)
             
             if os.path.exists(filepath):
                 os.remove(filepath)
@@ -184,6 +148,21 @@ def get_game_functions(interpreter):
             print(f"❌ Error deleting save: {e}")
             return False
     
+    # Undo/Rewind Methods (save points are taken at every label and choice)
+    def undo():
+        """Put variables and inventory back as they were before the previous choice"""
+        if interpreter.history is None or not interpreter.history.undo():
+            print("✗ Nothing to undo")
+            return False
+        return True
+    
+    def rewind(label):
+        """Put variables and inventory back as they were when the story last entered a label"""
+        if interpreter.history is None or not interpreter.history.rewind(str(label)):
+            print(f"✗ The story has not reached label '{label}' yet")
+            return False
+        return True
+    
     return {
         # Timing
         'wait': wait,
@@ -199,4 +178,7 @@ def get_game_functions(interpreter):
         'load_game': load_game,
         'has_save': has_save,
         'delete_save': delete_save,
+        # Undo/Rewind
+        'undo': undo,
+        'rewind': rewind,
     }
@@ -0,0 +1,107 @@
+"""
+AST Optimizer for Quill
+Folds constant expressions and removes dead branches between parsing and execution
+"""
+
+from parser import *
+from interpreter import BINARY_OPERATORS, is_truthy
+from story_graph import walk
+
+# Folding must never be slower or bigger than just running the program
+MAX_FOLDED_LENGTH = 10000  # Longest string or list a fold may produce
+MAX_FOLDED_EXPONENT = 256  # Largest integer exponent folded for '**'
+
+
+class Optimizer:
+    """Rewrites a parsed program in place using only compile-time facts
+
+    - BinaryOpNode and UnaryOpNode trees whose operands are all literals
+      become a single LiteralNode, computed with the same operator table
+      (and therefore the same semantics) as Interpreter.evaluate. Anything
+      that would raise at runtime, such as division by zero or adding a
+      number to None, is left alone so the error still happens, with its
+      location, when the line runs.
+    - An IfNode with a literal condition is replaced by the statements of
+      the branch that will run, and a WhileNode with a false literal
+      condition is dropped. An if or while with a label or goto anywhere
+      inside it, nested blocks included, is kept as it is: a goto can jump
+      into a branch that its condition skips (story_graph unfolds such ifs),
+      and story_graph still has to check the labels and gotos of a loop
+      that never runs.
+    """
+
+    def optimize(self, statements):
+        """Optimize a list of statements and return the new list"""
+        return self.optimize_block(statements)
+
+    def optimize_block(self, statements):
+        result = []
+        for stmt in statements:
+            stmt = self.optimize_node(stmt)
+            if isinstance(stmt, IfNode) and isinstance(stmt.condition, LiteralNode):
+                if not has_jumps(stmt):
+                    result.extend(stmt.then_block if is_truthy(stmt.condition.value) else (stmt.else_block or []))
+                    continue
+            elif isinstance(stmt, WhileNode) and isinstance(stmt.condition, LiteralNode):
+                if not is_truthy(stmt.condition.value) and not has_jumps(stmt):
+                    continue
+            result.append(stmt)
+        return result
+
+    def optimize_node(self, node):
+        """Optimize node's children, then fold node itself if possible"""
+        for name in node.fields():
+            value = getattr(node, name, None)
+            if isinstance(value, ASTNode):
+                setattr(node, name, self.optimize_node(value))
+            elif isinstance(value, list) and any(isinstance(item, ASTNode) for item in value):
+                setattr(node, name, self.optimize_block(value))
+
+        if isinstance(node, BinaryOpNode):
+            return self.fold_binary(node)
+        if isinstance(node, UnaryOpNode):
+            return self.fold_unary(node)
+        return node
+
+    def fold_binary(self, node):
+        if not (isinstance(node.left, LiteralNode) and isinstance(node.right, LiteralNode)):
+            return node
+        function = BINARY_OPERATORS.get(node.operator)
+        left = node.left.value
+        right = node.right.value
+        if function is None or not self.cheap_to_fold(node.operator, left, right):
+            return node
+        if node.operator == '/' and right == 0:
+            return node  # Leave the division-by-zero error to runtime
+        try:
+            value = function(left, right)
+        except Exception:
+            return node
+        if isinstance(value, str) and len(value) > MAX_FOLDED_LENGTH:
+            return node
+        return LiteralNode(value).set_location(node)
+
+    def fold_unary(self, node):
+        if not isinstance(node.operand, LiteralNode):
+            return node
+        value = node.operand.value
+        if node.operator == 'not':
+            return LiteralNode(not is_truthy(value)).set_location(node)
+        if node.operator == '-' and isinstance(value, (int, float)):
+            return LiteralNode(-value).set_location(node)
+        return node
+
+    def cheap_to_fold(self, operator, left, right):
+        """Reject folds whose result could be huge or slow to compute"""
+        if operator == '**':
+            return not (isinstance(right, int) and abs(right) > MAX_FOLDED_EXPONENT)
+        if operator == '*':
+            for sequence, count in ((left, right), (right, left)):
+                if isinstance(sequence, str) and isinstance(count, int):
+                    return len(sequence) * count <= MAX_FOLDED_LENGTH
+        return True
+
+
+def has_jumps(node):
+    """Whether a label or goto is anywhere inside node"""
+    return any(isinstance(inner, (LabelNode, GotoNode)) for inner in walk(node))
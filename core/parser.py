@@ -3,114 +3,227 @@ Parser for Quill
 Builds an Abstract Syntax Tree (AST) from tokens
 """
 
+from collections import deque
+
 from lexer import TokenType, Token
 
 class ASTNode:
-    """Base class for AST nodes with optional line/column tracking"""
-    def __init__(self):
-        self.line = 0
-        self.column = 0
+    """Base class for AST nodes with line/column tracking (0 when unknown)
+    
+    Nodes use __slots__ to keep large parsed scripts compact, so every field
+    a node can carry (including annotations added by resolver.py) must be
+    listed in its class's __slots__.
+    """
+    __slots__ = ('line', 'column')
+    
+    def __init__(self, line=0, column=0):
+        self.line = line
+        self.column = column
     
     def set_location(self, token):
-        """Set location from a token"""
+        """Set location from a token (or another node)"""
         if token:
             self.line = token.line
             self.column = token.column
         return self
+    
+    def fields(self):
+        """Names of the node's own fields, in declaration order (location excluded)"""
+        return [name for cls in reversed(type(self).__mro__)
+                for name in getattr(cls, '__slots__', ()) if name not in ASTNode.__slots__]
+
+def dump_ast(nodes):
+    """Return an indented, human-readable listing of a list of nodes"""
+    lines = []
+    for node in nodes:
+        _dump_node(node, '', 0, lines)
+    return '\n'.join(lines)
+
+def _dump_node(node, label, depth, lines):
+    pad = '  ' * depth
+    if not isinstance(node, ASTNode):
+        lines.append(f"{pad}{label}{node!r}")
+        return
+    
+    # Plain values go on the node's own line, child nodes underneath
+    values = []
+    children = []
+    for name in node.fields():
+        value = getattr(node, name, None)
+        if isinstance(value, ASTNode) or (isinstance(value, list) and
+                                          any(isinstance(item, ASTNode) for item in value)):
+            children.append((name, value))
+        elif value is not None:
+            values.append(f"{name}={value!r}")
+    lines.append(f"{pad}{label}{type(node).__name__} [{node.line}:{node.column}] {' '.join(values)}".rstrip())
+    
+    for name, value in children:
+        if isinstance(value, list):
+            lines.append(f"{pad}  {name}:")
+            for item in value:
+                _dump_node(item, '- ', depth + 2, lines)
+        else:
+            _dump_node(value, f"{name}: ", depth + 1, lines)
 
 class SayNode(ASTNode):
+    __slots__ = ('expression',)
+    
     def __init__(self, expression):
+        super().__init__()
         self.expression = expression
 
 class AskNode(ASTNode):
+    __slots__ = ('prompt', 'variable', 'slot')
+    
     def __init__(self, prompt, variable):
+        super().__init__()
         self.prompt = prompt
         self.variable = variable
+        self.slot = None  # Frame slot of variable, set by the resolver
 
 class SetNode(ASTNode):
+    __slots__ = ('variable', 'expression', 'slot')
+    
     def __init__(self, variable, expression):
+        super().__init__()
         self.variable = variable
         self.expression = expression
+        self.slot = None
 
 class IfNode(ASTNode):
+    __slots__ = ('condition', 'then_block', 'else_block')
+    
     def __init__(self, condition, then_block, else_block=None):
+        super().__init__()
         self.condition = condition
         self.then_block = then_block
         self.else_block = else_block
 
 class ChoiceNode(ASTNode):
+    __slots__ = ('options', 'slot')
+    
     def __init__(self, options):
+        super().__init__()
         self.options = options
+        self.slot = None
 
 class GotoNode(ASTNode):
-    def __init__(self, label):
+    __slots__ = ('label', 'target')
+    
+    def __init__(self, label, target=None):
+        super().__init__()
         self.label = label
+        self.target = target  # Index of the label among the top-level statements (see story_graph)
 
 class LabelNode(ASTNode):
+    __slots__ = ('name', 'unfolded_from')
+    
     def __init__(self, name):
+        super().__init__()
         self.name = name
+        self.unfolded_from = None  # Set on the end label of an if unfolded by story_graph
 
 class BinaryOpNode(ASTNode):
+    __slots__ = ('left', 'operator', 'right')
+    
     def __init__(self, left, operator, right):
+        # Located at the left operand unless the parser has something better
+        super().__init__(left.line, left.column)
         self.left = left
         self.operator = operator
         self.right = right
 
 class LiteralNode(ASTNode):
+    __slots__ = ('value',)
+    
     def __init__(self, value):
+        super().__init__()
         self.value = value
 
 class VariableNode(ASTNode):
+    __slots__ = ('name', 'slot')
+    
     def __init__(self, name):
+        super().__init__()
         self.name = name
+        self.slot = None
 
 class WhileNode(ASTNode):
+    __slots__ = ('condition', 'body')
+    
     def __init__(self, condition, body):
+        super().__init__()
         self.condition = condition
         self.body = body
 
 class ForNode(ASTNode):
+    __slots__ = ('variable', 'iterable', 'body', 'slot')
+    
     def __init__(self, variable, iterable, body):
+        super().__init__()
         self.variable = variable
         self.iterable = iterable
         self.body = body
+        self.slot = None
 
 class FunctionNode(ASTNode):
+    __slots__ = ('name', 'parameters', 'body', 'slot_names', 'captures')
+    
     def __init__(self, name, parameters, body):
+        super().__init__()
         self.name = name
         self.parameters = parameters
         self.body = body
+        self.slot_names = None  # Frame layout, set by the resolver
+        self.captures = None
 
 class ReturnNode(ASTNode):
+    __slots__ = ('expression',)
+    
     def __init__(self, expression):
+        super().__init__()
         self.expression = expression
 
 class FunctionCallNode(ASTNode):
+    __slots__ = ('name', 'arguments')
+    
     def __init__(self, name, arguments):
+        super().__init__()
         self.name = name
         self.arguments = arguments
 
 class ListNode(ASTNode):
+    __slots__ = ('elements',)
+    
     def __init__(self, elements):
+        super().__init__()
         self.elements = elements
 
 class IndexNode(ASTNode):
+    __slots__ = ('object', 'index')
+    
     def __init__(self, object, index):
+        super().__init__(object.line, object.column)
         self.object = object
         self.index = index
 
 class BreakNode(ASTNode):
-    pass
+    __slots__ = ()
 
 class ContinueNode(ASTNode):
-    pass
+    __slots__ = ()
 
 class UnaryOpNode(ASTNode):
+    __slots__ = ('operator', 'operand')
+    
     def __init__(self, operator, operand):
+        super().__init__()
         self.operator = operator
         self.operand = operand
 
 class ImportNode(ASTNode):
+    __slots__ = ('module_name', 'from_import', 'import_names')
+    
     def __init__(self, module_name, from_import=False, import_names=None):
         super().__init__()
         self.module_name = module_name
@@ -119,66 +232,100 @@ class ImportNode(ASTNode):
 
 # GUI Nodes
 class WindowNode(ASTNode):
+    __slots__ = ('title', 'properties')
+    
     def __init__(self, title, properties=None):
+        super().__init__()
         self.title = title
         self.properties = properties or {}
 
 class ButtonNode(ASTNode):
+    __slots__ = ('text', 'properties')
+    
     def __init__(self, text, properties=None):
+        super().__init__()
         self.text = text
         self.properties = properties or {}
 
 class TextboxNode(ASTNode):
+    __slots__ = ('text', 'properties')
+    
     def __init__(self, text, properties=None):
+        super().__init__()
         self.text = text
         self.properties = properties or {}
 
 class ImageNode(ASTNode):
+    __slots__ = ('filepath', 'properties')
+    
     def __init__(self, filepath, properties=None):
+        super().__init__()
         self.filepath = filepath
         self.properties = properties or {}
 
 class GUILabelNode(ASTNode):
+    __slots__ = ('text', 'properties')
+    
     def __init__(self, text, properties=None):
+        super().__init__()
         self.text = text
         self.properties = properties or {}
 
 class InputNode(ASTNode):
+    __slots__ = ('variable', 'properties')
+    
     def __init__(self, variable, properties=None):
+        super().__init__()
         self.variable = variable
         self.properties = properties or {}
 
 class ShowNode(ASTNode):
-    def __init__(self):
-        pass
+    __slots__ = ()
 
 class HideNode(ASTNode):
-    def __init__(self):
-        pass
+    __slots__ = ()
 
 class UpdateNode(ASTNode):
+    __slots__ = ('widget_id', 'new_text')
+    
     def __init__(self, widget_id, new_text):
+        super().__init__()
         self.widget_id = widget_id
         self.new_text = new_text
 
 class Parser:
     def __init__(self, tokens, source=""):
-        self.tokens = tokens
-        self.pos = 0
+        # Any iterable of tokens ending in EOF: a list from Lexer.tokenize()
+        # or the Lexer.iter_tokens() stream, read only as far as needed
+        self.tokens = iter(tokens)
+        self.lookahead = deque()  # Tokens read from the stream but not yet consumed
+        self.pos = 0  # Number of tokens consumed
         self.source = source  # Store source for error context
     
+    def fill(self, count):
+        """Make sure the lookahead buffer holds at least count tokens"""
+        lookahead = self.lookahead
+        while len(lookahead) < count:
+            if lookahead and lookahead[-1].type == TokenType.EOF:
+                lookahead.append(lookahead[-1])  # Past the end, keep returning EOF
+            else:
+                lookahead.append(next(self.tokens))
+    
     def current_token(self):
-        if self.pos >= len(self.tokens):
-            return self.tokens[-1]  # Return EOF
-        return self.tokens[self.pos]
+        if not self.lookahead:
+            self.fill(1)
+        return self.lookahead[0]
     
     def peek_token(self, offset=1):
-        pos = self.pos + offset
-        if pos >= len(self.tokens):
-            return self.tokens[-1]
-        return self.tokens[pos]
+        if len(self.lookahead) <= offset:
+            self.fill(offset + 1)
+        return self.lookahead[offset]
     
     def advance(self):
+        if not self.lookahead:
+            self.fill(1)
+        if self.lookahead[0].type != TokenType.EOF:
+            self.lookahead.popleft()
         self.pos += 1
     
     def expect(self, token_type):
@@ -216,7 +363,12 @@ class Parser:
     
     def parse_statement(self):
         token = self.current_token()
-        
+        node = self.parse_statement_at(token)
+        if node is not None and not node.line:
+            node.set_location(token)  # Statements are located at their first token
+        return node
+    
+    def parse_statement_at(self, token):
         if token.type == TokenType.SAY:
             return self.parse_say()
         elif token.type == TokenType.ASK:
@@ -520,7 +672,7 @@ class Parser:
         return SetNode(variable, expression)
     
     def parse_index_assignment(self):
-        variable = self.expect(TokenType.IDENTIFIER).value
+        name_token = self.expect(TokenType.IDENTIFIER)
         self.expect(TokenType.LBRACKET)
         index = self.parse_expression()
         self.expect(TokenType.RBRACKET)
@@ -528,7 +680,7 @@ class Parser:
         value = self.parse_expression()
         
         # Create a special node for index assignment
-        index_node = IndexNode(VariableNode(variable), index)
+        index_node = IndexNode(VariableNode(name_token.value).set_location(name_token), index)
         return SetNode(index_node, value)
     
     def parse_expression(self):
@@ -638,14 +790,15 @@ class Parser:
         return left
     
     def parse_unary(self):
-        if self.current_token().type == TokenType.NOT:
+        token = self.current_token()
+        if token.type == TokenType.NOT:
             self.advance()
             operand = self.parse_unary()
-            return UnaryOpNode('not', operand)
-        elif self.current_token().type == TokenType.MINUS:
+            return UnaryOpNode('not', operand).set_location(token)
+        elif token.type == TokenType.MINUS:
             self.advance()
             operand = self.parse_unary()
-            return UnaryOpNode('-', operand)
+            return UnaryOpNode('-', operand).set_location(token)
         
         return self.parse_postfix()
     
@@ -654,10 +807,11 @@ class Parser:
         
         while True:
             if self.current_token().type == TokenType.LBRACKET:
+                bracket = self.current_token()
                 self.advance()
                 index = self.parse_expression()
                 self.expect(TokenType.RBRACKET)
-                expr = IndexNode(expr, index)
+                expr = IndexNode(expr, index).set_location(bracket)
             elif self.current_token().type == TokenType.LPAREN:
                 # Function call
                 self.advance()
@@ -670,7 +824,7 @@ class Parser:
                 self.expect(TokenType.RPAREN)
                 
                 if isinstance(expr, VariableNode):
-                    expr = FunctionCallNode(expr.name, arguments)
+                    expr = FunctionCallNode(expr.name, arguments).set_location(expr)
                 else:
                     raise SyntaxError(f"Cannot call non-function at line {self.current_token().line}")
             else:
@@ -683,19 +837,19 @@ class Parser:
         
         if token.type == TokenType.STRING:
             self.advance()
-            return LiteralNode(token.value)
+            return LiteralNode(token.value).set_location(token)
         elif token.type == TokenType.NUMBER:
             self.advance()
-            return LiteralNode(token.value)
+            return LiteralNode(token.value).set_location(token)
         elif token.type == TokenType.TRUE:
             self.advance()
-            return LiteralNode(True)
+            return LiteralNode(True).set_location(token)
         elif token.type == TokenType.FALSE:
             self.advance()
-            return LiteralNode(False)
+            return LiteralNode(False).set_location(token)
         elif token.type == TokenType.NULL:
             self.advance()
-            return LiteralNode(None)
+            return LiteralNode(None).set_location(token)
         elif token.type == TokenType.LBRACKET:
             return self.parse_list()
         elif token.type == TokenType.LPAREN:
@@ -710,7 +864,7 @@ class Parser:
             raise SyntaxError(f"Unexpected token {token.type} at line {token.line}")
     
     def parse_list(self):
-        self.expect(TokenType.LBRACKET)
+        bracket = self.expect(TokenType.LBRACKET)
         elements = []
         
         if self.current_token().type != TokenType.RBRACKET:
@@ -722,7 +876,7 @@ class Parser:
                 elements.append(self.parse_expression())
         
         self.expect(TokenType.RBRACKET)
-        return ListNode(elements)
+        return ListNode(elements).set_location(bracket)
     
     # GUI Parsing Methods
     def parse_window(self):
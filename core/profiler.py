@@ -0,0 +1,210 @@
+"""
+Profiler for Quill
+Times every source line and function call of a script run with `quill --profile`
+and records Quill call stacks for flamegraphs (`quill --flamegraph`)
+"""
+
+import json
+import time
+
+from colors import colorize, Colors
+
+MAIN_FRAME = '<main>'  # Root of every recorded call stack
+
+
+class Stats:
+    """Hit count and timings for one source line or one function"""
+    __slots__ = ('hits', 'total', 'self_time', 'active')
+
+    def __init__(self):
+        self.hits = 0
+        self.total = 0.0      # Cumulative: includes nested statements and calls
+        self.self_time = 0.0  # Excludes time spent in nested statements/calls
+        self.active = 0       # Running instances, so recursion is counted once
+
+    def as_dict(self):
+        return {'hits': self.hits, 'total': self.total, 'self': self.self_time}
+
+
+class Profiler:
+    """Collects per-line, per-function and per-builtin statistics
+
+    install() wraps the handlers in an Interpreter's statement dispatch
+    table and its call_function method, so profiling needs the tree-walking
+    engine and an Interpreter that is not profiled pays nothing at all.
+    Every statement is timed under its source line; a statement's self time
+    leaves out the statements nested inside it. Calls are timed under the
+    function or builtin name, with self time leaving out the calls they
+    make in turn.
+
+    With record_stacks, the self time of every call is also charged to the
+    full Quill call stack it ran under (user functions, builtins and module
+    functions such as ``game.add_item``), for write_folded().
+    """
+
+    def __init__(self, clock=time.perf_counter, record_stacks=False):
+        self.clock = clock
+        self.lines = {}          # line number -> Stats
+        self.functions = {}      # user function name -> Stats
+        self.builtins = {}       # builtin name -> Stats
+        self.line_stack = []     # Child time accumulated by each running statement
+        self.call_stack = [0.0]  # Child time of each running call; the first entry is <main>
+        self.record_stacks = record_stacks
+        self.frames = [MAIN_FRAME]  # Quill call stack, as frame names
+        self.stacks = {}            # 'frame;frame;...' -> self time
+        self.module_functions = {}  # Module function object -> 'module.name'
+        self.modules_seen = 0
+        self.interpreter = None
+        self.source_lines = []
+        self.elapsed = 0.0
+
+    def install(self, interpreter):
+        """Instrument interpreter's statement and call handlers"""
+        self.interpreter = interpreter
+        self.source_lines = interpreter.source.split('\n')
+        handlers = interpreter.statement_handlers
+        for node_type, handler in list(handlers.items()):
+            handlers[node_type] = self.wrap_statement(handler)
+        # Wrapping call_function rather than eval_call keeps argument
+        # evaluation with the caller
+        interpreter.call_function = self.wrap_call(interpreter.call_function, interpreter)
+        return self
+
+    def wrap_statement(self, handler):
+        lines = self.lines
+
+        def profiled_statement(node):
+            stats = lines.get(node.line)
+            if stats is None:
+                stats = lines[node.line] = Stats()
+            return self.measure(stats, self.line_stack, handler, (node,))
+        return profiled_statement
+
+    def wrap_call(self, handler, interpreter):
+        functions = self.functions
+        builtins = self.builtins
+        interpreter_builtins = interpreter.builtins
+
+        def profiled_call(name, arg_values):
+            builtin = interpreter_builtins.get(name)
+            table = functions if builtin is None else builtins
+            stats = table.get(name)
+            if stats is None:
+                stats = table[name] = Stats()
+            if not self.record_stacks:
+                return self.measure(stats, self.call_stack, handler, (name, arg_values))
+            self.frames.append(name if builtin is None else self.builtin_frame(name, builtin))
+            try:
+                return self.measure(stats, self.call_stack, handler, (name, arg_values), self.stacks)
+            finally:
+                self.frames.pop()
+        return profiled_call
+
+    def measure(self, stats, stack, handler, arguments, stacks=None):
+        """Run handler(*arguments), charging its time to stats and its parent on stack
+
+        If stacks is given, the self time is also added there under the
+        current call stack.
+        """
+        clock = self.clock
+        stack.append(0.0)
+        stats.active += 1
+        start = clock()
+        try:
+            return handler(*arguments)
+        finally:
+            elapsed = clock() - start
+            children = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+            stats.active -= 1
+            stats.hits += 1
+            stats.self_time += elapsed - children
+            if not stats.active:
+                stats.total += elapsed
+            if stacks is not None:
+                key = ';'.join(self.frames)
+                stacks[key] = stacks.get(key, 0.0) + elapsed - children
+
+    def builtin_frame(self, name, function):
+        """Frame name for a builtin: 'module.name' if it came from an imported module"""
+        loader = getattr(self.interpreter, 'module_loader', None)
+        if loader is not None and len(loader.loaded_modules) != self.modules_seen:
+            self.modules_seen = len(loader.loaded_modules)
+            self.module_functions = {
+                function: f"{module}.{function_name}"
+                for module, module_functions in loader.loaded_modules.items()
+                for function_name, function in module_functions.items()
+            }
+        return self.module_functions.get(function, name)
+
+    def run(self, interpreter, statements):
+        """Run statements on interpreter, recording the wall time of the whole run"""
+        start = self.clock()
+        try:
+            interpreter.run(statements)
+        finally:
+            elapsed = self.clock() - start
+            self.elapsed += elapsed
+            # Whatever no call accounts for was spent in the main program itself
+            if self.record_stacks:
+                main_time = elapsed - self.call_stack[0]
+                self.stacks[MAIN_FRAME] = self.stacks.get(MAIN_FRAME, 0.0) + main_time
+            self.call_stack[0] = 0.0
+
+    # Reporting
+    def to_dict(self, filename=None):
+        """Machine-readable profile; times are in seconds"""
+        return {
+            'script': filename,
+            'elapsed': self.elapsed,
+            'lines': [dict(line=line, source=self.source_text(line), **stats.as_dict())
+                      for line, stats in sorted(self.lines.items())],
+            'functions': [dict(name=name, **stats.as_dict())
+                          for name, stats in sorted(self.functions.items())],
+            'builtins': [dict(name=name, **stats.as_dict())
+                         for name, stats in sorted(self.builtins.items())],
+        }
+
+    def write_json(self, path, filename=None):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(filename), f, indent=2)
+
+    def write_folded(self, path):
+        """Write the call stacks in the collapsed format flamegraph tools read
+
+        One line per distinct stack, 'frame;frame;frame weight', where the
+        weight is the stack's self time in microseconds.
+        """
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, seconds in sorted(self.stacks.items()):
+                weight = round(seconds * 1000000)
+                if weight > 0:
+                    f.write(f"{stack} {weight}\n")
+
+    def source_text(self, line):
+        if 1 <= line <= len(self.source_lines):
+            return self.source_lines[line - 1].strip()
+        return ''
+
+    def format_table(self, limit=20):
+        """Text report: the slowest lines, functions and builtins by self time"""
+        heading = Colors.BOLD + Colors.BRIGHT_YELLOW
+        rows = [colorize(f"⏱ Profile ({self.elapsed * 1000:.1f} ms total)", heading), ""]
+
+        rows.append(colorize(f"{'line':>6} {'hits':>9} {'self ms':>10} {'total ms':>10}  source", heading))
+        ranked = sorted(self.lines.items(), key=lambda item: item[1].self_time, reverse=True)
+        for line, stats in ranked[:limit]:
+            rows.append(f"{line:>6} {stats.hits:>9} {stats.self_time * 1000:>10.2f} "
+                        f"{stats.total * 1000:>10.2f}  {self.source_text(line)[:50]}")
+
+        for title, table in (('function', self.functions), ('builtin', self.builtins)):
+            if not table:
+                continue
+            rows.append("")
+            rows.append(colorize(f"{title:<20} {'calls':>9} {'self ms':>10} {'total ms':>10}", heading))
+            ranked = sorted(table.items(), key=lambda item: item[1].self_time, reverse=True)
+            for name, stats in ranked[:limit]:
+                rows.append(f"{name[:20]:<20} {stats.hits:>9} {stats.self_time * 1000:>10.2f} "
+                            f"{stats.total * 1000:>10.2f}")
+        return "\n".join(rows)
@@ -12,44 +12,104 @@ if sys.platform == 'win32':
     sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8', errors='replace')
 
 from lexer import Lexer
-from parser import Parser
-from interpreter import Interpreter
+from parser import Parser, dump_ast
+from interpreter import Interpreter, ENGINES
+from cache import parse_file, timed
+from optimizer import Optimizer
 from colors import *
+import os
+from contextlib import nullcontext, redirect_stdout
 
-def run_file(filename, legacy_mode=False):
+def run_file(filename, legacy_mode=False, engine='vm', use_cache=True, streaming=False,
+             optimize=True, profile=None, flamegraph=None, stats=False, stats_file=None,
+             inputs=None, quiet=False):
+    """Run a script
+
+    profile and flamegraph are the paths of a JSON profile and of
+    collapsed call stacks to write, if any. With stats, phase timings and
+    execution counts are printed afterwards (and written to stats_file).
+    inputs is a file of answers, one per line, for the script's ask and
+    choice statements; scripted runs print plain text without styling or
+    menus, and quiet runs print nothing but errors and reports.
+    
+    Returns the exit status: 0, or 1 after printing the error if the
+    script could not be read, parsed or run.
+    """
+    run_stats = None
+    if stats or stats_file:
+        from stats import RunStats
+        run_stats = RunStats()
+    profiler = None
+    if profile or flamegraph:
+        from profiler import Profiler
+        profiler = Profiler(record_stacks=bool(flamegraph))
+        engine = 'tree'  # The profiler instruments the tree walker's dispatch tables
     try:
-        # Show mini banner
-        print(divider('═', 60, Colors.BRIGHT_MAGENTA))
-        print(colorize(f"  📖 Running: {filename}", Colors.BRIGHT_CYAN))
-        if legacy_mode:
-            print(colorize("  ⚠ Legacy mode: game/io modules auto-imported", Colors.YELLOW))
-        print(divider('═', 60, Colors.BRIGHT_MAGENTA))
-        print()
+        player_io = None
+        if inputs or quiet:
+            from io_adapters import ScriptedIO
+            if inputs:
+                player_io = ScriptedIO.from_file(inputs, stream=None if quiet else sys.stdout)
+            else:
+                player_io = ScriptedIO(sys.stdin, stream=None)
         
-        with open(filename, 'r', encoding='utf-8') as f:
-            source = f.read()
+        if not quiet:
+            # Show mini banner
+            print(divider('═', 60, Colors.BRIGHT_MAGENTA))
+            print(colorize(f"  📖 Running: {filename}", Colors.BRIGHT_CYAN))
+            if legacy_mode:
+                print(colorize("  ⚠ Legacy mode: game/io modules auto-imported", Colors.YELLOW))
+            if profiler:
+                print(colorize("  ⏱ Profiling with the tree engine", Colors.YELLOW))
+            print(divider('═', 60, Colors.BRIGHT_MAGENTA))
+            print()
         
-        # Lexing
-        lexer = Lexer(source)
-        tokens = lexer.tokenize()
+        with timed(run_stats, 'read'):
+            with open(filename, 'r', encoding='utf-8') as f:
+                source = f.read()
         
-        # Parsing
-        parser = Parser(tokens, source)
-        ast = parser.parse()
+        # Lexing and parsing (skipped when __quillcache__ holds a current parse)
+        ast = parse_file(filename, source, use_cache=use_cache, streaming=streaming,
+                         stats=run_stats)
+        if optimize:
+            with timed(run_stats, 'optimize'):
+                ast = Optimizer().optimize(ast)
         
         # Interpreting
-        interpreter = Interpreter(source, legacy_mode=legacy_mode)
-        interpreter.run(ast)
+        with timed(run_stats, 'init'):
+            interpreter = Interpreter(source, legacy_mode=legacy_mode, engine=engine, io=player_io)
+        try:
+            if run_stats:
+                run_stats.count_nodes(ast)
+                interpreter.stats = run_stats
+            # A quiet run keeps the script's output in memory
+            captured = captured_output(player_io if quiet else None)
+            with timed(run_stats, 'run'):
+                if profiler:
+                    profiler.install(interpreter)
+                    try:
+                        with captured:
+                            profiler.run(interpreter, ast)
+                    finally:
+                        report_profile(profiler, filename, profile, flamegraph)
+                else:
+                    with captured:
+                        interpreter.run(ast)
+        finally:
+            if run_stats:
+                report_stats(run_stats, filename, stats_file)
         
-        # Success message
-        print()
-        print(divider('═', 60, Colors.BRIGHT_MAGENTA))
-        print(success("Story completed successfully!"))
-        print(divider('═', 60, Colors.BRIGHT_MAGENTA))
+        if not quiet:
+            # Success message
+            print()
+            print(divider('═', 60, Colors.BRIGHT_MAGENTA))
+            print(success("Story completed successfully!"))
+            print(divider('═', 60, Colors.BRIGHT_MAGENTA))
+        return 0
         
-    except FileNotFoundError:
-        print(error(f"File '{filename}' not found"))
-        sys.exit(1)
+    except FileNotFoundError as e:
+        print(error(f"File '{e.filename or filename}' not found"))
+        return 1
     except Exception as e:
         # Check if it's a QuillError (has format_error method)
         if hasattr(e, 'format_error'):
@@ -60,6 +120,63 @@ def run_file(filename, legacy_mode=False):
             print(error(f"Runtime Error: {e}"))
         else:
             print(error(f"Error: {e}"))
+        return 1
+
+def captured_output(player_io):
+    """Send everything printed in the with-block to player_io, if given"""
+    if player_io is None:
+        return nullcontext()
+    from io_adapters import AdapterWriter
+    return redirect_stdout(AdapterWriter(player_io))
+
+def report_profile(profiler, filename, json_path=None, folded_path=None):
+    """Print the profile table and write the JSON profile and/or collapsed stacks"""
+    print()
+    if json_path:
+        print(profiler.format_table())
+    for path, write in ((json_path, lambda path: profiler.write_json(path, filename)),
+                        (folded_path, profiler.write_folded)):
+        if not path:
+            continue
+        try:
+            write(path)
+            print(info(f"Profile written to {path}"))
+        except OSError as e:
+            print(error(f"Could not write profile to {path}: {e}"))
+
+def report_stats(run_stats, filename, json_path=None):
+    """Print the run statistics and write them as JSON if asked to"""
+    print()
+    print(run_stats.format_table())
+    if json_path:
+        try:
+            run_stats.write_json(json_path, filename)
+            print(info(f"Statistics written to {json_path}"))
+        except OSError as e:
+            print(error(f"Could not write statistics to {json_path}: {e}"))
+
+def default_output_path(filename, suffix):
+    """story.quill -> story<suffix>, next to the script"""
+    return os.path.splitext(filename)[0] + suffix
+
+def dump_file(filename, use_cache=True, streaming=False, optimize=True):
+    """Print the (optimized) AST of a script instead of running it"""
+    try:
+        with open(filename, 'r', encoding='utf-8') as f:
+            source = f.read()
+        
+        ast = parse_file(filename, source, use_cache=use_cache, streaming=streaming)
+        if optimize:
+            ast = Optimizer().optimize(ast)
+        print(dump_ast(ast))
+    except FileNotFoundError:
+        print(error(f"File '{filename}' not found"))
+        sys.exit(1)
+    except Exception as e:
+        if hasattr(e, 'format_error'):
+            print(str(e))
+        else:
+            print(error(f"Syntax Error: {e}"))
         sys.exit(1)
 
 def run_interactive():
@@ -90,19 +207,83 @@ def run_interactive():
         print(f"Error: {e}")
 
 def main():
+    if sys.argv[1:2] == ['batch']:
+        from batch import main as batch_main
+        sys.exit(batch_main(sys.argv[2:]))
+    
     # Parse arguments
     legacy_mode = False
+    engine = 'vm'
+    use_cache = True
+    streaming = False
+    optimize = True
+    dump = False
+    profile = None
+    flamegraph = None
+    stats = False
+    stats_file = None
+    serve = None
+    inputs = None
+    quiet = False
     filename = None
     
-    for arg in sys.argv[1:]:
+    args = iter(sys.argv[1:])
+    for arg in args:
         if arg == '--legacy':
             legacy_mode = True
+        elif arg == '--no-cache':
+            use_cache = False
+        elif arg == '--stream':
+            streaming = True
+        elif arg == '--no-optimize':
+            optimize = False
+        elif arg == '--dump-ast':
+            dump = True
+        elif arg == '--profile':
+            profile = True
+        elif arg.startswith('--profile='):
+            profile = arg.split('=', 1)[1]
+        elif arg == '--stats':
+            stats = True
+        elif arg.startswith('--stats='):
+            stats_file = arg.split('=', 1)[1]
+        elif arg == '--quiet':
+            quiet = True
+        elif arg == '--inputs':
+            inputs = next(args, None)
+            if inputs is None:
+                print(error("--inputs needs a file of answers"))
+                sys.exit(1)
+        elif arg.startswith('--inputs='):
+            inputs = arg.split('=', 1)[1]
+        elif arg == '--serve':
+            serve = ''
+        elif arg.startswith('--serve='):
+            serve = arg.split('=', 1)[1]
+        elif arg == '--flamegraph':
+            flamegraph = True
+        elif arg.startswith('--flamegraph='):
+            flamegraph = arg.split('=', 1)[1]
+        elif arg.startswith('--engine='):
+            engine = arg.split('=', 1)[1]
+            if engine not in ENGINES:
+                print(error(f"Unknown engine: {engine} (choose from {', '.join(ENGINES)})"))
+                sys.exit(1)
         elif arg.startswith('-'):
             print(error(f"Unknown option: {arg}"))
             sys.exit(1)
         else:
             filename = arg
     
+    if serve is not None:
+        from server import serve as serve_forever
+        try:
+            serve_forever(serve or None)
+        except (OSError, RuntimeError) as e:
+            print(error(f"Could not start the server: {e}"))
+            sys.exit(1)
+        return
+    
     if filename is None:
         # Show logo
         print_logo()
@@ -111,15 +292,40 @@ def main():
         print()
         print(colorize("Options:", Colors.BOLD + Colors.BRIGHT_YELLOW))
         print(colorize("  --legacy", Colors.BRIGHT_CYAN) + "  - Auto-import game/io modules (for old scripts)")
+        print(colorize("  --engine=NAME", Colors.BRIGHT_CYAN) + "  - Execution engine: vm (default), closure or tree")
+        print(colorize("  --no-cache", Colors.BRIGHT_CYAN) + "  - Always re-parse instead of using __quillcache__")
+        print(colorize("  --stream", Colors.BRIGHT_CYAN) + "  - Parse while tokenizing, without building a token list (large scripts)")
+        print(colorize("  --no-optimize", Colors.BRIGHT_CYAN) + "  - Skip constant folding and dead-branch removal")
+        print(colorize("  --dump-ast", Colors.BRIGHT_CYAN) + "  - Print the optimized syntax tree instead of running")
+        print(colorize("  --profile[=FILE]", Colors.BRIGHT_CYAN) + "  - Time each line and function (JSON to FILE, default <script>.profile.json)")
+        print(colorize("  --flamegraph[=FILE]", Colors.BRIGHT_CYAN) + "  - Write Quill call stacks for flamegraph tools (default <script>.folded)")
+        print(colorize("  --stats[=FILE]", Colors.BRIGHT_CYAN) + "  - Show phase timings, counts and peak memory (and save them as JSON)")
+        print(colorize("  --inputs FILE", Colors.BRIGHT_CYAN) + "  - Answer ask/choice from FILE, one answer per line, with plain output")
+        print(colorize("  --quiet", Colors.BRIGHT_CYAN) + "  - Print nothing but errors (for batch playthroughs)")
+        print(colorize("  --serve[=SOCKET]", Colors.BRIGHT_CYAN) + "  - Keep a warm interpreter running for quill_client.py (Unix only)")
         print()
         print(colorize("Examples:", Colors.BOLD + Colors.BRIGHT_YELLOW))
         print(colorize("  quill adventure.quill", Colors.BRIGHT_GREEN))
         print(colorize("  quill examples/demo.quill", Colors.BRIGHT_GREEN))
         print(colorize("  quill old_game.quill --legacy", Colors.BRIGHT_GREEN))
+        print(colorize("  quill batch story.quill --inputs run1.txt run2.txt", Colors.BRIGHT_GREEN) + "  - Many playthroughs in parallel")
         print()
         sys.exit(0)
     
-    run_file(filename, legacy_mode=legacy_mode)
+    if dump:
+        dump_file(filename, use_cache=use_cache, streaming=streaming, optimize=optimize)
+        return
+    
+    if profile is True:
+        profile = default_output_path(filename, '.profile.json')
+    if flamegraph is True:
+        flamegraph = default_output_path(filename, '.folded')
+    
+    status = run_file(filename, legacy_mode=legacy_mode, engine=engine, use_cache=use_cache,
+                      streaming=streaming, optimize=optimize, profile=profile, flamegraph=flamegraph,
+                      stats=stats, stats_file=stats_file, inputs=inputs, quiet=quiet)
+    if status:
+        sys.exit(status)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,64 @@
+"""
+Quill Client
+Runs a script through a warm `quill --serve` process instead of starting a new interpreter
+
+Usage: python quill_client.py [--socket=PATH] <filename.quill> [quill options]
+
+Everything except --socket is passed to the server as `quill` arguments. The
+script reads this process's stdin and writes to its stdout/stderr directly,
+and the exit status is the script's.
+"""
+
+import os
+import socket
+import sys
+
+from server_protocol import default_socket_path, encode_request, peer_uid, send_fds
+
+
+def run(args, path=None):
+    """Run `quill <args>` on the server and return its exit status"""
+    path = path or default_socket_path()
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except OSError as e:
+        print(f"✗ Could not reach the Quill server at {path}: {e}", file=sys.stderr)
+        print("  Start one with: quill --serve", file=sys.stderr)
+        return 1
+
+    with sock:
+        # The server gets this terminal's descriptors: only hand them to our own user's server
+        if peer_uid(sock, path) != os.getuid():
+            print(f"✗ The Quill server at {path} belongs to another user", file=sys.stderr)
+            return 1
+        sys.stdout.flush()
+        send_fds(sock, encode_request(os.getcwd(), args), [0, 1, 2])
+
+        reply = b''
+        while not reply.endswith(b'\n'):
+            chunk = sock.recv(4096)
+            if not chunk:
+                print("✗ The Quill server closed the connection", file=sys.stderr)
+                return 1
+            reply += chunk
+    status = reply.decode('utf-8').split()
+    return int(status[1]) if len(status) == 2 and status[1].lstrip('-').isdigit() else 1
+
+
+def main():
+    path = None
+    args = []
+    for arg in sys.argv[1:]:
+        if arg.startswith('--socket='):
+            path = arg.split('=', 1)[1]
+        else:
+            args.append(arg)
+    try:
+        sys.exit(run(args, path))
+    except KeyboardInterrupt:
+        sys.exit(130)  # Closing the socket stops the run on the server
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Scope Resolver for Quill
+Maps every variable inside a function body to a slot in an array-backed frame
+"""
+
+from parser import *
+
+# Marker for a frame slot that has not been assigned yet
+UNSET = object()
+
+
+class Scope:
+    """Slot table for one function body"""
+    def __init__(self, parameters):
+        # One slot per parameter position; a repeated name binds to the last
+        self.names = list(parameters)
+        self.slots = {name: i for i, name in enumerate(self.names)}
+
+    def slot(self, name):
+        """Return the slot for name, allocating one on first use"""
+        if name not in self.slots:
+            self.slots[name] = len(self.names)
+            self.names.append(name)
+        return self.slots[name]
+
+
+class Resolver:
+    """Annotates the AST with (depth, slot) information after parsing
+
+    Quill functions capture the variables visible where they are defined by
+    value, so a function body only ever reads and writes its own frame:
+    parameters come first, followed by every other name the body (or a
+    nested function) uses. Each such reference resolves to depth 0 and is
+    recorded on the node as ``node.slot``. Top-level code keeps using the
+    globals dictionary (modules and save files depend on it), which is
+    recorded as ``slot = None``.
+
+    Each FunctionNode also gets ``slot_names`` (the frame layout) and
+    ``captures`` (the non-parameter names, whose values are copied from the
+    defining scope when the function is created).
+    """
+
+    def __init__(self):
+        self.scope = None
+        self.visitors = {
+            SayNode: lambda node: self.visit_expression(node.expression),
+            AskNode: self.visit_ask,
+            SetNode: self.visit_set,
+            IfNode: self.visit_if,
+            WhileNode: self.visit_while,
+            ForNode: self.visit_for,
+            FunctionNode: self.visit_function,
+            ReturnNode: self.visit_return,
+            FunctionCallNode: self.visit_expression,
+            ChoiceNode: self.visit_choice,
+        }
+
+    def resolve(self, statements):
+        """Annotate statements in place and return them"""
+        self.scope = None
+        self.visit_block(statements)
+        return statements
+
+    def bind(self, name):
+        """Slot for name in the current function, or None at top level"""
+        if self.scope is None:
+            return None
+        return self.scope.slot(name)
+
+    # Statements
+    def visit_block(self, statements):
+        for stmt in statements or []:
+            visitor = self.visitors.get(type(stmt))
+            if visitor is not None:
+                visitor(stmt)
+
+    def visit_ask(self, node):
+        self.visit_expression(node.prompt)
+        node.slot = self.bind(node.variable)
+
+    def visit_set(self, node):
+        self.visit_expression(node.expression)
+        if isinstance(node.variable, str):
+            node.slot = self.bind(node.variable)
+        else:
+            node.slot = None
+            self.visit_expression(node.variable)
+
+    def visit_if(self, node):
+        self.visit_expression(node.condition)
+        self.visit_block(node.then_block)
+        self.visit_block(node.else_block)
+
+    def visit_while(self, node):
+        self.visit_expression(node.condition)
+        self.visit_block(node.body)
+
+    def visit_for(self, node):
+        self.visit_expression(node.iterable)
+        node.slot = self.bind(node.variable)
+        self.visit_block(node.body)
+
+    def visit_function(self, node):
+        outer = self.scope
+        self.scope = Scope(node.parameters)
+        self.visit_block(node.body)
+        node.slot_names = self.scope.names
+        node.captures = node.slot_names[len(node.parameters):]
+        self.scope = outer
+
+        # The defining scope must hold everything the new function captures
+        if outer is not None:
+            for name in node.captures:
+                outer.slot(name)
+
+    def visit_return(self, node):
+        if node.expression is not None:
+            self.visit_expression(node.expression)
+
+    def visit_choice(self, node):
+        for option in node.options:
+            self.visit_expression(option)
+        node.slot = self.bind('answer')
+
+    # Expressions
+    def visit_expression(self, node):
+        if isinstance(node, VariableNode):
+            node.slot = self.bind(node.name)
+        elif isinstance(node, BinaryOpNode):
+            self.visit_expression(node.left)
+            self.visit_expression(node.right)
+        elif isinstance(node, UnaryOpNode):
+            self.visit_expression(node.operand)
+        elif isinstance(node, ListNode):
+            for element in node.elements:
+                self.visit_expression(element)
+        elif isinstance(node, IndexNode):
+            self.visit_expression(node.object)
+            self.visit_expression(node.index)
+        elif isinstance(node, FunctionCallNode):
+            for argument in node.arguments:
+                self.visit_expression(argument)
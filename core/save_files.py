@@ -0,0 +1,194 @@
+"""
+Save Files for Quill
+Save slots written as one snapshot followed by the changes of each later save
+"""
+
+import json
+import os
+import tempfile
+
+from lazy_range import QuillRange, json_default
+
+SAVES_DIR = 'saves'
+COMPACT_AFTER = 32  # Appended saves before a slot is rewritten as a single snapshot
+SAVED_TYPES = (int, float, str, bool, list, dict, QuillRange, type(None))
+SCALARS = (int, float, str, bool, type(None))  # Values that cannot change in place
+MISSING = object()
+
+
+def save_path(filename):
+    """Where save_game(filename) writes: saves/<filename>.save"""
+    filename = str(filename)
+    if not filename.endswith('.save'):
+        filename += '.save'
+    return os.path.join(SAVES_DIR, filename)
+
+
+class Slot:
+    """What a slot file holds as of the last save or load, to diff the next save against"""
+    __slots__ = ('values', 'texts', 'inventory', 'changes', 'stamp')
+
+    def __init__(self, values, texts, inventory, changes, stamp):
+        self.values = values    # Name -> value saved, to skip encoding unchanged scalars again
+        self.texts = texts      # Name -> JSON text saved; lists are compared by this, as
+                                # `items[i] = ...` changes them in place
+        self.inventory = inventory
+        self.changes = changes  # Change lines after the snapshot
+        self.stamp = stamp      # file_stamp() after writing; anything else means someone else wrote it
+
+
+class SaveFiles:
+    """The save slots of one interpreter
+
+    A slot file is JSON lines. The first line is a snapshot,
+    {"variables": {...}, "inventory": [...]}, the same document earlier
+    versions wrote (they indented it over several lines, and such files
+    still load). Each later line is what one save changed:
+    {"set": {...}, "unset": [...], "inventory": [...]}, with keys left out
+    when nothing of that kind changed and no line at all when nothing did.
+    Loading replays the lines in order.
+
+    A save only appends when this interpreter wrote or loaded the slot
+    last. Otherwise, and after COMPACT_AFTER appended saves, the whole slot
+    is rewritten as a new snapshot through a temporary file that replaces
+    the old one, so a crash leaves either the old slot or the new one. An
+    append that is cut off leaves an incomplete last line, which loading
+    skips: the slot then reads as of the save before.
+    """
+
+    def __init__(self, compact_after=COMPACT_AFTER):
+        self.compact_after = compact_after
+        self.slots = {}  # Path -> Slot
+
+    def save(self, filename, variables, inventory):
+        """Save variables (those JSON can hold) and inventory; return the file path"""
+        path = save_path(filename)
+        variables = {name: value for name, value in variables.items() if isinstance(value, SAVED_TYPES)}
+        inventory = list(inventory)
+        slot = self.slots.get(path)
+        texts = encode_values(variables, slot)
+
+        if slot is None or slot.changes >= self.compact_after or slot.stamp != file_stamp(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            write_atomic(path, encode_line({'variables': texts, 'inventory': inventory}))
+            changes = 0
+        else:
+            record = changes_between(slot.texts, slot.inventory, texts, inventory)
+            if not record:
+                return path  # The file already holds exactly this
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write(encode_line(record))
+            changes = slot.changes + 1
+
+        self.slots[path] = Slot(variables, texts, inventory, changes, file_stamp(path))
+        return path
+
+    def load(self, filename):
+        """Return the (variables, inventory) saved in a slot
+
+        Raises FileNotFoundError for a missing slot and ValueError for a
+        file that is not a save.
+        """
+        path = save_path(filename)
+        with open(path, 'r', encoding='utf-8') as f:
+            text = f.read()
+        variables, inventory, changes, appendable = replay(text, path)
+        # A cut-off last line, or an indented file from an earlier version,
+        # would break the next appended line: the next save rewrites the slot
+        stamp = file_stamp(path) if appendable else None
+        self.slots[path] = Slot(dict(variables), encode_values(variables), list(inventory), changes, stamp)
+        return variables, inventory
+
+
+def encode_values(variables, slot=None):
+    """Name -> JSON text of each value, reusing the slot's text for scalars that have not changed"""
+    texts = {}
+    for name, value in variables.items():
+        if slot is not None and isinstance(value, SCALARS) and same(slot.values.get(name, MISSING), value):
+            texts[name] = slot.texts[name]
+        else:
+            texts[name] = json.dumps(value, default=json_default, separators=(',', ':'))
+    return texts
+
+
+def changes_between(old_texts, old_inventory, texts, inventory):
+    """The change line that turns the old state into the new one; empty if they are the same"""
+    record = {}
+    changed = {name: text for name, text in texts.items() if old_texts.get(name) != text}
+    if changed:
+        record['set'] = changed
+    removed = [name for name in old_texts if name not in texts]
+    if removed:
+        record['unset'] = removed
+    if inventory != old_inventory:
+        record['inventory'] = inventory
+    return record
+
+
+def same(old, new):
+    # type() keeps 1 and true apart
+    return old is new or (type(old) is type(new) and old == new)
+
+
+def replay(text, path):
+    """(variables, inventory, change lines, whether a line can be appended) of a slot file's text"""
+    lines = text.splitlines()
+    appendable = text.endswith('\n')
+    try:
+        records = [json.loads(text)]  # A lone snapshot, or a save from before change lines
+        appendable = appendable and len(lines) == 1
+    except ValueError:
+        records = []
+        for number, line in enumerate(lines, 1):
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                if number == len(lines) and records:
+                    appendable = False
+                    break  # The last save was cut off; keep the ones before it
+                raise ValueError(f"{path} is not a Quill save file (line {number})") from None
+
+    if not records or not isinstance(records[0], dict) or 'variables' not in records[0]:
+        raise ValueError(f"{path} is not a Quill save file")
+    variables = dict(records[0]['variables'])
+    inventory = records[0].get('inventory', [])
+    for record in records[1:]:
+        variables.update(record.get('set', {}))
+        for name in record.get('unset', ()):
+            variables.pop(name, None)
+        inventory = record.get('inventory', inventory)
+    return variables, list(inventory), len(records) - 1, appendable
+
+
+def encode_line(record):
+    """One line of a slot file; the 'variables' and 'set' maps hold JSON texts from encode_values"""
+    parts = []
+    for key, value in record.items():
+        if key in ('variables', 'set'):
+            value = '{' + ','.join(f"{json.dumps(name)}:{text}" for name, text in value.items()) + '}'
+        else:
+            value = json.dumps(value, separators=(',', ':'))
+        parts.append(f"{json.dumps(key)}:{value}")
+    return '{' + ','.join(parts) + '}\n'
+
+
+def file_stamp(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_size, stat.st_mtime_ns)
+
+
+def write_atomic(path, text):
+    """Replace path with text, so that readers and crashes see either the old file or the new one"""
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
@@ -0,0 +1,117 @@
+"""
+Warm Server for Quill
+Keeps the interpreter loaded in a long-lived process so each run skips Python startup
+"""
+
+import os
+import socket
+import socketserver
+import sys
+import threading
+
+from server_protocol import default_socket_path, decode_request, recv_fds
+from warm import warm_up
+
+MAX_REQUEST = 1 << 20  # Longest request accepted, in bytes
+
+
+class RunHandler(socketserver.BaseRequestHandler):
+    """Runs one script for one client, in a forked child of the server
+
+    The client sends its working directory and `quill` arguments together
+    with its stdin, stdout and stderr descriptors (see server_protocol.py).
+    The child puts those descriptors in place of its own, so the script
+    reads and prints straight to the client's terminal or pipes, then
+    replies with the exit status.
+    """
+
+    def handle(self):
+        conn = self.request
+        data, fds = recv_fds(conn, MAX_REQUEST, 3)
+        request = decode_request(data)
+        while request is None and data and len(data) < MAX_REQUEST:
+            more = conn.recv(MAX_REQUEST)
+            if not more:
+                break
+            data += more
+            request = decode_request(data)
+        if request is None or len(fds) != 3:
+            for fd in fds:
+                os.close(fd)
+            conn.sendall(b'exit 2\n')  # Not a client we understand
+            return
+        cwd, args = request
+
+        for target, fd in enumerate(fds):
+            os.dup2(fd, target)
+            os.close(fd)
+        sys.stdin = open(0, 'r', encoding='utf-8', closefd=False)
+        sys.stdout = open(1, 'w', encoding='utf-8', errors='replace', closefd=False, buffering=1)
+        sys.stderr = open(2, 'w', encoding='utf-8', errors='replace', closefd=False, buffering=1)
+
+        # A client that goes away (Ctrl+C) ends the run
+        threading.Thread(target=exit_on_hangup, args=(conn,), daemon=True).start()
+
+        conn.sendall(f"exit {run_script(cwd, args)}\n".encode('utf-8'))
+
+
+def exit_on_hangup(conn):
+    try:
+        while conn.recv(1):
+            pass
+    except OSError:
+        pass
+    os._exit(130)
+
+
+def run_script(cwd, args):
+    """Run `quill <args>` in cwd and return its exit status"""
+    import quill
+
+    os.chdir(cwd)
+    sys.argv = ['quill'] + args
+    try:
+        quill.main()
+        return 0
+    except SystemExit as e:
+        return e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+    except BaseException as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    finally:
+        for stream in (sys.stdout, sys.stderr):
+            try:
+                stream.flush()
+            except OSError:
+                pass  # The reader went away, e.g. `| head`
+
+
+def serve(path=None):
+    """Run the warm server on a Unix socket until interrupted"""
+    if not hasattr(socket, 'AF_UNIX') or not hasattr(os, 'fork'):
+        raise RuntimeError("The warm server needs Unix sockets and fork(), which this platform lacks")
+
+    # Defined here: ForkingMixIn and UnixStreamServer only exist where the check above passes
+    class QuillServer(socketserver.ForkingMixIn, socketserver.UnixStreamServer):
+        """Forks a child per run: every script starts from the same warm state"""
+
+    path = path or default_socket_path()
+    if os.path.exists(path):
+        os.unlink(path)  # Left behind by a server that did not shut down cleanly
+
+    warm_up()
+    old_umask = os.umask(0o177)  # Only this user may run scripts through the socket
+    try:
+        server = QuillServer(path, RunHandler)
+    finally:
+        os.umask(old_umask)
+    print(f"Quill server listening on {path} (Ctrl+C to stop)")
+    sys.stdout.flush()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if os.path.exists(path):
+            os.unlink(path)
@@ -0,0 +1,66 @@
+"""
+Warm Server Protocol for Quill
+Wire format shared by `quill --serve` (server.py) and quill_client.py
+
+Kept to the few standard modules a client needs, so the client starts as
+fast as Python allows.
+
+A request is the client's stdin, stdout and stderr descriptors, sent as
+SCM_RIGHTS ancillary data, with the text
+"<field count>\\0<cwd>\\0<arg>\\0<arg>...\\0"; the reply is "exit <status>\\n".
+"""
+
+import array
+import os
+import socket
+import struct
+
+
+def default_socket_path():
+    """Per-user socket path shared by `quill --serve` and quill_client.py"""
+    directory = os.environ.get('XDG_RUNTIME_DIR') or os.environ.get('TMPDIR') or '/tmp'
+    user = os.getuid() if hasattr(os, 'getuid') else 'user'
+    return os.path.join(directory, f"quill-{user}.sock")
+
+
+def peer_uid(sock, path):
+    """User id of the process at the other end of a connected Unix socket
+
+    Uses SO_PEERCRED where the system has it (Linux); elsewhere it is the
+    owner of the socket file, which is the user whose server bound it.
+    """
+    if hasattr(socket, 'SO_PEERCRED'):
+        _, uid, _ = struct.unpack('3i', sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED,
+                                                        struct.calcsize('3i')))
+        return uid
+    return os.stat(path).st_uid
+
+
+def encode_request(cwd, args):
+    fields = [cwd] + list(args)
+    return (f"{len(fields)}\0" + ''.join(field + '\0' for field in fields)).encode('utf-8')
+
+
+def decode_request(data):
+    """Return (cwd, args), or None if data does not hold a whole request yet"""
+    count, _, rest = data.partition(b'\0')
+    fields = rest.split(b'\0')
+    if not count.isdigit() or len(fields) <= int(count):
+        return None
+    fields = [field.decode('utf-8') for field in fields[:int(count)]]
+    return fields[0], fields[1:]
+
+
+# Python 3.9 has socket.send_fds/recv_fds; these do the same on 3.8
+def send_fds(sock, data, fds):
+    sock.sendmsg([data], [(socket.SOL_SOCKET, socket.SCM_RIGHTS, array.array('i', fds))])
+
+
+def recv_fds(sock, size, max_fds):
+    """Receive up to size bytes and up to max_fds descriptors"""
+    fds = array.array('i')
+    data, ancdata, _, _ = sock.recvmsg(size, socket.CMSG_LEN(max_fds * fds.itemsize))
+    for level, kind, payload in ancdata:
+        if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+            fds.frombytes(payload[:len(payload) - len(payload) % fds.itemsize])
+    return data, list(fds)
@@ -0,0 +1,199 @@
+"""
+Session Host for Quill
+Runs many interactive stories side by side in one process
+"""
+
+import itertools
+from contextlib import redirect_stdout
+
+from cache import parse, parse_file
+from optimizer import Optimizer
+from resolver import Resolver
+from compiler import Compiler
+from story_graph import StoryGraph
+from history import needs_history
+from interpreter import Interpreter
+from io_adapters import ScriptedIO
+from colors import strip_colors
+from vm import VM
+
+
+class Script:
+    """A program compiled once to bytecode and shared by every session that runs it
+
+    warnings lists the unreachable scenes and duplicate labels found while
+    linking its gotos; a goto to a missing label raises QuillSyntaxError.
+    history says whether its sessions keep save points for undo() and rewind().
+    """
+    __slots__ = ('source', 'code', 'warnings', 'history')
+
+    def __init__(self, source, ast=None, optimize=True):
+        if ast is None:
+            ast = parse(source)
+        if optimize:
+            ast = Optimizer().optimize(ast)
+        graph = StoryGraph(ast, source)
+        self.source = source
+        self.warnings = graph.warnings
+        self.history = needs_history(graph.statements)
+        self.code = Compiler(save_points=self.history).compile(Resolver().resolve(graph.statements))
+
+    @classmethod
+    def from_file(cls, filename, use_cache=True, optimize=True):
+        with open(filename, 'r', encoding='utf-8') as f:
+            source = f.read()
+        return cls(source, parse_file(filename, source, use_cache=use_cache), optimize)
+
+
+class Session:
+    """One player's run of a Script
+
+    Everything the script prints is collected as events instead of going
+    to stdout, as plain text through a ScriptedIO with no ANSI styling, and
+    `ask` and `choice` pause the session until send()
+    supplies the answer. A paused session is just its Interpreter state and
+    the VM's saved frames: no thread, no Python stack. wait() does not hold
+    a session up; it becomes an event the host can pace its output by.
+
+    Events are dicts:
+        {'type': 'output', 'text': ...}      printed text, as `quill --inputs` shows it
+        {'type': 'ask', 'prompt': ...}       waiting for a free-text answer
+        {'type': 'choice', 'options': [...]} waiting for an option number
+        {'type': 'wait', 'seconds': ...}     the script called wait(seconds)
+        {'type': 'error', 'message': ...}    the script failed; the session is over
+        {'type': 'end'}                      the script finished
+    """
+    __slots__ = ('script', 'interpreter', 'vm', 'finished', 'output')
+
+    def __init__(self, script, legacy_mode=False):
+        self.script = script
+        self.output = EventWriter([])  # Given a fresh events list by each step
+        self.interpreter = Interpreter(script.source, legacy_mode=legacy_mode,
+                                       io=ScriptedIO((), stream=self.output))
+        if script.history:
+            self.interpreter.enable_history()
+        self.vm = VM(self.interpreter, suspendable=True)
+        self.finished = False
+
+    @property
+    def waiting(self):
+        """('ask', prompt) or ('choice', options) while paused, else None"""
+        return self.vm.waiting
+
+    def start(self):
+        """Run the script up to its first ask or choice, or to its end; return the events"""
+        return self._step(self.vm.run, self.script.code)
+
+    def send(self, answer):
+        """Answer the pending ask or choice and run on to the next one; return the events
+
+        An answer that picks no option of a choice is reported in the
+        output and the same choice is asked again.
+        """
+        if self.vm.waiting is None:
+            raise RuntimeError("Session is not waiting for input")
+        kind, value = self.vm.waiting
+        if kind == 'ask':
+            return self._step(self.vm.resume, str(answer))
+        return self._step(self._answer_choice, value, str(answer))
+
+    def _answer_choice(self, options, answer):
+        index = self.interpreter._choice_index(options, answer)
+        if index is not None:
+            self.vm.resume(options[index])
+
+    def _step(self, action, *args):
+        events = self.output.events = []
+        with redirect_stdout(self.output):
+            try:
+                action(*args)
+                while self.vm.waiting is not None and self.vm.waiting[0] == 'wait':
+                    events.append({'type': 'wait', 'seconds': self.vm.waiting[1]})
+                    self.vm.resume(True)
+            except SystemExit:
+                self.vm.paused = self.vm.waiting = None
+            except Exception as e:
+                self.vm.paused = self.vm.waiting = None
+                events.append({'type': 'error', 'message': error_message(e)})
+                self.finished = True
+                return events
+
+        waiting = self.vm.waiting
+        if waiting is None:
+            events.append({'type': 'end'})
+            self.finished = True
+        elif waiting[0] == 'ask':
+            events.append({'type': 'ask', 'prompt': str(waiting[1])})
+        else:
+            events.append({'type': 'choice', 'options': [str(option) for option in waiting[1]]})
+        return events
+
+
+class SessionHost:
+    """Sessions by id: create one per player, then feed it their answers
+
+    A host drives its sessions from one thread, one step at a time, since
+    each step briefly redirects sys.stdout to collect the session's output.
+    Finished sessions are dropped.
+    """
+
+    def __init__(self):
+        self.sessions = {}
+        self._ids = itertools.count(1)
+
+    def create(self, script, legacy_mode=False):
+        """Start a session of script; return (session id, events up to its first prompt)"""
+        session_id = next(self._ids)
+        session = Session(script, legacy_mode=legacy_mode)
+        events = session.start()
+        if not session.finished:
+            self.sessions[session_id] = session
+        return session_id, events
+
+    def send(self, session_id, answer):
+        """Feed an answer to a session; return the events it produced"""
+        session = self.sessions.get(session_id)
+        if session is None:
+            raise KeyError(f"No running session {session_id}")
+        events = session.send(answer)
+        if session.finished:
+            del self.sessions[session_id]
+        return events
+
+    def close(self, session_id):
+        """Abandon a session, e.g. when its player disconnects"""
+        self.sessions.pop(session_id, None)
+
+    def __len__(self):
+        return len(self.sessions)
+
+
+class EventWriter:
+    """Stands in for sys.stdout and turns printed text into output events"""
+    __slots__ = ('events',)
+
+    def __init__(self, events):
+        self.events = events
+
+    def write(self, text):
+        if text:
+            events = self.events
+            if events and events[-1]['type'] == 'output':
+                events[-1]['text'] += text
+            else:
+                events.append({'type': 'output', 'text': text})
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+def error_message(e):
+    """The message the CLI would print for e, without colors"""
+    if hasattr(e, 'format_error'):
+        return strip_colors(str(e))  # Already formatted
+    if isinstance(e, SyntaxError):
+        return f"Syntax Error: {e}"
+    if isinstance(e, RuntimeError):
+        return f"Runtime Error: {e}"
+    return f"Error: {e}"
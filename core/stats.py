@@ -0,0 +1,120 @@
+"""
+Run Statistics for Quill
+Phase timings and execution counters for a script run with `quill --stats`
+"""
+
+import json
+import sys
+import time
+from contextlib import contextmanager
+
+from parser import ASTNode
+from colors import colorize, Colors
+
+# Peak RSS comes from getrusage, which Windows does not have
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+class RunStats:
+    """Where the time of one run went, and how much work it did
+
+    Phases are timed in the order they run: reading the file, the cache
+    lookup, lexing, parsing, optimizing, building the Interpreter (stdlib
+    and module loader setup) and running the program. Phases that did not
+    happen, such as lexing and parsing on a cache hit, are left out.
+
+    Engines count executed statements and function calls only when an
+    Interpreter has a RunStats attached, and decide that before the
+    program starts, so runs without --stats do no counting.
+    """
+    __slots__ = ('phases', 'tokens', 'nodes', 'statements', 'calls', 'cached', 'clock')
+
+    def __init__(self, clock=time.perf_counter):
+        self.phases = {}       # phase name -> seconds, in the order they ran
+        self.tokens = None     # None when the script was not lexed (cache hit)
+        self.nodes = None
+        self.statements = 0
+        self.calls = 0         # Builtin and user function calls
+        self.cached = False    # True when the AST came from __quillcache__
+        self.clock = clock
+
+    @contextmanager
+    def phase(self, name):
+        """Add the time spent in the with-block to the named phase"""
+        start = self.clock()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + self.clock() - start
+
+    def count_nodes(self, ast):
+        self.nodes = count_nodes(ast)
+
+    def to_dict(self, filename=None):
+        """Machine-readable statistics; times are in seconds"""
+        return {
+            'script': filename,
+            'phases': dict(self.phases),
+            'total': sum(self.phases.values()),
+            'cached': self.cached,
+            'tokens': self.tokens,
+            'nodes': self.nodes,
+            'statements': self.statements,
+            'calls': self.calls,
+            'peak_rss': peak_rss(),
+        }
+
+    def write_json(self, path, filename=None):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(filename), f, indent=2)
+
+    def format_table(self):
+        heading = Colors.BOLD + Colors.BRIGHT_YELLOW
+        total = sum(self.phases.values()) or 1.0
+        rows = [colorize("📊 Run statistics", heading), ""]
+        rows.append(colorize(f"{'phase':<12} {'ms':>10} {'share':>7}", heading))
+        for name, seconds in self.phases.items():
+            rows.append(f"{name:<12} {seconds * 1000:>10.2f} {seconds / total:>7.1%}")
+        rows.append(f"{'total':<12} {sum(self.phases.values()) * 1000:>10.2f}")
+        rows.append("")
+
+        rss = peak_rss()
+        counts = [
+            ('tokens', 'cached' if self.cached else self.tokens),
+            ('AST nodes', self.nodes),
+            ('statements', self.statements),
+            ('calls', self.calls),
+            ('peak RSS', 'unavailable' if rss is None else f"{rss / 2**20:.1f} MiB"),
+        ]
+        for label, value in counts:
+            shown = 'n/a' if value is None else value
+            if isinstance(shown, int):
+                shown = f"{shown:,}"
+            rows.append(f"{label:<12} {shown:>10}")
+        return "\n".join(rows)
+
+
+def count_nodes(value):
+    """Count the AST nodes reachable from value (a node or a list of nodes)"""
+    count = 0
+    pending = [value]
+    while pending:
+        value = pending.pop()
+        if isinstance(value, list):
+            pending.extend(value)
+        elif isinstance(value, ASTNode):
+            count += 1
+            pending.extend(getattr(value, name, None) for name in value.fields())
+    return count
+
+
+def peak_rss():
+    """Peak resident set size of this process in bytes, or None if unknown"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
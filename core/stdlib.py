@@ -9,6 +9,8 @@ import os
 
 from typing import Iterable
 
+from lazy_range import QuillRange
+
 class QuillStdlib:
     """Standard library functions for Quill"""
     
@@ -102,28 +104,28 @@ class QuillStdlib:
     @staticmethod
     def min_val(*items):
         """Return minimum value"""
-        if len(items) == 1 and isinstance(items[0], (list, tuple)):
+        if len(items) == 1 and isinstance(items[0], (list, tuple, QuillRange)):
             return min(items[0])
         return min(items)
     
     @staticmethod
     def max_val(*items):
         """Return maximum value"""
-        if len(items) == 1 and isinstance(items[0], (list, tuple)):
+        if len(items) == 1 and isinstance(items[0], (list, tuple, QuillRange)):
             return max(items[0])
         return max(items)
     
     @staticmethod
     def sum_val(*items):
         """Sum all numbers"""
-        if len(items) == 1 and isinstance(items[0], (list, tuple)):
+        if len(items) == 1 and isinstance(items[0], (list, tuple, QuillRange)):
             return sum(items[0])
         return sum(items)
     
     @staticmethod
     def average(*items):
         """Calculate average of numbers"""
-        if len(items) == 1 and isinstance(items[0], (list, tuple)):
+        if len(items) == 1 and isinstance(items[0], (list, tuple, QuillRange)):
             items = items[0]
         if not items:
             return 0
@@ -167,14 +169,14 @@ class QuillStdlib:
     @staticmethod
     def is_list(value):
         """Check if value is a list"""
-        return isinstance(value, list)
+        return isinstance(value, (list, QuillRange))
     
     @staticmethod
     def is_empty(value):
         """Check if value is empty (empty string, empty list, 0, None)"""
         if value is None:
             return True
-        if isinstance(value, (str, list)):
+        if isinstance(value, (str, list, QuillRange)):
             return len(value) == 0
         if isinstance(value, (int, float)):
             return value == 0
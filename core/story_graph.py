@@ -0,0 +1,173 @@
+"""
+Story Graph for Quill
+Resolves goto targets before a script runs and reports unknown labels and unreachable scenes
+"""
+
+from parser import *
+from errors import QuillSyntaxError
+
+
+class StoryGraph:
+    """The scenes of a program and the gotos between them, worked out before it runs
+
+    A scene is a top-level label and the statements up to the next one;
+    the statements before the first label are the opening scene.
+
+    - An if/else that contains labels is rewritten as top-level statements
+      that jump around its branches, so a goto can land on a label nested
+      in if blocks at any depth. Labels inside loops and function bodies
+      are still not jump targets. A goto run inside the rewritten if still
+      waits for the rest of it, as it did when the if was one statement:
+      the if's end label gets `unfolded_from`, the index where it starts,
+      and engines take such a goto when they reach that label (see
+      unfolded_positions).
+    - Every GotoNode, wherever it is, gets `target`: the index of its label
+      in the final top-level statement list. Engines jump there directly
+      instead of looking the label up while the story runs.
+    - A goto to a label that does not exist, or cannot be jumped to, raises
+      QuillSyntaxError here, before the first statement runs.
+    - Scenes that no goto leads to and that the story cannot fall into,
+      and labels defined twice, are listed in `warnings`.
+    """
+
+    def __init__(self, statements, source=""):
+        self.source_lines = source.split('\n')
+        self.warnings = []
+        self.unfolded_ifs = 0
+        self.statements = self.flatten(statements)
+        self.labels = self.collect_labels()
+        self.resolve()
+        self.find_unreachable_scenes()
+
+    def flatten(self, statements, top_level=True):
+        result = []
+        for stmt in statements:
+            if isinstance(stmt, IfNode) and contains_label(stmt):
+                start = len(result)
+                result.extend(self.flatten(self.unfold_if(stmt), top_level=False))
+                if top_level:
+                    result[-1].unfolded_from = start  # Its end label
+            else:
+                result.append(stmt)
+        return result
+
+    def unfold_if(self, node):
+        """The same control flow as node, written as a flat list with gotos
+
+        Generated labels contain '#', which no script label can, so they
+        never clash with the story's own and are never reported as scenes.
+        """
+        self.unfolded_ifs += 1
+        name = f"if#{self.unfolded_ifs}"
+        end = LabelNode(f"{name}.end").set_location(node)
+        skip = end
+        else_part = []
+        if node.else_block:
+            skip = LabelNode(f"{name}.else").set_location(node)
+            else_part = [goto(end, node), skip] + node.else_block
+        condition = UnaryOpNode('not', node.condition).set_location(node.condition)
+        jump = IfNode(condition, [goto(skip, node)]).set_location(node)
+        return [jump] + node.then_block + else_part + [end]
+
+    def collect_labels(self):
+        labels = {}
+        for i, stmt in enumerate(self.statements):
+            if isinstance(stmt, LabelNode):
+                if stmt.name in labels:
+                    first = self.statements[labels[stmt.name]]
+                    self.warnings.append(f"Label '{stmt.name}' is defined twice (lines {first.line} and "
+                                         f"{stmt.line}); goto jumps to the second")
+                labels[stmt.name] = i
+        return labels
+
+    def resolve(self):
+        top_level = set(map(id, self.statements))
+        hidden = {node.name for node in walk(self.statements)
+                  if isinstance(node, LabelNode) and id(node) not in top_level}
+        for node in walk(self.statements):
+            if isinstance(node, GotoNode):
+                target = self.labels.get(node.label)
+                if target is not None:
+                    node.target = target
+                elif node.label in hidden:
+                    raise self.error(f"Label '{node.label}' is inside a loop or function, so goto cannot jump to it",
+                                     node, "Move the label out of the loop or function body")
+                else:
+                    raise self.error(f"Label '{node.label}' not found", node,
+                                     f"Define it with 'label: {node.label}' outside any loop or function")
+
+    def find_unreachable_scenes(self):
+        statements = self.statements
+        # Gotos in a function body run wherever the function is called, so
+        # their targets count as reachable from the start
+        pending = [0]
+        jumps = []
+        for stmt in statements:
+            targets = []
+            for node in walk([stmt]):
+                if isinstance(node, GotoNode):
+                    targets.append(node.target)
+                elif isinstance(node, FunctionNode):
+                    pending.extend(goto.target for goto in walk(node.body) if isinstance(goto, GotoNode))
+            jumps.append(targets)
+
+        reached = set()
+        while pending:
+            i = pending.pop()
+            while i < len(statements) and i not in reached:
+                reached.add(i)
+                pending.extend(jumps[i])
+                if isinstance(statements[i], GotoNode):
+                    break  # Never falls through
+                i += 1
+
+        for i, stmt in enumerate(statements):
+            if isinstance(stmt, LabelNode) and i not in reached and '#' not in stmt.name:
+                self.warnings.append(f"Scene '{stmt.name}' (line {stmt.line}) is never reached: "
+                                     "no goto leads to it and the story never runs into it")
+
+    def error(self, message, node, hint=None):
+        line = node.line
+        source_line = self.source_lines[line - 1] if 0 < line <= len(self.source_lines) else None
+        return QuillSyntaxError(message, line=line, column=node.column, source_line=source_line, hint=hint)
+
+
+def unfolded_positions(statements):
+    """Top-level indices of the statements of unfolded ifs, up to their end labels
+
+    A goto that runs while one of these statements runs only records its
+    target; the engine jumps there at the end label, after the rest of the
+    if. The gotos story_graph generates (their labels contain '#') always
+    jump at once.
+    """
+    positions = set()
+    for index, stmt in enumerate(statements):
+        if isinstance(stmt, LabelNode) and stmt.unfolded_from is not None:
+            positions.update(range(stmt.unfolded_from, index))
+    return positions
+
+
+def goto(label, node):
+    jump = GotoNode(label.name).set_location(node)
+    return jump
+
+
+def contains_label(node):
+    """Whether an if statement has a label in its branches, directly or in nested ifs"""
+    for block in (node.then_block, node.else_block or ()):
+        for stmt in block:
+            if isinstance(stmt, LabelNode) or (isinstance(stmt, IfNode) and contains_label(stmt)):
+                return True
+    return False
+
+
+def walk(value):
+    """Every AST node reachable from value (a node or a list of nodes)"""
+    pending = [value]
+    while pending:
+        value = pending.pop()
+        if isinstance(value, list):
+            pending.extend(reversed(value))
+        elif isinstance(value, ASTNode):
+            yield value
+            pending.extend(getattr(value, name, None) for name in reversed(value.fields()))
@@ -0,0 +1,504 @@
+"""
+Virtual Machine for Quill
+Executes bytecode produced by the compiler
+"""
+
+from interpreter import Function, is_truthy
+from resolver import UNSET
+from lazy_range import QuillRange, type_name
+
+
+class Frame:
+    """Saved state of a suspended caller"""
+    __slots__ = ('code', 'pc', 'stack', 'fast')
+
+    def __init__(self, code, pc, stack, fast):
+        self.code = code
+        self.pc = pc
+        self.stack = stack
+        self.fast = fast  # Slot array of a function call, None for the main program
+
+
+class Suspend(Exception):
+    """Raised by a builtin to pause a suspendable VM, e.g. wait()
+
+    The VM saves its state with waiting = request, and resume() pushes the
+    value the builtin's call evaluates to.
+    """
+
+    def __init__(self, request):
+        super().__init__(request)
+        self.request = request
+
+
+class VM:
+    """Stack machine that runs CodeObjects against an Interpreter's state
+
+    User function calls push a Frame instead of recursing in Python, so the
+    depth of Quill recursion is limited only by max_depth. Because of that
+    the whole state of a run is a handful of values, and a suspendable VM
+    stops at `ask`, `choice` and `wait()` with them saved in `paused`
+    instead of blocking; resume() carries on with the answer.
+    """
+
+    max_depth = 10000
+
+    def __init__(self, interpreter, suspendable=False):
+        self.interpreter = interpreter
+        self.suspendable = suspendable
+        self.paused = None   # (code, pc, stack, fast, frames) of a suspended run
+        self.waiting = None  # ('ask', prompt), ('choice', options) or ('wait', seconds) while paused
+        self.goto_target = None  # Set by a goto inside a block or function, taken at TAKE_GOTO
+        interpreter.suspendable = suspendable
+
+    def run(self, code):
+        """Run a main program; a suspendable VM returns early if it pauses"""
+        self.interpreter.labels = dict(code.labels)
+        self.execute(code, 0, [], None, [])
+
+    def resume(self, value):
+        """Continue a paused run, with value as the result of the ask, choice or builtin"""
+        code, pc, stack, fast, frames = self.paused
+        self.paused = self.waiting = None
+        stack.append(value)
+        self.execute(code, pc, stack, fast, frames)
+
+    def execute(self, code, pc, stack, fast, frames):
+        interp = self.interpreter
+        builtins = interp.builtins
+        functions = interp.functions
+        say = interp.io.say
+
+        ops = code.ops
+        args = code.args
+        push = stack.append
+        pop = stack.pop
+        variables = interp.variables  # Globals; function bodies only use slots
+
+        # Opcodes are compared as literals: a global name lookup per test is
+        # measurably slower in this loop. Each failed test costs about as much
+        # as a simple instruction, so the opcodes are split into groups of
+        # eight, hottest first (see compiler.py), and no opcode is more than a
+        # dozen or so tests away. Keep them in sync with compiler.py.
+        while True:
+            op = ops[pc]
+            arg = args[pc]
+            pc += 1
+
+            if op < 8:
+                if op == 0:  # LOAD
+                    try:
+                        push(variables[arg])
+                    except KeyError:
+                        interp.runtime_error(f"Variable '{arg}' is not defined", code.nodes[pc - 1],
+                                             "Make sure the variable is declared with 'set' before using it")
+
+                elif op == 1:  # CONST
+                    push(arg)
+
+                elif op == 2:  # COMPARE_CONST_JUMP
+                    if not arg[0](pop(), arg[1]):
+                        pc = arg[2]
+
+                elif op == 3:  # UPDATE_CONST
+                    name, function, value = arg
+                    try:
+                        left = variables[name]
+                    except KeyError:
+                        interp.runtime_error(f"Variable '{name}' is not defined", code.nodes[pc - 1],
+                                             "Make sure the variable is declared with 'set' before using it")
+                    variables[name] = function(left, value)
+
+                elif op == 4:  # LOAD_BINARY_CONST
+                    name, function, value = arg
+                    try:
+                        left = variables[name]
+                    except KeyError:
+                        interp.runtime_error(f"Variable '{name}' is not defined", code.nodes[pc - 1],
+                                             "Make sure the variable is declared with 'set' before using it")
+                    push(function(left, value))
+
+                elif op == 5:  # JUMP
+                    pc = arg
+
+                elif op == 6:  # STORE
+                    variables[arg] = pop()
+
+                elif op == 7:  # BINARY_CONST
+                    function, value = arg
+                    stack[-1] = function(stack[-1], value)
+
+            elif op < 16:
+                if op == 8:  # ADD
+                    right = pop()
+                    left = stack[-1]
+                    # Smart addition: numbers add, strings concatenate
+                    if isinstance(left, (int, float)) and isinstance(right, (int, float)):
+                        stack[-1] = left + right
+                    else:
+                        stack[-1] = str(left) + str(right)
+
+                elif op == 9:  # LOAD_FAST
+                    value = fast[arg]
+                    if value is UNSET:
+                        interp.runtime_error(f"Variable '{code.slot_names[arg]}' is not defined", code.nodes[pc - 1],
+                                             "Make sure the variable is declared with 'set' before using it")
+                    push(value)
+
+                elif op == 10:  # STORE_FAST
+                    fast[arg] = pop()
+
+                elif op == 11:  # LOAD_FAST_BINARY_CONST
+                    slot, function, value = arg
+                    left = fast[slot]
+                    if left is UNSET:
+                        interp.runtime_error(f"Variable '{code.slot_names[slot]}' is not defined", code.nodes[pc - 1],
+                                             "Make sure the variable is declared with 'set' before using it")
+                    push(function(left, value))
+
+                elif op == 12:  # UPDATE_FAST_CONST
+                    slot, function, value = arg
+                    left = fast[slot]
+                    if left is UNSET:
+                        interp.runtime_error(f"Variable '{code.slot_names[slot]}' is not defined", code.nodes[pc - 1],
+                                             "Make sure the variable is declared with 'set' before using it")
+                    fast[slot] = function(left, value)
+
+                elif op == 13:  # FOR_RANGE
+                    item = next(stack[-1], _DONE)
+                    if item is _DONE:
+                        pop()
+                        pc = arg
+                    else:
+                        variables[args[pc]] = item  # Do the following STORE here
+                        pc += 1
+
+                elif op == 14:  # LOAD_INDEX
+                    index = pop()
+                    try:
+                        obj = variables[arg]
+                    except KeyError:
+                        interp.runtime_error(f"Variable '{arg}' is not defined", code.nodes[pc - 1],
+                                             "Make sure the variable is declared with 'set' before using it")
+                    if type(obj) is QuillRange:
+                        obj = obj.sequence()
+                    if isinstance(obj, (list, str, range)):
+                        try:
+                            push(obj[int(index)])
+                        except IndexError:
+                            interp.runtime_error(
+                                f"Index {index} out of range for {type_name(obj)} of length {len(obj)}",
+                                code.nodes[pc - 1], "Array/string indices must be within bounds (0 to length-1)")
+                    else:
+                        interp.runtime_error(f"Cannot index {type(obj).__name__}", code.nodes[pc - 1])
+
+                elif op == 15:  # STORE_NAME_INDEX
+                    name, journal = arg
+                    index = pop()
+                    value = pop()
+                    try:
+                        obj = variables[name]
+                    except KeyError:
+                        interp.runtime_error(f"Variable '{name}' is not defined", code.nodes[pc - 1],
+                                             "Make sure the variable is declared with 'set' before using it")
+                    if type(obj) is QuillRange:
+                        obj = obj.materialize()
+                    elif not isinstance(obj, list):
+                        raise RuntimeError(f"Cannot index assign to {type(obj).__name__}")
+                    if journal:
+                        interp.history.store_index(obj, int(index), value)
+                    else:
+                        obj[int(index)] = value
+
+            elif op < 24:
+                if op == 16:  # JUMP_IF_FALSE
+                    value = pop()
+                    if value is not True and not is_truthy(value):
+                        pc = arg
+
+                elif op == 17:  # COMPARE_JUMP
+                    right = pop()
+                    if not arg[0](pop(), right):
+                        pc = arg[1]
+
+                elif op == 18:  # FOR_RANGE_FAST
+                    item = next(stack[-1], _DONE)
+                    if item is _DONE:
+                        pop()
+                        pc = arg
+                    else:
+                        fast[args[pc]] = item  # Do the following STORE_FAST here
+                        pc += 1
+
+                elif op == 19:  # FOR_ITER
+                    item = next(stack[-1], _DONE)
+                    if item is _DONE:
+                        pop()
+                        pc = arg
+                    else:
+                        push(item)
+
+                elif op == 20:  # CALL
+                    name, argc = arg
+                    if argc:
+                        call_args = stack[-argc:]
+                        del stack[-argc:]
+                    else:
+                        call_args = []
+
+                    # Check built-in functions first
+                    builtin = builtins.get(name)
+                    if builtin is not None:
+                        try:
+                            push(builtin(*call_args))
+                        except Suspend as suspend:
+                            self.waiting = suspend.request
+                            self.paused = (code, pc, stack, fast, frames)
+                            return
+                        except Exception as e:
+                            raise RuntimeError(f"Error calling built-in function '{name}': {e}")
+                        continue
+
+                    func = functions.get(name)
+                    if func is None:
+                        raise RuntimeError(f"Function '{name}' is not defined")
+                    if argc != len(func.parameters):
+                        raise RuntimeError(f"Function '{name}' expects {len(func.parameters)} arguments, got {argc}")
+                    if len(frames) >= self.max_depth:
+                        raise RecursionError(f"Maximum recursion depth exceeded in function '{name}'")
+
+                    # Arguments fill the first slots, captured values the rest
+                    frames.append(Frame(code, pc, stack, fast))
+                    code = func.code
+                    closure = func.closure
+                    call_args.extend([closure.get(name, UNSET) for name in code.captures])
+                    fast = call_args
+                    ops = code.ops
+                    args = code.args
+                    pc = 0
+                    stack = []
+                    push = stack.append
+                    pop = stack.pop
+
+                elif op == 21:  # RETURN
+                    value = pop()
+                    if not frames:
+                        raise RuntimeError("'return' can only be used inside a function")
+                    frame = frames.pop()
+                    code = frame.code
+                    ops = code.ops
+                    args = code.args
+                    pc = frame.pc
+                    stack = frame.stack
+                    push = stack.append
+                    pop = stack.pop
+                    fast = frame.fast
+                    push(value)
+
+                elif op == 22:  # POP
+                    pop()
+
+                elif op == 23:  # SAY
+                    say(str(pop()))
+
+            elif op < 32:
+                if op == 24:  # LOAD_FAST_INDEX
+                    index = pop()
+                    obj = fast[arg]
+                    if obj is UNSET:
+                        interp.runtime_error(f"Variable '{code.slot_names[arg]}' is not defined", code.nodes[pc - 1],
+                                             "Make sure the variable is declared with 'set' before using it")
+                    if type(obj) is QuillRange:
+                        obj = obj.sequence()
+                    if isinstance(obj, (list, str, range)):
+                        try:
+                            push(obj[int(index)])
+                        except IndexError:
+                            interp.runtime_error(
+                                f"Index {index} out of range for {type_name(obj)} of length {len(obj)}",
+                                code.nodes[pc - 1], "Array/string indices must be within bounds (0 to length-1)")
+                    else:
+                        interp.runtime_error(f"Cannot index {type(obj).__name__}", code.nodes[pc - 1])
+
+                elif op == 25:  # STORE_FAST_INDEX
+                    slot, journal = arg
+                    index = pop()
+                    value = pop()
+                    obj = fast[slot]
+                    if obj is UNSET:
+                        interp.runtime_error(f"Variable '{code.slot_names[slot]}' is not defined", code.nodes[pc - 1],
+                                             "Make sure the variable is declared with 'set' before using it")
+                    if type(obj) is QuillRange:
+                        obj = obj.materialize()
+                    elif not isinstance(obj, list):
+                        raise RuntimeError(f"Cannot index assign to {type(obj).__name__}")
+                    if journal:
+                        interp.history.store_index(obj, int(index), value)
+                    else:
+                        obj[int(index)] = value
+
+                elif op == 26:  # INDEX
+                    index = pop()
+                    obj = pop()
+                    if type(obj) is QuillRange:
+                        obj = obj.sequence()
+                    if isinstance(obj, (list, str, range)):
+                        try:
+                            push(obj[int(index)])
+                        except IndexError:
+                            interp.runtime_error(
+                                f"Index {index} out of range for {type_name(obj)} of length {len(obj)}",
+                                code.nodes[pc - 1], "Array/string indices must be within bounds (0 to length-1)")
+                    else:
+                        interp.runtime_error(f"Cannot index {type(obj).__name__}", code.nodes[pc - 1])
+
+                elif op == 27:  # STORE_INDEX
+                    index = pop()
+                    obj = pop()
+                    value = pop()
+                    if type(obj) is QuillRange:
+                        obj = obj.materialize()
+                    elif not isinstance(obj, list):
+                        raise RuntimeError(f"Cannot index assign to {type(obj).__name__}")
+                    if arg:
+                        interp.history.store_index(obj, int(index), value)
+                    else:
+                        obj[int(index)] = value
+
+                elif op == 28:  # SUB
+                    right = pop()
+                    stack[-1] = stack[-1] - right
+
+                elif op == 29:  # MUL
+                    right = pop()
+                    stack[-1] = stack[-1] * right
+
+                elif op == 30:  # DIV
+                    right = pop()
+                    if right == 0:
+                        interp.runtime_error("Division by zero", code.nodes[pc - 1],
+                                             "Check that the divisor is not zero before dividing")
+                    stack[-1] = stack[-1] / right
+
+                elif op == 31:  # MOD
+                    right = pop()
+                    stack[-1] = stack[-1] % right
+
+            elif op < 40:
+                if op == 32:  # GOTO
+                    pc = arg  # Only emitted between top-level statements, where the stack is empty
+
+                elif op == 33:  # TAKE_GOTO
+                    if self.goto_target is not None:
+                        pc = self.goto_target
+                        self.goto_target = None
+
+                elif op == 34:  # DEFER_GOTO
+                    self.goto_target = arg
+
+                elif op == 35:  # BUILD_LIST
+                    if arg:
+                        items = stack[-arg:]
+                        del stack[-arg:]
+                    else:
+                        items = []
+                    push(items)
+
+                elif op == 36:  # GET_ITER
+                    iterable = stack[-1]
+                    if not hasattr(iterable, '__iter__'):
+                        raise RuntimeError(f"Cannot iterate over {type(iterable).__name__}")
+                    stack[-1] = iter(iterable)
+
+                elif op == 37:  # NOT
+                    stack[-1] = not is_truthy(stack[-1])
+
+                elif op == 38:  # NEG
+                    stack[-1] = -stack[-1]
+
+                elif op == 39:  # AND
+                    right = pop()
+                    stack[-1] = is_truthy(stack[-1]) and is_truthy(right)
+
+            elif op < 48:
+                if op == 40:  # OR
+                    right = pop()
+                    stack[-1] = is_truthy(stack[-1]) or is_truthy(right)
+
+                elif op == 41:  # POW
+                    right = pop()
+                    stack[-1] = stack[-1] ** right
+
+                elif op == 42:  # EQ
+                    right = pop()
+                    stack[-1] = stack[-1] == right
+
+                elif op == 43:  # NE
+                    right = pop()
+                    stack[-1] = stack[-1] != right
+
+                elif op == 44:  # GT
+                    right = pop()
+                    stack[-1] = stack[-1] > right
+
+                elif op == 45:  # LT
+                    right = pop()
+                    stack[-1] = stack[-1] < right
+
+                elif op == 46:  # GE
+                    right = pop()
+                    stack[-1] = stack[-1] >= right
+
+                elif op == 47:  # LE
+                    right = pop()
+                    stack[-1] = stack[-1] <= right
+
+            elif op < 56:
+                if op == 48:  # MAKE_FUNCTION
+                    node, function_code, captures = arg
+                    # Capture only the names the function body uses, by value
+                    if fast is None:
+                        closure = {name: variables[name] for name, _ in captures if name in variables}
+                    else:
+                        closure = {name: fast[slot] for name, slot in captures if fast[slot] is not UNSET}
+                    functions[node.name] = Function(node.name, node.parameters, node.body,
+                                                    closure, function_code)
+
+                elif op == 49:  # ASK
+                    if self.suspendable:
+                        self.waiting = ('ask', pop())
+                        self.paused = (code, pc, stack, fast, frames)
+                        return
+                    push(interp._ask(pop(), code.nodes[pc - 1]))
+
+                elif op == 50:  # CHOICE
+                    options = stack[-arg:]
+                    del stack[-arg:]
+                    if self.suspendable:
+                        self.waiting = ('choice', options)
+                        self.paused = (code, pc, stack, fast, frames)
+                        return
+                    push(interp._choose(options, code.nodes[pc - 1]))
+
+                elif op == 51:  # SAVE_POINT
+                    interp.history.save_point(arg)
+
+                elif op == 52:  # IMPORT
+                    interp._import(arg)
+
+                elif op == 53:  # EXEC_NODE
+                    interp.execute(arg)
+
+                elif op == 54:  # RAISE
+                    raise RuntimeError(arg)
+
+                elif op == 55:  # HALT
+                    break
+
+            else:
+                if op == 56:  # COUNT
+                    stats = interp.stats
+                    setattr(stats, arg, getattr(stats, arg) + 1)
+
+
+_DONE = object()
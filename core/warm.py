@@ -0,0 +1,24 @@
+"""
+Warm-up for Quill
+Loads everything a run needs ahead of time, for the warm server and batch workers
+"""
+
+
+def warm_up():
+    """Import everything a run needs and build the stdlib tables once
+
+    Processes that run many scripts (server.py, batch.py) call this before
+    the first one, so every run starts with all modules loaded and the
+    compiled regexes, operator tables and stdlib already built. It only
+    imports, so it works on every platform.
+    """
+    import quill  # Lexer, parser, cache, optimizer, interpreter
+    import compiler
+    import resolver
+    import vm
+    import closure_compiler
+    import modules.io_module
+    import modules.game_module
+    from interpreter import Interpreter
+
+    Interpreter('')